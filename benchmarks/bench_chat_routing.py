@@ -0,0 +1,150 @@
+"""Routing check for chat_router across several fake chat backends.
+
+Usage:
+    python3 benchmarks/bench_chat_routing.py [--requests N] [--threads N]
+
+Three fake OpenAI-compatible servers (benchmarks/fake_openai_server.py,
+each in its own process) play the backends: "fast" answers in 50ms, "slow"
+in 400ms and "flaky" in 50ms but fails every request. Chat completions are
+sent through chat_handler.request_chat_completion in three phases:
+
+1. flaky failing: it should be ejected or starved of requests, and fast
+   should get more traffic than slow;
+2. flaky healed: after the open period a probe should re-admit it;
+3. fast slowed down to 800ms: its share should shrink.
+
+Shares, errors and latency percentiles are printed per phase. Exits
+non-zero if a phase does not behave as described.
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests  # noqa: E402
+
+import config  # noqa: E402
+from fake_openai_server import serve  # noqa: E402
+
+BACKENDS = [("fast", 0.05, 0.0), ("slow", 0.4, 0.0), ("flaky", 0.05, 1.0)]
+
+
+def start_backends(base_port):
+    processes = []
+    for i, (name, ttft, error_rate) in enumerate(BACKENDS):
+        ready = multiprocessing.Event()
+        process = multiprocessing.Process(target=serve, args=(base_port + i, ttft, error_rate, name, ready),
+                                          daemon=True)
+        process.start()
+        ready.wait(10)
+        processes.append(process)
+    return processes
+
+
+def control(base_port, name, **settings):
+    port = base_port + [b[0] for b in BACKENDS].index(name)
+    requests.post(f"http://127.0.0.1:{port}/control", json=settings, timeout=5)
+
+
+def run_phase(label, count, threads):
+    import chat_handler
+    from chat_router import chat_router
+
+    served = Counter()
+    attempts = Counter()
+    lock = threading.Lock()
+    latencies = []
+    errors = Counter()
+    original = chat_router.record
+
+    def record(backend, probe, ok, ttft=None):
+        with lock:
+            attempts[backend.name] += 1
+            served[backend.name] += ok
+        original(backend, probe, ok, ttft)
+
+    def one(_):
+        t0 = time.perf_counter()
+        try:
+            chat_handler.request_chat_completion([{"role": "user", "content": "hi"}], hedge=False)
+            with lock:
+                latencies.append(time.perf_counter() - t0)
+        except Exception as e:
+            with lock:
+                errors[type(e).__name__] += 1
+
+    chat_router.record = record
+    try:
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(one, range(count)))
+    finally:
+        chat_router.record = original
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] if latencies else 0
+    p95 = latencies[int(len(latencies) * 0.95)] if latencies else 0
+    total = sum(served.values()) or 1
+    shares = {name: served[name] / total for name, _, _ in BACKENDS}
+    print(f"{label:<16} " + " ".join(f"{name}={share:4.0%}" for name, share in shares.items())
+          + f" | errors={dict(errors)} p50={p50 * 1000:6.1f}ms p95={p95 * 1000:6.1f}ms")
+    for name, r in chat_router.stats().items():
+        print(f"    {name:<6} state={r['state']:<9} ttft={r['ttft'] or 0:5.3f}s errors={r['error_rate']:4.0%}")
+    stats = chat_router.stats()
+    for name in stats:
+        stats[name]["attempt_share"] = attempts[name] / (sum(attempts.values()) or 1)
+    return shares, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--port", type=int, default=18800)
+    args = parser.parse_args()
+
+    processes = start_backends(args.port)
+    # Point the router at the fake backends before chat_router is imported
+    config.CHAT_BACKENDS = [
+        {"name": name, "base_url": f"http://127.0.0.1:{args.port + i}/v1", "api_key": "sk-fake",
+         "model": f"fake-{name}", "weight": 1.0}
+        for i, (name, _, _) in enumerate(BACKENDS)]
+    config.CIRCUIT_OPEN_SECONDS = 2
+    config.UPSTREAM_CONCURRENCY = dict(config.UPSTREAM_CONCURRENCY, chat=args.threads)
+
+    failed = False
+    try:
+        shares, stats = run_phase("flaky failing", args.requests, args.threads)
+        if stats["flaky"]["state"] == "closed" and stats["flaky"]["attempt_share"] > 0.05:
+            print("FAIL: the failing backend was neither ejected nor starved")
+            failed = True
+        if shares["fast"] <= shares["slow"]:
+            print("FAIL: the slow backend got as much traffic as the fast one")
+            failed = True
+
+        control(args.port, "flaky", error_rate=0.0)
+        time.sleep(config.CIRCUIT_OPEN_SECONDS + 0.5)
+        shares, stats = run_phase("flaky healed", args.requests, args.threads)
+        if stats["flaky"]["state"] != "closed" or shares["flaky"] == 0:
+            print("FAIL: the healed backend was not re-admitted")
+            failed = True
+
+        before = shares["fast"]
+        control(args.port, "fast", ttft=0.8)
+        shares, stats = run_phase("fast slowed", args.requests, args.threads)
+        if shares["fast"] >= before:
+            print("FAIL: the slowed backend kept its share")
+            failed = True
+    finally:
+        for process in processes:
+            process.terminate()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Peak-memory benchmark for streamed media downloads.
+
+Usage:
+    python3 benchmarks/bench_downloads.py [--image-mb N] [--junk-mb N]
+
+A local server (in a separate process) serves a PNG, an MP3, and a large
+HTML error page sent in place of media. Each body is read the old way,
+``resp.content`` plus a length/Content-Type check, and through
+downloads.read_response. tracemalloc reports the peak Python allocation of
+both. Exits non-zero if media is rejected, the junk body is accepted, or the
+streamed path peaks above the old one.
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests  # noqa: E402
+
+import config  # noqa: E402
+from downloads import AUDIO_KINDS, IMAGE_KINDS, DownloadRejected, read_response  # noqa: E402
+
+
+def make_bodies(image_mb, junk_mb):
+    size = image_mb * 1024 * 1024
+    png = b"\x89PNG\r\n\x1a\n" + os.urandom(1024) * (size // 1024)
+    mp3 = b"ID3\x04\x00\x00\x00\x00\x00\x00" + os.urandom(1024) * (size // 2048)
+    junk = b"<html><body>" + b"upstream error " * (junk_mb * 1024 * 1024 // 15)
+    return {"/image.png": ("image/png", png), "/voice.mp3": ("audio/mpeg", mp3),
+            "/junk": ("application/octet-stream", junk)}
+
+
+def serve(port, image_mb, junk_mb, ready):
+    bodies = make_bodies(image_mb, junk_mb)
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            ctype, body = bodies[self.path]
+            self.send_response(200)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            view = memoryview(body)
+            try:
+                for pos in range(0, len(body), 256 * 1024):
+                    self.wfile.write(view[pos:pos + 256 * 1024])
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    ready.set()
+    server.serve_forever()
+
+
+def legacy_read(url):
+    resp = requests.get(url, timeout=30)
+    ctype = resp.headers.get("Content-Type", "").lower()
+    if resp.status_code == 200 and (ctype.startswith(("image/", "audio/")) or len(resp.content) > 1000):
+        return resp.content
+    return None
+
+
+def streamed_read(url, kinds, max_bytes):
+    resp = requests.get(url, timeout=30, stream=True)
+    try:
+        return read_response(resp, kinds, max_bytes)[1]
+    except DownloadRejected:
+        return None
+
+
+def measure(fn, *args):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - t0
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    ok = result is not None
+    del result
+    return ok, peak, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--image-mb", type=int, default=8)
+    parser.add_argument("--junk-mb", type=int, default=64)
+    parser.add_argument("--port", type=int, default=18765)
+    args = parser.parse_args()
+
+    ready = multiprocessing.Event()
+    server = multiprocessing.Process(target=serve, args=(args.port, args.image_mb, args.junk_mb, ready),
+                                     daemon=True)
+    server.start()
+    ready.wait(10)
+    base = f"http://127.0.0.1:{args.port}"
+
+    cases = [
+        ("png", "/image.png", IMAGE_KINDS, config.DOWNLOAD_MAX_IMAGE_BYTES, True),
+        ("mp3", "/voice.mp3", AUDIO_KINDS, config.DOWNLOAD_MAX_AUDIO_BYTES, True),
+        ("junk as image", "/junk", IMAGE_KINDS, config.DOWNLOAD_MAX_IMAGE_BYTES, False),
+    ]
+    failed = False
+    try:
+        for name, path, kinds, max_bytes, expect_ok in cases:
+            old_ok, old_peak, old_time = measure(legacy_read, base + path)
+            new_ok, new_peak, new_time = measure(streamed_read, base + path, kinds, max_bytes)
+            print(f"{name:<14} legacy: peak={old_peak / 1048576:7.1f}MB accepted={old_ok!s:<5} {old_time * 1000:7.1f}ms | "
+                  f"streamed: peak={new_peak / 1048576:7.1f}MB accepted={new_ok!s:<5} {new_time * 1000:7.1f}ms")
+            if new_ok != expect_ok:
+                print(f"FAIL: {name} was {'accepted' if new_ok else 'rejected'}")
+                failed = True
+            if new_peak > old_peak:
+                print(f"FAIL: {name} streamed peak is above the legacy peak")
+                failed = True
+    finally:
+        server.terminate()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""Peak-memory check for the /edit upload path.
+
+Usage:
+    python3 benchmarks/bench_edit_upload.py [--photo-mb N] [--max-copies X]
+
+A local server (in a separate process) plays both Telegram's file server
+and the edit API. The API decodes the uploaded photo, checks it byte for
+byte, and answers with the URL of a small result image. The old path
+(download_file, b64encode, f-string data URI, json=payload) and
+image_handler.edit_image with a streamed TelegramFileSource are timed under
+tracemalloc, in JSON and multipart mode. Exits non-zero if an upload is
+corrupted or the streamed path peaks above --max-copies copies of the photo.
+"""
+import argparse
+import base64
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests  # noqa: E402
+
+import config  # noqa: E402
+import image_handler  # noqa: E402
+import uploads  # noqa: E402
+
+RESULT_PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 4096
+
+
+def make_photo(photo_mb):
+    return b"\xff\xd8\xff\xe0" + os.urandom(photo_mb * 1024 * 1024)
+
+
+def serve(port, photo_mb, ready):
+    photo = make_photo(photo_mb)
+    expected = hashlib.sha256(photo).hexdigest()
+    base = f"http://127.0.0.1:{port}"
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send(self, status, ctype, body):
+            self.send_response(status)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/result.png":
+                self._send(200, "image/png", RESULT_PNG)
+            elif self.path == "/photo-hash":
+                self._send(200, "text/plain", expected.encode())
+            else:
+                self._send(200, "image/jpeg", photo)
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers["Content-Length"]))
+            ctype = self.headers.get("Content-Type", "")
+            if ctype.startswith("multipart/form-data"):
+                boundary = ctype.split("boundary=")[1].encode()
+                part = [p for p in body.split(b"--" + boundary) if b'name="image"' in p][0]
+                uploaded = part.split(b"\r\n\r\n", 1)[1][:-2]
+            else:
+                uri = json.loads(body)["image"]
+                uploaded = base64.b64decode(uri.split(",", 1)[1])
+            if hashlib.sha256(uploaded).hexdigest() != expected:
+                self._send(400, "application/json", b'{"error": "corrupted upload"}')
+                return
+            self._send(200, "application/json", json.dumps({"data": [{"url": base + "/result.png"}]}).encode())
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    ready.set()
+    server.serve_forever()
+
+
+def legacy_edit(file_url):
+    image_data = requests.get(file_url, timeout=60).content
+    image_b64 = base64.b64encode(image_data).decode("utf-8")
+    payload = {
+        "model": config.EDIT_MODEL,
+        "prompt": "make it blue",
+        "image": f"data:image/jpeg;base64,{image_b64}",
+        "response_format": "url",
+        "size": image_handler.IMAGE_SIZE,
+    }
+    resp = requests.post(config.IMAGE_API_URL, json=payload, timeout=120, stream=True)
+    return image_handler.read_image_response(resp, "edited image")
+
+
+def measure(fn, *args):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - t0
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result is not None, peak, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--photo-mb", type=int, default=5)
+    parser.add_argument("--max-copies", type=float, default=1.5)
+    parser.add_argument("--port", type=int, default=18766)
+    args = parser.parse_args()
+
+    ready = multiprocessing.Event()
+    server = multiprocessing.Process(target=serve, args=(args.port, args.photo_mb, ready), daemon=True)
+    server.start()
+    ready.wait(10)
+    base = f"http://127.0.0.1:{args.port}"
+    file_url = base + "/file/photos/file_1.jpg"
+    photo_bytes = args.photo_mb * 1024 * 1024
+
+    # Point the edit path at the local server
+    config.IMAGE_API_URL = base + "/edit"
+    config.EDIT_MULTIPART_URL = base + "/edit"
+    uploads.TelegramFileSource.url = property(lambda self: file_url)
+
+    failed = False
+    try:
+        ok, peak, elapsed = measure(legacy_edit, file_url)
+        print(f"legacy            peak={peak / 1048576:6.1f}MB ({peak / photo_bytes:4.1f} copies) "
+              f"{elapsed * 1000:7.1f}ms ok={ok}")
+        for mode in ("json", "multipart"):
+            config.EDIT_UPLOAD_MODE = mode
+            source = uploads.TelegramFileSource("photos/file_1.jpg")
+            ok, peak, elapsed = measure(image_handler.edit_image, source, "make it blue")
+            copies = peak / photo_bytes
+            print(f"streamed {mode:<9} peak={peak / 1048576:6.1f}MB ({copies:4.1f} copies) "
+                  f"{elapsed * 1000:7.1f}ms ok={ok}")
+            if not ok:
+                print(f"FAIL: {mode} upload was rejected or corrupted")
+                failed = True
+            if copies > args.max_copies:
+                print(f"FAIL: {mode} peak above {args.max_copies} copies of the photo")
+                failed = True
+    finally:
+        server.terminate()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
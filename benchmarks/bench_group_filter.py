@@ -0,0 +1,91 @@
+"""Throughput benchmark for the group message prefilter.
+
+Usage:
+    python3 benchmarks/bench_group_filter.py [--messages N] [--min-rate MSGS_PER_SEC]
+
+Feeds group traffic that does not mention the bot through utils.group_prefilter
+and reports messages per second. The old path is timed too; it is shown
+without its per-message bot.get_me() round-trip, which alone cost a Bot API
+call per message. Exits non-zero if any message is misclassified or the rate
+drops below --min-rate.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+import utils  # noqa: E402
+
+BOT_ID = 1000
+WORDS = ["hello", "anyone", "here", "what", "is", "the", "plan", "for", "tonight", "lol",
+         "bro", "send", "notes", "exam", "tomorrow", "ok", "👍", "नमस्ते", "kal", "milte",
+         "brahmaputra", "bramble", "https://example.com/x", "@someone"]
+# Words that contain a bot name without mentioning it, injected into ~1% of messages
+NEAR_MISSES = ["abrahmoss", "brahmosai", "@brahmosfan", "bramos"]
+
+
+def make_messages(count, seed=7):
+    rng = random.Random(seed)
+    messages = []
+    for i in range(count):
+        text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 30)))
+        if rng.random() < 0.01:
+            text += " " + rng.choice(NEAR_MISSES)
+        reply = None
+        if i % 10 == 0:
+            reply = SimpleNamespace(from_user=SimpleNamespace(id=rng.randint(1, 999)))
+        messages.append(SimpleNamespace(
+            text=text,
+            from_user=SimpleNamespace(id=rng.randint(1, 100000)),
+            reply_to_message=reply,
+        ))
+    return messages
+
+
+def legacy_filter(message, bot_id):
+    if message.reply_to_message and message.reply_to_message.from_user.id == bot_id:
+        return True
+    text_lower = message.text.lower()
+    return any(name.lower() in text_lower for name in config.BOT_NAMES)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=200000)
+    parser.add_argument("--min-rate", type=float, default=100000.0)
+    args = parser.parse_args()
+
+    messages = make_messages(args.messages)
+    waiting = (set(range(200000, 200100)), set(), {})
+
+    t0 = time.perf_counter()
+    accepted = sum(1 for m in messages if utils.group_prefilter(m, BOT_ID, waiting))
+    new_elapsed = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    for m in messages:
+        legacy_filter(m, BOT_ID)
+    old_elapsed = time.perf_counter() - t0
+
+    new_rate = len(messages) / new_elapsed
+    old_rate = len(messages) / old_elapsed
+    print(f"prefilter: {new_rate:,.0f} msgs/s ({new_elapsed / len(messages) * 1e6:.2f}us/msg)")
+    print(f"legacy (without get_me): {old_rate:,.0f} msgs/s ({old_elapsed / len(messages) * 1e6:.2f}us/msg)")
+
+    failed = False
+    if accepted:
+        print(f"FAIL: {accepted} non-mention messages were accepted")
+        failed = True
+    if new_rate < args.min_rate:
+        print(f"FAIL: prefilter rate below {args.min_rate:,.0f} msgs/s")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""Benchmark and regression check for the incremental SSE parser.
+
+Usage:
+    python3 benchmarks/bench_sse.py [--events N] [--max-us-per-token US]
+                                    [--recording stream.sse ...] [--no-orjson]
+
+Built-in streams are generated with 10k+ events in the byte layout the chat
+proxy produces (role chunk, keep-alive comments, CRLF/LF, concatenated and
+array payloads) and cut at random network boundaries, including inside
+multi-byte characters. Raw captures such as ``curl -N ... > stream.sse`` can
+be added with --recording.
+
+Both parsers are timed through a requests.Response, the way the chat handler
+reads the stream. Every stream is also cut at random boundaries and checked
+against the previous line-based parser; the script exits non-zero if the
+outputs differ or parse cost per token exceeds the limit.
+"""
+import argparse
+import io
+import json
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests  # noqa: E402
+
+import sse_parser  # noqa: E402
+
+TOKENS = ["Hello", " world", ",", " this", " is", " BrahMos", " नमस्ते", " café",
+          " 🚀", " streaming", " **bold**", " `code`", "\n", " token", " test", "."]
+
+
+def _chunk(stream_id, created, delta):
+    return {
+        "id": stream_id,
+        "object": "chat.completion.chunk",
+        "created": created,
+        "model": "stream/gpt-5",
+        "choices": [{"index": 0, "delta": delta, "finish_reason": None}],
+    }
+
+
+def openai_stream(events, seed=1):
+    """OpenAI-style stream: one JSON object per data line"""
+    rng = random.Random(seed)
+    lines = [": keep-alive", "data: " + json.dumps(_chunk("c-1", 1700000000, {"role": "assistant"}))]
+    for i in range(events):
+        if i and i % 500 == 0:
+            lines.append(": keep-alive")
+        token = rng.choice(TOKENS)
+        lines.append("data: " + json.dumps(_chunk("c-1", 1700000000, {"content": token}), ensure_ascii=False))
+        lines.append("")
+    lines.append("data: [DONE]")
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def proxy_stream(events, seed=2):
+    """Proxy-style stream: CRLF, glued objects, bare choice arrays, message fallbacks"""
+    rng = random.Random(seed)
+    lines = []
+    i = 0
+    while i < events:
+        kind = rng.random()
+        if kind < 0.2:
+            a = json.dumps({"choices": [{"delta": {"content": rng.choice(TOKENS)}}]}, ensure_ascii=False)
+            b = json.dumps({"choices": [{"delta": {"content": rng.choice(TOKENS)}}]}, ensure_ascii=False)
+            lines.append(f"data: {a}{b}")
+            i += 2
+        elif kind < 0.3:
+            arr = json.dumps([{"delta": {"content": rng.choice(TOKENS)}}], ensure_ascii=False)
+            lines.append(f"data: {arr}")
+            i += 1
+        elif kind < 0.35:
+            msg = json.dumps({"choices": [{"message": {"content": rng.choice(TOKENS)}}]}, ensure_ascii=False)
+            lines.append(f"data:{msg}")
+            i += 1
+        else:
+            lines.append("data: " + json.dumps({"choices": [{"delta": {"content": rng.choice(TOKENS)}}]},
+                                               ensure_ascii=False))
+            i += 1
+        lines.append("")
+    lines.append("data: [DONE]")
+    return ("\r\n".join(lines) + "\r\n").encode("utf-8")
+
+
+def network_chunks(raw, seed=3, max_size=1500):
+    """Cut a byte stream at random boundaries, like TCP reads would"""
+    rng = random.Random(seed)
+    chunks = []
+    pos = 0
+    while pos < len(raw):
+        size = rng.randint(1, max_size)
+        chunks.append(raw[pos:pos + size])
+        pos += size
+    return chunks
+
+
+def make_response(raw):
+    """A requests.Response reading from memory, as the chat handler sees it"""
+    resp = requests.Response()
+    resp.raw = io.BytesIO(raw)
+    resp.encoding = "utf-8"
+    resp.status_code = 200
+    return resp
+
+
+def legacy_parse(response):
+    """The line-based parser this module replaced, kept as a reference"""
+    out_parts = []
+
+    def append(obj):
+        try:
+            choices = obj.get("choices", [])
+        except AttributeError:
+            choices = obj if isinstance(obj, list) else []
+        for choice in choices:
+            if not isinstance(choice, dict):
+                continue
+            delta = choice.get("delta") or {}
+            if isinstance(delta, dict) and isinstance(delta.get("content"), str):
+                out_parts.append(delta["content"])
+            message = choice.get("message") or {}
+            if isinstance(message, dict) and isinstance(message.get("content"), str):
+                out_parts.append(message["content"])
+
+    for raw_line in response.iter_lines(decode_unicode=True):
+        if not raw_line or raw_line.startswith(":") or not raw_line.startswith("data:"):
+            continue
+        data = raw_line[5:].lstrip()
+        if not data or data == "[DONE]":
+            continue
+        pieces = re.split(r'(?<=\})(?=\{)', data) if "}{" in data else [data]
+        for p in pieces:
+            p = p.strip()
+            if not p:
+                continue
+            try:
+                obj = json.loads(p)
+            except json.JSONDecodeError:
+                out_parts.append(p)
+                continue
+            append(obj)
+    return out_parts
+
+
+def new_parse(response):
+    return list(sse_parser.iter_sse_deltas(response.iter_content(chunk_size=512)))
+
+
+def bench(name, raw, repeat):
+    # Correctness across arbitrary network boundaries, including split characters
+    chunks = network_chunks(raw)
+    tokens = list(sse_parser.iter_sse_deltas(chunks))
+    ok = tokens == legacy_parse(make_response(raw))
+
+    best_new = best_old = float("inf")
+    for _ in range(repeat):
+        resp = make_response(raw)
+        t0 = time.perf_counter()
+        new_parse(resp)
+        best_new = min(best_new, time.perf_counter() - t0)
+
+        resp = make_response(raw)
+        t0 = time.perf_counter()
+        legacy_parse(resp)
+        best_old = min(best_old, time.perf_counter() - t0)
+
+    count = max(1, len(tokens))
+    new_us = best_new / count * 1e6
+    old_us = best_old / count * 1e6
+    print(f"{name:<14} bytes={len(raw):>9} tokens={len(tokens):>6} "
+          f"new={new_us:6.2f}us/token legacy={old_us:6.2f}us/token "
+          f"speedup={old_us / new_us if new_us else 0:4.1f}x {'OK' if ok else 'MISMATCH'}")
+    return ok, new_us
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=12000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--max-us-per-token", type=float, default=10.0)
+    parser.add_argument("--recording", action="append", default=[])
+    parser.add_argument("--no-orjson", action="store_true", help="force the stdlib json path")
+    args = parser.parse_args()
+
+    if args.no_orjson:
+        sse_parser._json_loads = json.loads
+    print(f"JSON backend: {'json' if sse_parser._json_loads is json.loads else 'orjson'}")
+
+    streams = [("openai", openai_stream(args.events)), ("proxy", proxy_stream(args.events))]
+    for path in args.recording:
+        with open(path, "rb") as f:
+            streams.append((os.path.basename(path), f.read()))
+
+    failed = False
+    for name, raw in streams:
+        ok, us_per_token = bench(name, raw, args.repeat)
+        if not ok:
+            print(f"FAIL: {name} output differs from the reference parser")
+            failed = True
+        if us_per_token > args.max_us_per_token:
+            print(f"FAIL: {name} parse cost {us_per_token:.2f}us/token exceeds {args.max_us_per_token}us")
+            failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Fake OpenAI-compatible chat server for local testing.
+
+Usage:
+    python3 benchmarks/fake_openai_server.py [--port N] [--ttft S] [--error-rate X]
+
+Serves POST /v1/chat/completions, streaming SSE deltas when the request
+asks for ``"stream": true`` and a JSON completion otherwise. Every answer
+waits ``--ttft`` seconds before its first byte, and ``--error-rate`` of the
+requests fail with HTTP 500. POST /control with a JSON body such as
+``{"ttft": 0.5, "error_rate": 1.0}`` changes both while it runs, to
+simulate slowdowns and outages.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = ["Namaste", " from", " the", " fake", " backend", "!"]
+
+
+def serve(port, ttft=0.05, error_rate=0.0, name="fake", ready=None):
+    settings = {"ttft": ttft, "error_rate": error_rate}
+    lock = threading.Lock()
+    counters = {"requests": 0, "errors": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.0"
+
+        def _json(self, status, data):
+            body = json.dumps(data).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+            if self.path == "/control":
+                with lock:
+                    settings.update({k: float(v) for k, v in request.items() if k in settings})
+                    self._json(200, dict(settings, **counters))
+                return
+            if not self.path.endswith("/chat/completions"):
+                self._json(404, {"error": {"message": "not found"}})
+                return
+
+            with lock:
+                delay, failing = settings["ttft"], random.random() < settings["error_rate"]
+                counters["requests"] += 1
+                counters["errors"] += failing
+            time.sleep(delay)
+            if failing:
+                self._json(500, {"error": {"message": f"{name} is failing"}})
+                return
+
+            model = request.get("model", "fake")
+            if not request.get("stream"):
+                self._json(200, {"model": model, "choices": [
+                    {"index": 0, "message": {"role": "assistant", "content": "".join(WORDS)}}]})
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            try:
+                for word in WORDS:
+                    chunk = {"model": model, "choices": [{"index": 0, "delta": {"content": word}}]}
+                    self.wfile.write(b"data: " + json.dumps(chunk).encode() + b"\n\n")
+                    self.wfile.flush()
+                self.wfile.write(b"data: [DONE]\n\n")
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    if ready is not None:
+        ready.set()
+    server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=18800)
+    parser.add_argument("--ttft", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    print(f"Fake chat API on http://127.0.0.1:{args.port}/v1")
+    serve(args.port, args.ttft, args.error_rate)
+
+
+if __name__ == "__main__":
+    main()
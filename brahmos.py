@@ -1,11 +1,24 @@
 import telebot
 from telebot import types, apihelper
 import time
+import sys
+import signal
 import config
-import requests
-import threading
+from http_client import upstream
+from outbound import OutboundBot, create_dispatcher
+from chat_router import chat_router
+from circuit_breaker import breakers
+from context_builder import context_stats
+from conversation_store import conversation_store
+from executor import executor, runs_in
+from hedging import chat_hedger
+from media_cache import image_cache, prompt_cache, static_media, tts_cache
+from photo_ingest import ingest_stats
+from scheduler import upstream_scheduler
+from singleflight import single_flight
+from storage import get_storage
 from utils import *
-from chat_handler import handle_chat_message, handle_prompt_command, get_ai_response
+from chat_handler import handle_chat_message, handle_prompt_command, get_ai_response, StreamingReply
 from image_handler import handle_image_command, handle_image_input, handle_edit_command, handle_edit_photo
 from tts_handler import handle_say_command, handle_tts_input
 from callback_handler import *
@@ -13,8 +26,12 @@ from callback_handler import *
 # Enable middleware for encoding fixes
 apihelper.ENABLE_MIDDLEWARE = True
 
-# Initialize bot
-bot = telebot.TeleBot(config.BOT_TOKEN, parse_mode="Markdown")
+# Initialize bot; every outgoing call goes through the rate-limited dispatcher
+outbound_dispatcher = create_dispatcher()
+# Handlers only route updates (threaded=False keeps them in arrival order);
+# the work runs on the executor's per-workload pools
+bot = OutboundBot(telebot.TeleBot(config.BOT_TOKEN, parse_mode="Markdown", threaded=False),
+                  outbound_dispatcher)
 
 # Global state tracking
 chat_mode = set()
@@ -22,15 +39,16 @@ user_waiting_for_chat = set()
 user_waiting_for_image = set()
 user_waiting_for_tts = set()
 user_waiting_for_edit = {}  # Dict to store edit prompts
-user_database = set()
 bot_start_time = time.time()
 
-# Initialize usage tracker
-usage_tracker = UsageTracker()
+# Initialize storage and usage tracker
+storage = get_storage()
+usage_tracker = UsageTracker(storage)
 
 
 # Start message handler
 @bot.message_handler(commands=['start'])
+@runs_in("chat")
 def start_command(message):
     """Enhanced start command with user registration"""
     user_id = message.from_user.id
@@ -38,7 +56,7 @@ def start_command(message):
     first_name = message.from_user.first_name or "User"
 
     # Add user to database
-    user_database.add(user_id)
+    storage.add_user(user_id)
 
     # Log interaction
     log_user_interaction(message.from_user, "/start",
@@ -96,6 +114,7 @@ Powered by the latest in AI innovation."""
 
 
 @bot.message_handler(commands=['help'])
+@runs_in("chat")
 def help_command(message):
     """Simplified help command with only core features"""
     user_id = message.from_user.id
@@ -140,6 +159,7 @@ def help_command(message):
 
 
 @bot.message_handler(commands=['chat'])
+@runs_in("chat")
 def chat_command(message):
     """Activate chat mode"""
     user_id = message.from_user.id
@@ -172,30 +192,35 @@ I'm now ready for a conversation! Just type your message and I'll respond with i
 
 
 @bot.message_handler(commands=['image'])
+@runs_in("image")
 def image_command(message):
     """Handle image generation command"""
     handle_image_command(bot, message, user_waiting_for_image, usage_tracker)
 
 
 @bot.message_handler(commands=['edit'])
+@runs_in("chat")
 def edit_command(message):
     """Handle image editing command"""
     handle_edit_command(bot, message, user_waiting_for_edit, usage_tracker)
 
 
 @bot.message_handler(commands=['say'])
+@runs_in("tts")
 def say_command(message):
     """Handle TTS command"""
     handle_say_command(bot, message, usage_tracker)
 
 
 @bot.message_handler(commands=['prompt'])
+@runs_in("chat")
 def prompt_command(message):
     """Handle prompt enhancement command"""
     handle_prompt_command(bot, message)
 
 
 @bot.message_handler(commands=['myinfo'])
+@runs_in("chat")
 def myinfo_command(message):
     """Show user information with usage stats"""
     user_id = message.from_user.id
@@ -239,6 +264,7 @@ def myinfo_command(message):
 
 # Premium management commands (owners only)
 @bot.message_handler(commands=['addpro'])
+@runs_in("chat")
 def add_premium_command(message):
     """Add user to premium (owners only)"""
     user_id = message.from_user.id
@@ -283,6 +309,7 @@ def add_premium_command(message):
 
 
 @bot.message_handler(commands=['removepro'])
+@runs_in("chat")
 def remove_premium_command(message):
     """Remove user from premium (owners only)"""
     user_id = message.from_user.id
@@ -326,6 +353,7 @@ def remove_premium_command(message):
 
 
 @bot.message_handler(commands=['allusers'])
+@runs_in("chat")
 def allusers_command(message):
     """Show all users list (owners only)"""
     user_id = message.from_user.id
@@ -338,22 +366,20 @@ def allusers_command(message):
 
     try:
         # Get all users from database
-        total_users = len(user_database)
-        premium_users_list = [
-            uid for uid in user_database if is_premium_user(uid)
-        ]
-        free_users_list = [
-            uid for uid in user_database if not is_premium_user(uid)
-        ]
+        total_users = storage.count_users()
+        premium_total = storage.count_users(premium=True)
+        free_total = total_users - premium_total
+        premium_users_list = storage.list_users(premium=True, limit=10)
+        free_users_list = storage.list_users(premium=False, limit=15)
 
         users_text = f"""👥 **All Users Database**
 
 **📊 Summary:**
 • Total Users: `{total_users}`
-• Premium Users: `{len(premium_users_list)}`
-• Free Users: `{len(free_users_list)}`
+• Premium Users: `{premium_total}`
+• Free Users: `{free_total}`
 
-**💎 Premium Users ({len(premium_users_list)}):**
+**💎 Premium Users ({premium_total}):**
 """
 
         # Add premium users to the list
@@ -361,21 +387,21 @@ def allusers_command(message):
             for i, uid in enumerate(premium_users_list[:10],
                                     1):  # Show first 10
                 users_text += f"• User ID: `{uid}`\n"
-            if len(premium_users_list) > 10:
-                users_text += f"• ... and {len(premium_users_list) - 10} more premium users\n"
+            if premium_total > 10:
+                users_text += f"• ... and {premium_total - 10} more premium users\n"
         else:
             users_text += "• No premium users yet\n"
 
         users_text += f"""
-**🆓 Free Users ({len(free_users_list)}):**
+**🆓 Free Users ({free_total}):**
 """
 
         # Add free users to the list (show first 15)
         if free_users_list:
             for i, uid in enumerate(free_users_list[:15], 1):  # Show first 15
                 users_text += f"• User ID: `{uid}`\n"
-            if len(free_users_list) > 15:
-                users_text += f"• ... and {len(free_users_list) - 15} more free users\n"
+            if free_total > 15:
+                users_text += f"• ... and {free_total - 15} more free users\n"
         else:
             users_text += "• No free users\n"
 
@@ -394,6 +420,7 @@ def allusers_command(message):
 
 
 @bot.message_handler(commands=['stats'])
+@runs_in("chat")
 def stats_command(message):
     """Show bot statistics (owners only)"""
     user_id = message.from_user.id
@@ -405,8 +432,8 @@ def stats_command(message):
         return
 
     # Calculate stats
-    total_users = len(user_database)
-    premium_count = len([uid for uid in user_database if is_premium_user(uid)])
+    total_users = storage.count_users()
+    premium_count = storage.count_users(premium=True)
     chat_active = len(chat_mode)
 
     stats_text = f"""📊 **BrahMos AI Statistics**
@@ -428,16 +455,15 @@ def stats_command(message):
 
 # ---- /ping: latency + uptime + status ----
 @bot.message_handler(commands=['ping'])
+@runs_in("chat")
 def ping_command(message):
     chat_id = message.chat.id
 
-    # measure Bot API round-trip latency using getMe
+    # measure Bot API round-trip latency using getMe, through the bot's own
+    # session so Telegram stays out of the upstream connection stats
     t0 = time.perf_counter()
-    api_ok = False
     try:
-        resp = requests.get(
-            f"https://api.telegram.org/bot{config.BOT_TOKEN}/getMe", timeout=5)
-        api_ok = resp.ok and resp.json().get("ok", False)
+        api_ok = bool(bot.get_me())
     except Exception:
         api_ok = False
     latency_ms = (time.perf_counter() - t0) * 1000.0
@@ -455,6 +481,7 @@ def ping_command(message):
 
 
 @bot.message_handler(commands=['debug'])
+@runs_in("chat")
 def debug_command(message):
     """Debug information (owners only)"""
     user_id = message.from_user.id
@@ -465,6 +492,36 @@ def debug_command(message):
                      parse_mode="Markdown")
         return
 
+    pool_stats = upstream.get_stats()["total"]
+    send_stats = outbound_dispatcher.stats()
+    worker_stats = executor.stats()
+    workers_text = "\n".join(
+        f"• {name.title()}: `{w['running']}/{w['workers']}` running, "
+        f"`{w['queued']}` queued, `{w['rejected']}` rejected"
+        for name, w in worker_stats.items())
+    upstream_text = "\n".join(
+        f"• {name.title()}: `{u['in_use']}/{u['capacity']}` busy, `{u['waiting']}` waiting, "
+        f"p95 💎 `{u['premium']['p95']:.1f}s` / 🆓 `{u['free']['p95']:.1f}s`"
+        for name, u in upstream_scheduler.stats().items())
+    flight_text = "\n".join(
+        f"• {kind.title()}: `{f['calls']}` calls, `{f['coalesced']}` saved, `{f['in_flight']}` in flight"
+        for kind, f in single_flight.stats().items()) or "• No coalescable calls yet"
+    circuit_text = "\n".join(
+        f"• {name.title()}: `{c['state']}`, `{c['failures']}/{c['calls']}` failed, "
+        f"`{c['rejected']}` fast-failed, opened `{c['opened']}`x"
+        for name, c in ((name, breaker.stats()) for name, breaker in breakers.items()))
+    hedge_stats = chat_hedger.stats()
+    backend_text = "\n".join(
+        f"• {name} (`{r['model']}`): `{r['state']}`, `{r['share']:.0%}` share, "
+        f"TTFT `{r['ttft'] or 0:.2f}s`, `{r['error_rate']:.0%}` errors, `{r['calls']}` calls"
+        for name, r in chat_router.stats().items())
+    static_stats = static_media.stats()
+    memory_stats = conversation_store.stats()
+    cache_text = "\n".join(
+        f"• {cache.name.title()}: `{c['hit_rate']:.0%}` hit rate, `{c['entries']}` entries, "
+        f"`{c['bytes'] / 1048576:.1f}` MB, `{c['evictions']}` evicted"
+        for cache, c in ((cache, cache.stats()) for cache in (image_cache, tts_cache, prompt_cache)))
+
     debug_text = f"""🔧 **BrahMos AI Debug Info**
 
 **🌐 API Endpoints:**
@@ -479,15 +536,54 @@ def debug_command(message):
 
 **📊 System Status:**
 • Bot Uptime: `{format_uptime(bot_start_time)}`
-• Total Users: `{len(user_database)}`
-• Premium Users: `{len([uid for uid in user_database if is_premium_user(uid)])}`
+• Total Users: `{storage.count_users()}`
+• Premium Users: `{storage.count_users(premium=True)}`
 • Chat Mode Active: `{len(chat_mode)}`
 
+**🌐 Upstream Connections:**
+• Requests: `{pool_stats['requests']}`
+• New Connections: `{pool_stats['new_connections']}`
+• Reused: `{pool_stats['reused']}` (`{pool_stats['reuse_ratio']:.0%}`)
+
+**📤 Outbound Queue:**
+• Queued: `{send_stats['queued']}`
+• Sent: `{send_stats['sent']}` / Failed: `{send_stats['failed']}`
+• Merged Edits: `{send_stats['merged']}`
+• Rate Limited (429): `{send_stats['rate_limited']}`
+
+**⚙️ Worker Pools:**
+{workers_text}
+
+**🧠 Conversation Memory:**
+• Chats: `{memory_stats['chats']}` / Messages: `{memory_stats['messages']}`
+• Size: `{memory_stats['bytes'] / 1048576:.1f}` MB / Moved Out: `{memory_stats['evicted']}`
+• On Disk: `{memory_stats.get('archived', 0)}` / Loaded: `{memory_stats['loaded']}` / Written: `{memory_stats['written']}`
+• Prompt Tokens: `{context_stats['tokens_sent']}` sent / `{context_stats['tokens_saved']}` saved
+
+**🗃️ Media Cache:**
+{cache_text}
+• Static Assets: `{static_stats['uploads']}` uploads, `{static_stats['reused']}` sent by id
+• Edit Inputs: `{ingest_stats['photos']}` photos, `{ingest_stats['downscaled']}` downscaled, `{ingest_stats['bytes_saved'] / 1048576:.1f}` MB saved
+
+**🧭 Chat Backends:**
+{backend_text}
+
+**🚦 Upstream Priority:**
+{upstream_text}
+• Chat Hedging: `{'on' if config.CHAT_HEDGING else 'off'}`, `{hedge_stats['hedged']}/{hedge_stats['requests']}` hedged, `{hedge_stats['hedge_wins']}` won, delay `{hedge_stats['threshold']:.1f}s`
+
+**🔀 Coalesced Requests:**
+{flight_text}
+
+**🛡️ Circuit Breakers:**
+{circuit_text}
+
 **🔒 Access Control:**
 • Owners: `{config.OWNER_IDS}`
 • Your ID: `{user_id}`
 
-**📝 Files:**
+**📝 Storage:** `{config.STORAGE_BACKEND}`
+• Database: `{config.SQLITE_DB_FILE}`
 • Premium Users: `{config.PREMIUM_USERS_FILE}`
 • Usage Data: `{config.USAGE_DATA_FILE}`
 
@@ -500,6 +596,7 @@ def debug_command(message):
 
 # ---- 🔄 Callback query handler (inline buttons) ----
 @bot.callback_query_handler(func=lambda call: True)
+@runs_in("chat")
 def callback_handler(call):
     """Handle all inline keyboard callbacks"""
     try:
@@ -527,9 +624,50 @@ def callback_handler(call):
         bot.answer_callback_query(call.id, "❌ Error processing request!")
 
 
+def should_handle_message(message):
+    """Handler filter: drop group messages not addressed to the bot before any work"""
+    if message.chat.type not in GROUP_CHAT_TYPES:
+        return True
+    return group_prefilter(message,
+                           get_bot_identity(bot).id,
+                           (user_waiting_for_tts, user_waiting_for_image,
+                            user_waiting_for_edit))
+
+
+def reject_update(workload, update):
+    """Tell the user right away when a workload queue is full"""
+    try:
+        if hasattr(update, "data"):
+            bot.answer_callback_query(update.id, "⏳ Busy right now, please try again!")
+        else:
+            bot.reply_to(update,
+                         "⏳ **BrahMos AI is busy right now.** Please try again in a moment.",
+                         parse_mode="Markdown")
+    except Exception as e:
+        print(f"[DEBUG] Failed to send busy reply: {e}")
+
+
+executor.on_reject = reject_update
+
+
 # Main message handler for group and direct messages
-@bot.message_handler(func=lambda message: True)
+@bot.message_handler(func=should_handle_message)
 def message_handler(message):
+    """Route non-command messages to the pool of the work they need"""
+    user_id = message.from_user.id
+    if user_id in user_waiting_for_tts:
+        workload = "tts"
+    elif user_id in user_waiting_for_image or (user_id in user_waiting_for_edit
+                                                and message.photo):
+        workload = "image"
+    else:
+        workload = "chat"
+    if not executor.submit(workload, message.chat.id, process_message,
+                           message):
+        reject_update(workload, message)
+
+
+def process_message(message):
     """Main message handler for all non-command messages"""
     user_id = message.from_user.id
     chat_type = message.chat.type
@@ -579,20 +717,39 @@ def message_handler(message):
             should_respond = False
 
             # Check if replying to bot's message
-            if message.reply_to_message and message.reply_to_message.from_user.id == bot.get_me(
-            ).id:
+            if is_reply_to_bot(message, get_bot_identity(bot).id):
                 should_respond = True
 
             # Check if bot is mentioned by name
             elif is_bot_mentioned(text):
                 should_respond = True
 
-            if should_respond:
+            if should_respond and config.STREAM_REPLIES:
+                # Stream the reply into a message that answers the user
+                reply = StreamingReply(bot,
+                                       message.chat.id,
+                                       reply_to_message_id=message.message_id,
+                                       is_group=True)
+                ai_response = get_ai_response(text,
+                                              message.from_user.first_name,
+                                              message.chat.id,
+                                              "Group mention/reply",
+                                              on_delta=reply.feed,
+                                              user_id=user_id)
+                try:
+                    reply.finish(ai_response)
+                except Exception as e:
+                    print(f"[DEBUG] Failed to deliver streamed group response: {e}")
+                    # Fallback to a plain reply
+                    bot.reply_to(message, ai_response)
+
+            elif should_respond:
                 # Get AI response with proper context
                 ai_response = get_ai_response(text,
                                               message.from_user.first_name,
                                               message.chat.id,
-                                              "Group mention/reply")
+                                              "Group mention/reply",
+                                              user_id=user_id)
 
                 # Send reply directly to the user who mentioned/replied
                 try:
@@ -611,9 +768,14 @@ def message_handler(message):
 
 # Start the bot
 if __name__ == "__main__":
+    # Turn SIGTERM (deploys/restarts) into a normal exit so atexit flushes run
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
     print("🚀 Starting BrahMos AI Bot...")
-    print(f"🤖 Bot username: @{bot.get_me().username}")
-    print(f"📊 Loaded {len(premium_users)} premium users")
+    print(f"🤖 Bot username: @{init_bot_identity(bot).username}")
+    print(f"📊 Loaded {storage.count_premium()} premium users")
+    if config.HTTP_WARMUP_ON_START:
+        upstream.warm_up_async()
     print("✅ Bot is ready and listening for messages!")
 
     # Start polling
@@ -175,7 +175,7 @@ def handle_quick_tts_callback(bot, call, user_waiting_for_tts):
     user_id = call.from_user.id
     user_waiting_for_tts.add(user_id)
     bot.answer_callback_query(call.id, "TTS mode activated! Send me text to convert.")
-    bot.send_message(call.message.chat.id, """🎤 **Text-to-Speech Mode Activated!**
+    bot.send_message(call.message.chat.id, f"""🎤 **Text-to-Speech Mode Activated!**
 
 Send me any text and I'll convert it to speech for you.
 
@@ -184,7 +184,7 @@ Send me any text and I'll convert it to speech for you.
 • "Welcome to BrahMos AI!"
 • "This is a test of speech synthesis"
 
-💡 **Tip:** Keep text under 500 characters for best results!""", parse_mode="Markdown")
+💡 **Tip:** Long texts (up to {config.TTS_MAX_CHARS} characters) are read out in one voice message!""", parse_mode="Markdown")
 
 def handle_quick_edit_callback(bot, call, user_waiting_for_edit):
     """Handle quick edit callback"""
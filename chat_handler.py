@@ -1,132 +1,281 @@
-import requests
+import itertools
 import json
-import re
+import requests
+import threading
+import time
 import config
+from chat_router import chat_router
+from circuit_breaker import CircuitOpenError, is_failure
+from concurrent.futures import ThreadPoolExecutor
+from context_builder import build_context
+from conversation_store import conversation_store
+from hedging import chat_hedger
+from http_client import upstream
+from media_cache import normalize_text, prompt_cache
+from outbound import PRIORITY_FINAL, PRIORITY_UPDATE
+from scheduler import upstream_scheduler
+from singleflight import single_flight
+from sse_parser import iter_sse_deltas
 from utils import AnimatedLoader
 
-# Global conversation memory
-conversation_memory = {}
+SUMMARY_PROMPT = (
+    "You maintain a short running summary of a chat between users and BrahMos AI. "
+    "Merge the new messages into the current summary. Keep names, facts, preferences "
+    "and open questions; drop small talk. Answer with the updated summary only, "
+    "in at most a few sentences."
+)
 
-def _append_delta_text_from_chunk(obj, buf):
-    """
-    Safely extract streamed text from an OpenAI-compatible SSE JSON object.
-    Handles shapes:
-      - {"choices":[{"delta":{"content":"..."} }]}
-      - {"choices":[{"delta":{"role":"assistant"}}]}  # no content
-      - {"choices":[{"message":{"content":"..."} }]}  # non-stream JSON fallback
-    Also tolerates when 'choices' is a list but not dict-like.
+PROMPT_ENHANCER_PROMPT = """You are a Prompt Generator for Image Generation and TTS paragraph under 500 characters.
+
+Rewrite the user's TTS idea in 500 characters and if specified number of characters do that only generate words for TTS not for image if asked.
+
+If user tells you that make a prompt for this and mentioned characters design it like it will be specified for TTS saying only.
+
+Rewrite the user's idea into a vivid, cinematic description.
+
+**Focus on:**
+- Maximum realism and intricate details
+- Photorealistic textures
+- Lighting and shadows
+- Mood and atmosphere
+- Depth of field and focus
+- Ambient, background details
+- For TTS focus on good pronunciation and under 500 characters, if number of characters specified do that
+
+Do not add style labels like cartoon/anime unless explicitly requested by the idea.
+Always aim for masterpiece quality and 2K resolution.
+If cartoonish or any anime is not mentioned please don't give it.
+Always look for default quality and look realistic.
+
+Rewrite the user's idea and ONLY output the final enhanced result."""
+
+# Summaries are written in the background, one at a time, at most one
+# queued per chat and CONTEXT_SUMMARY_MAX_PENDING in all
+_summary_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="summary")
+_summary_lock = threading.Lock()
+_summary_pending = set()  # chat_ids with a summary job queued or running
+
+def parse_streaming_response(response, on_delta=None, chunks=None):
+    """Robust SSE parser tolerant to proxies and concatenated or array chunks.
+
+    Raw bytes are parsed incrementally as they arrive; ``on_delta`` is called
+    with every new piece of text as soon as it is parsed. ``chunks`` replaces
+    the response body when part of it was already read.
     """
-    try:
-        choices = obj.get("choices", [])
-    except AttributeError:
-        choices = obj if isinstance(obj, list) else []
-    for choice in choices:
-        if not isinstance(choice, dict):
-            continue
-        delta = choice.get("delta") or {}
-        if isinstance(delta, dict):
-            piece = delta.get("content")
-            if isinstance(piece, str):
-                buf.append(piece)
-        message = choice.get("message") or {}
-        if isinstance(message, dict):
-            content = message.get("content")
-            if isinstance(content, str):
-                buf.append(content)
-
-def parse_streaming_response(response):
-    """Robust SSE parser tolerant to proxies and concatenated or array chunks."""
+    if chunks is None:
+        chunks = response.iter_content(chunk_size=config.SSE_READ_CHUNK_SIZE)
     out_parts = []
     try:
-        for raw in response.iter_lines(decode_unicode=True):
-            if not raw or raw.startswith(":"):
-                continue
-            if raw.startswith("data:"):
-                data = raw[5:].lstrip()
-            else:
-                continue
-            if not data or data == "[DONE]":
-                continue
-
-            pieces = re.split(r'(?<=\})(?=\{)', data) if "}{" in data else [data]
-            for p in pieces:
-                p = p.strip()
-                if not p:
-                    continue
-                try:
-                    obj = json.loads(p)
-                except json.JSONDecodeError:
-                    if p.startswith("[") and p.endswith("]"):
-                        try:
-                            arr = json.loads(p)
-                            _append_delta_text_from_chunk({"choices": arr}, out_parts)
-                            continue
-                        except Exception:
-                            out_parts.append(p)
-                            continue
-                    out_parts.append(p)
-                    continue
-                _append_delta_text_from_chunk(obj, out_parts)
+        for piece in iter_sse_deltas(chunks):
+            out_parts.append(piece)
+            if on_delta:
+                on_delta(piece)
         return "".join(out_parts).strip()
     except Exception as e:
         print(f"[DEBUG] Streaming parse error: {e}")
         return None
 
-def get_ai_response(user_message, user_name="User", chat_id=None, message_context=None):
-    """Get AI response with streaming support and conversation memory"""
-    result = ""
-    current_message = f"{user_name}: {user_message}"
+class ChatResponseError(Exception):
+    """The chat API answered without usable content; the message is shown to the user"""
 
+def _open_chat_stream(payload, attempt=None, tried=None):
+    """Send the chat request to a routed backend and wait for the first body bytes.
+
+    Backends in ``tried`` are avoided and the chosen one is added to it.
+    Returns ``(backend, response, chunks)``.
+    """
+    backend, probe = chat_router.pick(exclude=tried or ())
+    if tried is not None:
+        tried.append(backend)
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {backend.api_key}"
+    }
+    started = time.perf_counter()
     try:
-        messages = [{"role": "system", "content": config.SYSTEM_PROMPT}]
-        if chat_id in conversation_memory:
-            messages.extend(conversation_memory[chat_id][-6:])
-        if message_context:
-            current_message = f"[Context: {message_context}] {current_message}"
-        messages.append({"role": "user", "content": current_message})
-
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {config.API_KEY}"
-        }
-        payload = {
-            "model": config.CHAT_MODEL,
-            "messages": messages,
-            "max_tokens": 1000,
-            "temperature": 0.8,
-            "stream": True
-        }
-
-        print(f"[DEBUG] Sending request to: {config.CHAT_API_ENDPOINT}")
-        response = requests.post(
-            config.CHAT_API_ENDPOINT,
-            json=payload,
+        print(f"[DEBUG] Sending request to: {backend.endpoint} ({backend.name})")
+        response = upstream.post(
+            backend.endpoint,
+            json=dict(payload, model=backend.model),
             headers=headers,
             stream=True,
             timeout=60
         )
-
+        if attempt is not None and not chat_hedger.opened(attempt, response):
+            raise ChatResponseError("Hedged request lost")
         response.raise_for_status()
+        chunks = response.iter_content(chunk_size=config.SSE_READ_CHUNK_SIZE)
+        first = next(chunks, b"")
+    except Exception as e:
+        if attempt is not None and attempt["cancelled"]:
+            # Lost a hedge race: slow, not broken
+            chat_router.record(backend, probe, True, time.perf_counter() - started)
+        else:
+            chat_router.record(backend, probe, not is_failure(e))
+        raise
+    chat_router.record(backend, probe, True, time.perf_counter() - started)
+    return backend, response, itertools.chain((first,), chunks)
+
+def request_chat_completion(messages, max_tokens=1000, temperature=0.8, on_delta=None, user_id=None,
+                            hedge=True, background=False, served=None):
+    """Send a chat completion request and return the reply text.
+
+    Replies are streamed when the API streams; ``on_delta`` receives the
+    pieces as they arrive. With CHAT_HEDGING and ``hedge``, a stalled request
+    is raced against a second one. A ``background`` request waits behind
+    every user's request for an upstream slot. ``served``, a dict, gets the
+    ``model`` of the backend that answered. Raises requests exceptions,
+    ChatResponseError and CircuitOpenError.
+    """
+    payload = {
+        "messages": messages,
+        "max_tokens": max_tokens,
+        "temperature": temperature,
+        "stream": True
+    }
+
+    # The slot covers the whole stream, which is what occupies the upstream
+    with upstream_scheduler.slot("chat", user_id, background=background):
+        if config.CHAT_HEDGING and hedge:
+            # A hedge goes to another backend when there is one
+            tried = []
+            backend, response, chunks = chat_hedger.run(lambda attempt: _open_chat_stream(payload, attempt, tried))
+        else:
+            backend, response, chunks = _open_chat_stream(payload)
+        if served is not None:
+            served["model"] = backend.model
         content_type = response.headers.get('Content-Type', '').lower().strip()
 
         if "text/event-stream" in content_type or content_type == "" or "event-stream" in content_type:
-            ai_response = parse_streaming_response(response)
-            result = ai_response if ai_response else "🔄 **Streaming Error:** Unable to parse response."
+            ai_response = parse_streaming_response(response, on_delta, chunks)
+            if not ai_response:
+                raise ChatResponseError("🔄 **Streaming Error:** Unable to parse response.")
+            return ai_response
         elif "application/json" in content_type:
-            data = response.json()
+            data = json.loads(b"".join(chunks))
             try:
                 if "choices" in data and data["choices"] and len(data["choices"]) > 0:
                     choice = data["choices"][0]
                     msg = choice.get("message", {})
-                    result = (msg.get("content") or "").strip() or "🔍 **Response Error:** Empty content."
+                    content = (msg.get("content") or "").strip()
                 else:
-                    result = "🔍 **Response Error:** Invalid response structure."
+                    raise ChatResponseError("🔍 **Response Error:** Invalid response structure.")
+            except ChatResponseError:
+                raise
             except Exception as e:
-                result = f"🔍 **Response Error:** {e}"
+                raise ChatResponseError(f"🔍 **Response Error:** {e}")
+            if not content:
+                raise ChatResponseError("🔍 **Response Error:** Empty content.")
+            return content
         else:
-            ai_response = parse_streaming_response(response)
-            result = ai_response if ai_response else f"🚨 **API Error:** Unexpected content type: {content_type}"
+            ai_response = parse_streaming_response(response, on_delta, chunks)
+            if not ai_response:
+                raise ChatResponseError(f"🚨 **API Error:** Unexpected content type: {content_type}")
+            return ai_response
+
+def prompt_cache_key(idea, model):
+    """Cache key of a /prompt idea enhanced by ``model``"""
+    return prompt_cache.make_key(model, PROMPT_ENHANCER_PROMPT, normalize_text(idea))
+
+def enhance_prompt(idea, user_id=None):
+    """Enhanced version of a /prompt idea.
+
+    A standalone request with just the enhancer instructions and the idea:
+    no system prompt, no history, nothing written to conversation memory.
+    Results are cached by the normalized idea and the model that enhanced
+    it; a result of any configured chat backend's model is reused.
+    """
+    if config.PROMPT_CACHE_ENABLED:
+        for model in dict.fromkeys(backend.model for backend in chat_router.backends):
+            cached = prompt_cache.lookup(prompt_cache_key(idea, model))
+            if cached is not None:
+                print(f"[DEBUG] Prompt cache hit for: {idea[:50]}")
+                return cached.decode("utf-8")
+    messages = [
+        {"role": "system", "content": PROMPT_ENHANCER_PROMPT},
+        {"role": "user", "content": f"**User idea:** {idea}\n\nCreate an enhanced prompt with rich visual details:"},
+    ]
+    served = {}
+
+    def enhance():
+        enhanced = request_chat_completion(messages, max_tokens=config.PROMPT_ENHANCE_MAX_TOKENS,
+                                           user_id=user_id, served=served)
+        if config.PROMPT_CACHE_ENABLED:
+            prompt_cache.put(prompt_cache_key(idea, served["model"]), data=enhanced.encode("utf-8"))
+        return enhanced
+
+    # The same idea already being enhanced is waited for, not requested again
+    return single_flight.do("prompt", normalize_text(idea), enhance)
+
+def _summarize(chat_id, folded):
+    """Fold turns that left the context into the chat's running summary"""
+    previous = conversation_store.summary(chat_id)
+    transcript = "\n".join(f"{m['role']}: {m['content']}" for m in folded)
+    messages = [
+        {"role": "system", "content": SUMMARY_PROMPT},
+        {"role": "user", "content": f"Current summary:\n{previous or '(none)'}\n\nNew messages:\n{transcript}"},
+    ]
+    try:
+        summary = request_chat_completion(messages, max_tokens=config.CONTEXT_SUMMARY_MAX_TOKENS,
+                                          temperature=0.3, hedge=False, background=True)
+    except Exception as e:
+        print(f"[DEBUG] Summary for chat {chat_id} failed: {e}")
+        return
+    conversation_store.set_summary(chat_id, summary)
+    print(f"[DEBUG] Summarized {len(folded)} messages of chat {chat_id}")
+
+def _run_summary(chat_id, folded):
+    try:
+        _summarize(chat_id, folded)
+    finally:
+        # Only now, so the next job starts from the summary written here
+        with _summary_lock:
+            _summary_pending.discard(chat_id)
+
+def _maybe_summarize(chat_id, trimmed):
+    """Summarize folded messages once the context had to be trimmed, or every
+    CONTEXT_SUMMARY_EVERY_TURNS turns that left the chat's memory"""
+    # While a job is queued for the chat or too many are, the folded
+    # messages wait in the store and go into a later summary
+    min_count = 1 if trimmed else 2 * config.CONTEXT_SUMMARY_EVERY_TURNS
+    with _summary_lock:
+        if chat_id in _summary_pending or len(_summary_pending) >= config.CONTEXT_SUMMARY_MAX_PENDING:
+            return
+        folded = conversation_store.take_folded(chat_id, min_count)
+        if not folded:
+            return
+        _summary_pending.add(chat_id)
+    _summary_pool.submit(_run_summary, chat_id, folded)
+
+def get_ai_response(user_message, user_name="User", chat_id=None, message_context=None, on_delta=None,
+                    user_id=None):
+    """Get AI response with streaming support and conversation memory.
+
+    Pass ``on_delta`` to receive text pieces while the response is still streaming.
+    ``user_id`` decides the priority tier of the upstream call.
+    """
+    result = ""
+    trimmed = 0
+    current_message = f"{user_name}: {user_message}"
 
+    try:
+        if message_context:
+            current_message = f"[Context: {message_context}] {current_message}"
+        history, summary = conversation_store.context(chat_id) if chat_id else ([], "")
+        messages, trimmed = build_context(config.SYSTEM_PROMPT, history, summary,
+                                          {"role": "user", "content": current_message},
+                                          config.CONTEXT_TOKEN_BUDGET)
+        if trimmed and chat_id and config.CONTEXT_SUMMARIES:
+            # Turns that no longer fit are summarized instead of dropped
+            conversation_store.fold(chat_id, trimmed)
+
+        result = request_chat_completion(messages, on_delta=on_delta, user_id=user_id)
+
+    except CircuitOpenError as e:
+        # Nothing was asked, so nothing is remembered
+        return str(e)
+    except ChatResponseError as e:
+        result = str(e)
     except requests.exceptions.HTTPError as http_err:
         result = f"🐞 **HTTP Error:** {http_err}"
     except requests.exceptions.ConnectionError:
@@ -137,17 +286,142 @@ def get_ai_response(user_message, user_name="User", chat_id=None, message_contex
         result = f"💥 **Error:** {str(ex)[:100]}..."
 
     if chat_id and result:
-        if chat_id not in conversation_memory:
-            conversation_memory[chat_id] = []
-        conversation_memory[chat_id].append({"role": "user", "content": current_message})
-        conversation_memory[chat_id].append({"role": "assistant", "content": result})
-        if len(conversation_memory[chat_id]) > 10:
-            conversation_memory[chat_id] = conversation_memory[chat_id][-10:]
+        conversation_store.append(chat_id,
+                                  {"role": "user", "content": current_message},
+                                  {"role": "assistant", "content": result})
+        if config.CONTEXT_SUMMARIES:
+            _maybe_summarize(chat_id, trimmed)
     return result
 
+def split_message(text, limit):
+    """Split text into Telegram-sized chunks, preferring newline/space boundaries"""
+    chunks = []
+    while len(text) > limit:
+        cut = text.rfind("\n", 0, limit)
+        if cut < limit // 2:
+            cut = text.rfind(" ", 0, limit)
+        if cut < limit // 2:
+            cut = limit
+        chunks.append(text[:cut])
+        text = text[cut:].lstrip()
+    chunks.append(text)
+    return chunks
+
+class StreamingReply:
+    """Progressively deliver a streamed AI reply by editing Telegram messages.
+
+    The first message is posted as soon as text arrives, then edited at a
+    throttled cadence. Text that grows past the message limit rolls over
+    into a new message.
+    """
+
+    def __init__(self, bot, chat_id, reply_to_message_id=None, is_group=False):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.reply_to_message_id = reply_to_message_id
+        self.interval = config.STREAM_GROUP_EDIT_INTERVAL if is_group else config.STREAM_EDIT_INTERVAL
+        self.parts = []
+        self.messages = []  # [message_id, last_sent_text]
+        self.started_at = time.perf_counter()
+        self.first_visible_at = None
+        self.last_flush = 0.0
+        self.preview_failed = False
+
+    def feed(self, piece):
+        """Collect a streamed piece and flush it to Telegram when the throttle allows"""
+        self.parts.append(piece)
+        if self.preview_failed:
+            return
+        now = time.perf_counter()
+        try:
+            if not self.messages:
+                if len("".join(self.parts).strip()) >= config.STREAM_FIRST_CHUNK_CHARS:
+                    self._flush(streaming=True)
+            elif now - self.last_flush >= self.interval:
+                self._flush(streaming=True)
+        except Exception as e:
+            # The reply is still collected; finish() delivers it
+            print(f"[DEBUG] Stream preview failed, waiting for the full reply: {e}")
+            self.preview_failed = True
+
+    def _flush(self, streaming):
+        text = "".join(self.parts).strip()
+        if not text:
+            return
+        self._render(split_message(text, config.STREAM_MESSAGE_LIMIT), streaming)
+        self.last_flush = time.perf_counter()
+        if self.first_visible_at is None and self.messages:
+            self.first_visible_at = self.last_flush
+            print(f"[DEBUG] Stream first visible token after "
+                  f"{(self.first_visible_at - self.started_at) * 1000:.0f} ms")
+
+    def _render(self, chunks, streaming):
+        for i, chunk in enumerate(chunks):
+            last = i == len(chunks) - 1
+            text = chunk + config.STREAM_CURSOR if streaming and last else chunk
+            # Partial Markdown breaks parsing, so only the final render uses it
+            parse_mode = None if streaming else "Markdown"
+            if i < len(self.messages):
+                if self.messages[i][1] != text:
+                    self._edit(i, text, parse_mode)
+            else:
+                self._send(text, parse_mode)
+
+    def _send(self, text, parse_mode):
+        reply_to = self.reply_to_message_id if not self.messages else None
+        try:
+            sent = self.bot.send_message(self.chat_id, text, parse_mode=parse_mode,
+                                         reply_to_message_id=reply_to)
+        except Exception as e:
+            if parse_mode is None:
+                print(f"[DEBUG] Stream send failed: {e}")
+                return
+            print(f"[DEBUG] Stream send failed with Markdown: {e}")
+            sent = self.bot.send_message(self.chat_id, text, reply_to_message_id=reply_to)
+        self.messages.append([sent.message_id, text])
+
+    def _edit(self, index, text, parse_mode):
+        message_id = self.messages[index][0]
+        # Preview edits yield to final answers in the outbound queue
+        priority = PRIORITY_UPDATE if parse_mode is None else PRIORITY_FINAL
+        try:
+            self.bot.edit_message_text(text, chat_id=self.chat_id, message_id=message_id,
+                                       parse_mode=parse_mode, priority=priority)
+        except Exception as e:
+            if "message is not modified" in str(e):
+                pass
+            elif parse_mode is None:
+                print(f"[DEBUG] Stream edit failed: {e}")
+                return
+            else:
+                print(f"[DEBUG] Stream edit failed with Markdown: {e}")
+                try:
+                    self.bot.edit_message_text(text, chat_id=self.chat_id, message_id=message_id)
+                except Exception as e2:
+                    print(f"[DEBUG] Stream plain edit failed: {e2}")
+                    return
+        self.messages[index][1] = text
+
+    def finish(self, final_text):
+        """Render the complete reply with Markdown, replacing the streamed preview"""
+        final_text = (final_text or "").strip()
+        if not final_text:
+            return
+        chunks = split_message(final_text, config.STREAM_MESSAGE_LIMIT)
+        # Force a re-render so the final pass drops the cursor and applies Markdown
+        for entry in self.messages:
+            entry[1] = None
+        self._render(chunks, streaming=False)
+        for message_id, _ in self.messages[len(chunks):]:
+            try:
+                self.bot.delete_message(self.chat_id, message_id)
+            except Exception as e:
+                print(f"[DEBUG] Failed to delete extra stream message: {e}")
+        del self.messages[len(chunks):]
+
 def handle_chat_message(bot, message, chat_mode_users, user_waiting_for_chat):
     """Handle chat messages in chat mode with memory"""
-    from utils import log_user_interaction, get_user_mention
+    from utils import log_user_interaction
 
     user_id = message.from_user.id
     user_name = message.from_user.first_name or "User"
@@ -163,7 +437,19 @@ def handle_chat_message(bot, message, chat_mode_users, user_waiting_for_chat):
     elif message.chat.type in ['group', 'supergroup']:
         context = "Group conversation"
 
-    ai_response = get_ai_response(message.text, user_name, message.chat.id, context)
+    if config.STREAM_REPLIES:
+        reply = StreamingReply(bot, message.chat.id)
+        ai_response = get_ai_response(message.text, user_name, message.chat.id, context, on_delta=reply.feed,
+                                      user_id=message.from_user.id)
+        try:
+            reply.finish(ai_response)
+        except Exception as e:
+            print(f"[DEBUG] Failed to deliver streamed chat response: {e}")
+            bot.send_message(message.chat.id, "❌ **Sorry, I had trouble processing your message. Please try again.**")
+        return
+
+    ai_response = get_ai_response(message.text, user_name, message.chat.id, context,
+                                  user_id=message.from_user.id)
 
     try:
         bot.send_message(message.chat.id, ai_response, parse_mode="Markdown")
@@ -177,7 +463,7 @@ def handle_chat_message(bot, message, chat_mode_users, user_waiting_for_chat):
 
 def handle_prompt_command(bot, message):
     """Handle /prompt command for enhancing prompts with animation"""
-    from utils import log_user_interaction, AnimatedLoader
+    from utils import log_user_interaction
 
     log_user_interaction(message.from_user, "/prompt", "DM" if message.chat.type == "private" else "Group")
 
@@ -198,41 +484,11 @@ def handle_prompt_command(bot, message):
 
     original_prompt = prompt_text[7:].strip()
 
-    enhanced_prompt = f"""You are a Prompt Generator for Image Generation and TTS paragraph under 500 characters.
-
-Rewrite the user's TTS idea in 500 characters and if specified number of characters do that only generate words for TTS not for image if asked.
-
-If user tells you that make a prompt for this and mentioned characters design it like it will be specified for TTS saying only.
-
-Rewrite the user's idea into a vivid, cinematic description.
-
-**Focus on:**
-- Maximum realism and intricate details
-- Photorealistic textures  
-- Lighting and shadows
-- Mood and atmosphere
-- Depth of field and focus
-- Ambient, background details
-- For TTS focus on good pronunciation and under 500 characters, if number of characters specified do that
-
-Do not add style labels like cartoon/anime unless explicitly requested by the idea.
-Always aim for masterpiece quality and 2K resolution.
-If cartoonish or any anime is not mentioned please don't give it.
-Always look for default quality and look realistic.
-
-Now rewrite this prompt and ONLY output the final enhanced result:
-
-**User idea:** {original_prompt}
-
-Create an enhanced prompt with rich visual details:"""
-
-    user_name = message.from_user.first_name or "User"
-
     loader = AnimatedLoader(bot, message.chat.id, "Enhancing prompt", "prompt")
     loader.start()
 
     try:
-        enhanced = get_ai_response(enhanced_prompt, user_name, message.chat.id)
+        enhanced = enhance_prompt(original_prompt, user_id=message.from_user.id)
         loader.stop()
 
         response = f"✨ **Enhanced Prompt:**\n\n`{enhanced}`\n\n💡 *Copy the text above for better AI results!*"
@@ -241,6 +497,9 @@ Create an enhanced prompt with rich visual details:"""
         except Exception as e:
             print(f"[DEBUG] Failed to send enhanced prompt with Markdown: {e}")
             bot.reply_to(message, f"✨ Enhanced Prompt:\n\n{enhanced}\n\n💡 Copy the text above for better AI results!")
+    except CircuitOpenError as e:
+        loader.stop()
+        bot.reply_to(message, str(e), parse_mode="Markdown")
     except Exception as e:
         loader.stop()
         bot.reply_to(message, f"❌ **Error enhancing prompt:** {str(e)[:100]}...", parse_mode="Markdown")
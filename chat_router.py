@@ -0,0 +1,111 @@
+import random
+import threading
+
+import config
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+
+
+class ChatBackend:
+    """One OpenAI-compatible chat API with its running health figures"""
+
+    def __init__(self, name, base_url, api_key, model, weight=1.0):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.endpoint = f"{self.base_url}/chat/completions"
+        self.api_key = api_key
+        self.model = model
+        self.weight = weight
+        self.ttft = None  # EWMA of seconds to the first byte
+        self.error_rate = 0.0  # EWMA of failed calls
+        self.calls = 0
+        # Ejects the backend while it fails and lets a probe re-admit it
+        self.breaker = CircuitBreaker(
+            f"chat/{name}", "BrahMos AI chat",
+            window=config.CIRCUIT_WINDOW,
+            min_calls=config.CIRCUIT_MIN_CALLS,
+            failure_rate=config.CIRCUIT_FAILURE_RATE,
+            open_seconds=config.CIRCUIT_OPEN_SECONDS,
+            probes=config.CIRCUIT_HALF_OPEN_PROBES,
+        )
+
+
+class ChatRouter:
+    """Spread chat requests over several backends by latency and errors.
+
+    Each backend is picked at random with a share proportional to
+    ``weight / (ttft * (1 + error_penalty * error_rate))``, both figures
+    being EWMAs of its recent calls (``initial_ttft`` until it has been
+    timed). Backends whose breaker is open are left out until a half-open
+    probe succeeds; a half-open backend gets its probe on the next request,
+    however low its score.
+    """
+
+    def __init__(self, backends, alpha, initial_ttft, error_penalty):
+        self.backends = backends
+        self.alpha = alpha
+        self.initial_ttft = initial_ttft
+        self.error_penalty = error_penalty
+        self.lock = threading.Lock()
+
+    def _score(self, backend):
+        ttft = backend.ttft if backend.ttft is not None else self.initial_ttft
+        return backend.weight / (max(ttft, 0.001) * (1 + self.error_penalty * backend.error_rate))
+
+    def _ranked(self, backends):
+        """``backends`` in a random order weighted by score"""
+        backends = list(backends)
+        with self.lock:
+            scores = [self._score(b) for b in backends]
+        ranked = []
+        while backends:
+            i = random.choices(range(len(backends)), weights=scores)[0]
+            ranked.append(backends.pop(i))
+            scores.pop(i)
+        return ranked
+
+    def pick(self, exclude=()):
+        """Admit a call on a backend, avoiding ``exclude`` when another one is available.
+
+        Returns ``(backend, probe)``, to be reported with record(). Raises
+        CircuitOpenError when every backend is ejected.
+        """
+        preferred = self._ranked(b for b in self.backends if b not in exclude)
+        # Probe a half-open backend first, its error average only recovers with traffic
+        preferred.sort(key=lambda b: not b.breaker.wants_probe())
+        for backend in preferred + self._ranked(b for b in self.backends if b in exclude):
+            try:
+                return backend, backend.breaker.acquire()
+            except CircuitOpenError:
+                continue
+        raise CircuitOpenError(self.backends[0].breaker.unavailable_text())
+
+    def record(self, backend, probe, ok, ttft=None):
+        """Report a call admitted by pick(): its outcome and time to first byte"""
+        backend.breaker.record(ok, probe)
+        with self.lock:
+            backend.calls += 1
+            backend.error_rate += self.alpha * ((0.0 if ok else 1.0) - backend.error_rate)
+            if ttft is not None:
+                backend.ttft = ttft if backend.ttft is None else backend.ttft + self.alpha * (ttft - backend.ttft)
+
+    def stats(self):
+        states = {b.name: b.breaker.stats()["state"] for b in self.backends}
+        with self.lock:
+            scores = {b.name: self._score(b) if states[b.name] != "open" else 0.0 for b in self.backends}
+            total = sum(scores.values()) or 1.0
+            return {b.name: {"model": b.model,
+                             "calls": b.calls,
+                             "ttft": b.ttft,
+                             "error_rate": b.error_rate,
+                             "share": scores[b.name] / total,
+                             "state": states[b.name]}
+                    for b in self.backends}
+
+
+# Global router over the configured chat backends
+chat_router = ChatRouter(
+    [ChatBackend(**backend) for backend in config.CHAT_BACKENDS],
+    alpha=config.CHAT_ROUTER_EWMA_ALPHA,
+    initial_ttft=config.CHAT_ROUTER_INITIAL_TTFT,
+    error_penalty=config.CHAT_ROUTER_ERROR_PENALTY,
+)
@@ -0,0 +1,188 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import requests
+
+import config
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+
+class CircuitOpenError(Exception):
+    """The upstream's circuit is open; the message is shown to the user"""
+
+
+def is_failure_status(status_code):
+    """Server errors and rate limiting count against the upstream, client errors don't"""
+    return status_code >= 500 or status_code == 429
+
+
+def is_failure(error):
+    """Whether an exception from an upstream call counts against it"""
+    if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+        return is_failure_status(error.response.status_code)
+    return True
+
+
+class _Attempt:
+    """Outcome of one guarded call; exceptions are recorded automatically"""
+
+    def __init__(self):
+        self.ok = True
+
+    def fail(self):
+        self.ok = False
+
+    def status(self, status_code):
+        if is_failure_status(status_code):
+            self.ok = False
+
+
+class CircuitBreaker:
+    """Fast-fail guard for one upstream.
+
+    Outcomes of the last ``window`` seconds are kept. Once at least
+    ``min_calls`` are known and ``failure_rate`` of them failed, the circuit
+    opens: calls fail immediately with CircuitOpenError for
+    ``open_seconds``. It then turns half-open and lets ``probes`` calls
+    through; a successful probe closes it, a failed one opens it again.
+    """
+
+    def __init__(self, name, label, window, min_calls, failure_rate, open_seconds, probes=1):
+        self.name = name
+        self.label = label
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.open_seconds = open_seconds
+        self.probes = probes
+        self.lock = threading.Lock()
+        self.outcomes = deque()  # (time, ok) of recent calls, oldest first
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.probes_in_flight = 0
+        self.counters = {"calls": 0, "failures": 0, "rejected": 0, "opened": 0}
+
+    def _refresh(self, now):
+        """Expire old outcomes and end the open period (lock held)"""
+        while self.outcomes and now - self.outcomes[0][0] > self.window:
+            self.outcomes.popleft()
+        if self.state == OPEN and now - self.opened_at >= self.open_seconds:
+            self.state = HALF_OPEN
+            self.probes_in_flight = 0
+            print(f"[DEBUG] Circuit {self.name}: half-open, probing")
+
+    def _rejecting(self):
+        return self.state == OPEN or (self.state == HALF_OPEN and self.probes_in_flight >= self.probes)
+
+    def _open(self, now):
+        self.state = OPEN
+        self.opened_at = now
+        self.outcomes.clear()
+        self.counters["opened"] += 1
+        print(f"[DEBUG] Circuit {self.name}: open for {self.open_seconds:.0f}s")
+
+    def is_open(self):
+        """Whether a call would be turned away right now"""
+        with self.lock:
+            self._refresh(time.monotonic())
+            return self._rejecting()
+
+    def wants_probe(self):
+        """Whether the circuit is half-open and would admit a probe right now"""
+        with self.lock:
+            self._refresh(time.monotonic())
+            return self.state == HALF_OPEN and not self._rejecting()
+
+    def unavailable_text(self):
+        with self.lock:
+            retry_in = max(1, int(self.opened_at + self.open_seconds - time.monotonic()) + 1)
+        return (f"🛠️ **{self.label} is temporarily unavailable.**\n\n"
+                f"The service is not responding right now. Please try again in about {retry_in} seconds.")
+
+    def acquire(self):
+        """Admit a call, to be reported with record(); returns whether it is a half-open probe"""
+        with self.lock:
+            self._refresh(time.monotonic())
+            if not self._rejecting():
+                if self.state == HALF_OPEN:
+                    self.probes_in_flight += 1
+                    return True
+                return False
+            self.counters["rejected"] += 1
+        raise CircuitOpenError(self.unavailable_text())
+
+    def record(self, ok, probe):
+        with self.lock:
+            now = time.monotonic()
+            self.counters["calls"] += 1
+            self.counters["failures"] += not ok
+            if probe:
+                self.probes_in_flight -= 1
+                if ok:
+                    self.state = CLOSED
+                    self.outcomes.clear()
+                    print(f"[DEBUG] Circuit {self.name}: closed")
+                else:
+                    self._open(now)
+                return
+            if self.state != CLOSED:
+                return  # Finished after the circuit opened; the probes decide now
+            self.outcomes.append((now, ok))
+            self._refresh(now)
+            if ok:
+                return  # Only a failure trips the circuit
+            failed = sum(1 for _, outcome in self.outcomes if not outcome)
+            if len(self.outcomes) >= self.min_calls and failed >= self.failure_rate * len(self.outcomes):
+                self._open(now)
+
+    @contextmanager
+    def guard(self):
+        """Run one upstream call through the breaker.
+
+        Raises CircuitOpenError right away while the circuit is open. Yields
+        an attempt to mark failures that are not exceptions.
+        """
+        probe = self.acquire()
+        attempt = _Attempt()
+        try:
+            yield attempt
+        except BaseException as e:
+            self.record(not is_failure(e), probe)
+            raise
+        self.record(attempt.ok, probe)
+
+    def stats(self):
+        with self.lock:
+            self._refresh(time.monotonic())
+            return dict(self.counters, state=self.state, window_calls=len(self.outcomes))
+
+
+def _breaker(name, label):
+    return CircuitBreaker(
+        name, label,
+        window=config.CIRCUIT_WINDOW,
+        min_calls=config.CIRCUIT_MIN_CALLS,
+        failure_rate=config.CIRCUIT_FAILURE_RATE,
+        open_seconds=config.CIRCUIT_OPEN_SECONDS,
+        probes=config.CIRCUIT_HALF_OPEN_PROBES,
+    )
+
+
+# One breaker per upstream; edits share the image API's. Chat backends each
+# have their own, see chat_router
+breakers = {
+    "image": _breaker("image", "Image generation"),
+    "tts": _breaker("tts", "Text-to-speech"),
+}
+
+
+def reply_if_open(bot, message, name):
+    """Answer at once, without calling the upstream, when its circuit is open"""
+    breaker = breakers[name]
+    if not breaker.is_open():
+        return False
+    bot.reply_to(message, breaker.unavailable_text(), parse_mode="Markdown")
+    return True
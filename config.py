@@ -37,6 +37,15 @@ BOT_NAMES = ["BrahMos", "Brahmos", "brahMos", "brahmos",
 IMAGE_API_URL = "https://api.akashiverse.com/v1/models"
 IMAGE_MODEL = "firebase/imagen-3"
 EDIT_MODEL = "replicate/google/nano-banana"
+# Edits stream the photo from Telegram into the request: "json" embeds it as
+# a base64 data URI, "multipart" uploads the raw file as form data
+EDIT_UPLOAD_MODE = "json"
+EDIT_MULTIPART_URL = "https://api.akashiverse.com/v1/images/edits"
+# Input photos: the smallest Telegram size covering the target is used; if
+# it is still much larger, it is downscaled locally (needs Pillow)
+EDIT_TARGET_SIZE = 1024         # Shorter side needed for a 1024x1024 edit
+EDIT_DOWNSCALE_RATIO = 1.5      # Downscale when the photo exceeds the target by this factor
+EDIT_JPEG_QUALITY = 90          # Quality of the recompressed JPEG
 
 # ==============================================
 # 💬 CHAT API (OpenAI-compatible proxy)
@@ -49,6 +58,56 @@ CHAT_API_BASE = "https://api.akashiverse.com/v1"
 CHAT_API_ENDPOINT = f"{CHAT_API_BASE}/chat/completions"
 CHAT_MODEL = "stream/gpt-5:nostream"
 
+# Chat backends: OpenAI-compatible APIs sharing the chat traffic. Requests
+# are spread by weight, recent time to first token and error rate; a backend
+# that keeps failing is ejected (see CIRCUIT BREAKERS) until a probe succeeds
+CHAT_BACKENDS = [
+    {"name": "akashiverse", "base_url": CHAT_API_BASE, "api_key": API_KEY, "model": CHAT_MODEL, "weight": 1.0},
+    # {"name": "backup", "base_url": "https://example.com/v1", "api_key": "sk-...", "model": "gpt-4o-mini", "weight": 0.5},
+]
+CHAT_ROUTER_EWMA_ALPHA = 0.2      # Weight of the newest call in the latency and error averages
+CHAT_ROUTER_INITIAL_TTFT = 1.0    # Seconds assumed for a backend not timed yet
+CHAT_ROUTER_ERROR_PENALTY = 10.0  # How strongly errors shrink a backend's share
+
+# Hedging: when a chat request has no first byte after the recent p90 time to
+# first byte, an identical second request is sent and the first to answer wins
+CHAT_HEDGING = False
+CHAT_HEDGE_PERCENTILE = 0.9     # Percentile of recent times to first byte used as the delay
+CHAT_HEDGE_MIN_DELAY = 1.0      # Never hedge sooner than this many seconds
+CHAT_HEDGE_INITIAL_DELAY = 3.0  # Delay used until enough requests were timed
+CHAT_HEDGE_MAX_RATE = 0.1       # At most this share of chat requests is sent twice
+
+# Progressive delivery: post the reply as soon as tokens arrive and keep
+# editing it while the stream continues (Telegram allows ~1 edit/s per chat,
+# far less in groups)
+STREAM_REPLIES = True
+STREAM_FIRST_CHUNK_CHARS = 1       # Characters needed before the first message is posted
+STREAM_EDIT_INTERVAL = 1.0         # Seconds between edits in private chats
+STREAM_GROUP_EDIT_INTERVAL = 3.0   # Seconds between edits in groups
+STREAM_MESSAGE_LIMIT = 4000        # Roll over into a new message past this length (hard limit 4096)
+STREAM_CURSOR = " ▌"               # Shown at the end of the text while streaming
+SSE_READ_CHUNK_SIZE = 512          # Max bytes read from the socket per parser step
+
+# Conversation memory: a ring buffer per chat. Idle and least recently used
+# chats leave memory to keep it bounded; with persistence they are compressed
+# into the storage backend and loaded again on their next message
+CONVERSATION_MAX_MESSAGES = 10               # Messages remembered per chat
+CONVERSATION_MAX_BYTES = 64 * 1024 * 1024    # Memory budget across all chats
+CONVERSATION_IDLE_TTL = 30 * 60              # Move chats idle for this many seconds out of memory
+CONVERSATION_PERSIST = True                  # Keep chats on disk (else they are forgotten)
+CONVERSATION_DIR = "conversations"           # Directory used by the JSON storage backend
+CONVERSATION_SNAPSHOT_INTERVAL = 60          # Seconds between snapshots of changed chats
+CONVERSATION_RETENTION = 30 * 24 * 3600      # Delete stored chats unused for this many seconds
+
+# Each chat request is fitted into a token budget: oldest history is trimmed
+# first and folded into a running summary written in the background
+CONTEXT_TOKEN_BUDGET = 3000        # Estimated prompt tokens per request
+CONTEXT_SUMMARIES = True           # Summarize turns that leave the context
+CONTEXT_SUMMARY_EVERY_TURNS = 10   # Turns leaving memory before a summary update, unless the context was trimmed
+CONTEXT_SUMMARY_MAX_TOKENS = 250   # Length limit of the summary
+CONTEXT_SUMMARY_MAX_PENDING = 50   # Queued summary jobs before new ones wait for a later message
+PROMPT_ENHANCE_MAX_TOKENS = 300    # Length limit of a /prompt result (asked for under 500 characters)
+
 # ==============================================
 # 🎤 TEXT-TO-SPEECH API
 # ==============================================
@@ -57,6 +116,13 @@ TTS_API_BASE = "https://reflexai-j0ro.onrender.com/v1"
 TTS_API_ENDPOINT = f"{TTS_API_BASE}/audio/speech"
 TTS_MODEL = "gpt-4o-mini-tts"
 
+# Long texts are split at sentence boundaries and the chunks synthesized in
+# parallel, then joined in order into one voice message
+TTS_MAX_CHARS = 5000                # Longest text accepted by /say
+TTS_CHUNK_CHARS = 500               # Texts above this are chunked; max chunk length
+TTS_CHUNK_WORKERS = 4               # Chunks synthesized at once (across all requests)
+TTS_SEND_FIRST_PART_EARLY = False   # Send the first chunk as soon as it is ready
+
 # ==============================================
 # 🔗 DEVELOPER & COMMUNITY LINKS
 # ==============================================
@@ -99,6 +165,16 @@ FREE_TTS_LIMIT = 100
 PREMIUM_USERS_FILE = "premium_users.json"
 USAGE_DATA_FILE = "usage_data.json"
 
+# Storage backend: "sqlite" (users, premium and usage in one WAL database;
+# the JSON files above are imported once) or "json" (the files above)
+STORAGE_BACKEND = "sqlite"
+SQLITE_DB_FILE = "brahmos.db"
+
+# JSON backend: usage counters are kept in memory and written behind in batches
+USAGE_WRITE_BEHIND = True
+USAGE_FLUSH_INTERVAL = 5.0   # Seconds between background flushes
+USAGE_FLUSH_EVERY = 50       # Flush early after this many changes
+
 # ==============================================
 # 🔧 CONSTANTS
 # ==============================================
@@ -108,3 +184,113 @@ MAX_CAPTION_LENGTH = 1024
 # 🔐 API RATE LIMITS
 # ==============================================
 API_RATE_LIMIT = 60  # 60 requests per minute
+
+# ==============================================
+# 📥 MEDIA DOWNLOADS
+# ==============================================
+# Image and audio bodies are streamed, checked by their first bytes and
+# dropped as soon as they turn out to be something else or too large
+DOWNLOAD_CHUNK_SIZE = 64 * 1024               # Bytes read per step
+DOWNLOAD_MAX_IMAGE_BYTES = 20 * 1024 * 1024   # Largest image accepted
+DOWNLOAD_MAX_AUDIO_BYTES = 20 * 1024 * 1024   # Largest TTS audio accepted
+DOWNLOAD_MAX_JSON_BYTES = 2 * 1024 * 1024     # Largest JSON body accepted from the image API
+
+# ==============================================
+# 🗃️ MEDIA CACHE
+# ==============================================
+# Results are keyed by normalized prompt, model, size and (for edits) the
+# source photo; a repeat is resent by Telegram file_id without an API call
+IMAGE_CACHE_ENABLED = True
+IMAGE_CACHE_MAX_ENTRIES = 5000             # Remembered results (file_ids are tiny)
+IMAGE_CACHE_TTL = 7 * 24 * 3600            # Seconds before an entry is regenerated
+IMAGE_CACHE_DIR = "cache/images"           # Keep bytes on disk to re-upload stale file_ids (None to disable)
+IMAGE_CACHE_DISK_BYTES = 256 * 1024 * 1024  # Disk budget for cached image bytes
+
+# Speech is keyed by text, voice, model, speed and format; a repeated phrase
+# is resent by its voice file_id
+TTS_CACHE_ENABLED = True
+TTS_CACHE_MAX_ENTRIES = 5000
+TTS_CACHE_TTL = 30 * 24 * 3600         # Seconds before an entry is synthesized again
+TTS_CACHE_BYTES = 64 * 1024 * 1024     # Memory budget for cached audio (LRU)
+
+# /prompt results are keyed by the normalized idea and model; a repeated idea
+# is answered from memory without an API call
+PROMPT_CACHE_ENABLED = True
+PROMPT_CACHE_MAX_ENTRIES = 2000
+PROMPT_CACHE_TTL = 7 * 24 * 3600        # Seconds before an idea is enhanced again
+PROMPT_CACHE_BYTES = 4 * 1024 * 1024    # Memory budget for cached texts (LRU)
+
+# Fixed assets (welcome image, ...) are uploaded once; their file_ids are kept here
+STATIC_MEDIA_FILE = "media_ids.json"
+
+# ==============================================
+# ⚙️ WORKER POOLS
+# ==============================================
+# Updates run on a bounded pool per workload class; one chat's jobs of a
+# class run in order, different chats run in parallel
+WORKER_POOL_SIZES = {
+    "chat": 16,   # Chat replies, /prompt, commands and buttons
+    "image": 6,   # /image generation and photo edits
+    "tts": 6,     # /say and TTS input
+}
+WORKER_MAX_PENDING = 500  # Queued jobs per class before new ones are turned away
+
+# Concurrent upstream calls per class; beyond this, premium users are served first
+UPSTREAM_CONCURRENCY = {
+    "chat": 12,
+    "image": 4,
+    "tts": 4,
+}
+UPSTREAM_PREMIUM_HEAD_START = 15.0  # Seconds a premium call jumps ahead; older free calls still go first
+
+# Identical image, edit, TTS and /prompt requests arriving while one is already
+# running wait for it and share its result instead of calling the API again
+SINGLE_FLIGHT_ENABLED = True
+
+# ==============================================
+# 🛡️ CIRCUIT BREAKERS
+# ==============================================
+# The image and TTS upstreams and each chat backend get a breaker: when too
+# many recent calls fail, requests are answered at once with a friendly
+# notice (or sent to another chat backend) instead of waiting out timeouts,
+# and a probe call checks for recovery
+CIRCUIT_WINDOW = 60           # Seconds of call outcomes considered
+CIRCUIT_MIN_CALLS = 5         # Outcomes needed in the window before the circuit can open
+CIRCUIT_FAILURE_RATE = 0.5    # Share of failed calls that opens the circuit
+CIRCUIT_OPEN_SECONDS = 30     # Seconds calls fail fast before a probe is let through
+CIRCUIT_HALF_OPEN_PROBES = 1  # Concurrent probe calls while half-open
+
+# ==============================================
+# 📤 OUTBOUND TELEGRAM QUEUE
+# ==============================================
+# Telegram allows ~30 messages/s overall, ~1/s per chat and ~20/min per group
+OUTBOUND_GLOBAL_RATE = 25       # Calls per second across all chats
+OUTBOUND_CHAT_RATE = 1.0        # Calls per second in a private chat
+OUTBOUND_GROUP_RATE = 0.33      # Calls per second in a group
+OUTBOUND_CHAT_BURST = 3         # Short bursts allowed per chat
+OUTBOUND_WORKERS = 4            # Threads performing Bot API calls
+OUTBOUND_MAX_RETRIES = 3        # Retries after a 429 (waits for Retry-After)
+
+# ==============================================
+# ⏳ LOADING ANIMATIONS
+# ==============================================
+# All loaders are driven by one scheduler thread with a shared edit budget
+LOADER_FRAME_INTERVAL = 0.8             # Seconds between animation frames
+LOADER_GLOBAL_EDITS_PER_SECOND = 8      # Frame edits per second across all chats
+LOADER_CHAT_EDITS_PER_SECOND = 0.5      # Frame edits per second in one chat
+LOADER_CHAT_ACTION_THRESHOLD = 40       # Above this many active loaders, send chat actions instead
+LOADER_CHAT_ACTION_INTERVAL = 4.5       # Seconds between chat actions (they show for ~5s)
+LOADER_EDIT_WORKERS = 2                 # Threads performing the edit requests
+
+# ==============================================
+# 🌐 UPSTREAM HTTP CONNECTION POOLS
+# ==============================================
+# Every upstream host (chat, image, TTS) gets its own keep-alive pool.
+# Other hosts (image download links) share one pool cache.
+HTTP_POOL_CONNECTIONS = 10   # Number of other hosts to keep pools for
+HTTP_POOL_MAXSIZE = 16       # Max idle connections kept per host
+HTTP_POOL_BLOCK = False      # Open extra connections instead of waiting when a pool is busy
+HTTP_TCP_KEEPALIVE = True    # Enable TCP keep-alive probes on pooled sockets
+HTTP_KEEPALIVE_IDLE = 60     # Seconds idle before the first keep-alive probe
+HTTP_KEEPALIVE_INTERVAL = 20 # Seconds between keep-alive probes
+HTTP_WARMUP_ON_START = True  # Pre-open upstream connections at startup
@@ -0,0 +1,78 @@
+import threading
+
+# Tokens added per message by the chat format (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_stats_lock = threading.Lock()
+context_stats = {"requests": 0, "tokens_sent": 0, "tokens_saved": 0, "trimmed_messages": 0}
+
+
+def estimate_tokens(text):
+    """Fast local token estimate.
+
+    English text runs at about four characters per token; other scripts
+    (Devanagari, emoji, ...) are counted as one token per character, which
+    errs on the safe side.
+    """
+    if not text:
+        return 0
+    if text.isascii():
+        return len(text) // 4 + 1
+    ascii_chars = len(text.encode("ascii", "ignore"))
+    return ascii_chars // 4 + (len(text) - ascii_chars) + 1
+
+
+def message_tokens(message):
+    return estimate_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+
+def build_context(system_prompt, history, summary, current, budget):
+    """Assemble the messages of a chat request within a token budget.
+
+    The system prompt and the current message are always sent. The summary
+    of older turns comes next, then as much history as fits, newest first,
+    starting at a user turn. Returns ``(messages, trimmed)``, where
+    ``trimmed`` is the number of oldest history messages left out.
+    """
+    system = {"role": "system", "content": system_prompt}
+    used = message_tokens(system) + message_tokens(current)
+    full = used + sum(message_tokens(message) for message in history)
+
+    summary_message = None
+    if summary:
+        summary_message = {"role": "system", "content": f"Summary of the earlier conversation: {summary}"}
+        cost = message_tokens(summary_message)
+        full += cost
+        if used + cost <= budget:
+            used += cost
+        else:
+            summary_message = None
+
+    kept = []
+    for message in reversed(history):
+        cost = message_tokens(message)
+        if used + cost > budget:
+            break
+        kept.append(message)
+        used += cost
+    kept.reverse()
+    # Don't open the history with an answer whose question was cut off
+    while kept and kept[0]["role"] != "user":
+        used -= message_tokens(kept.pop(0))
+    trimmed = len(history) - len(kept)
+
+    messages = [system]
+    if summary_message:
+        messages.append(summary_message)
+    messages.extend(kept)
+    messages.append(current)
+
+    with _stats_lock:
+        context_stats["requests"] += 1
+        context_stats["tokens_sent"] += used
+        context_stats["tokens_saved"] += full - used
+        context_stats["trimmed_messages"] += trimmed
+    if trimmed or summary_message:
+        print(f"[DEBUG] Context: ~{used} tokens sent, ~{full - used} saved "
+              f"({trimmed} old messages trimmed{', summary included' if summary_message else ''})")
+    return messages, trimmed
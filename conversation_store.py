@@ -0,0 +1,324 @@
+import atexit
+import json
+import sys
+import threading
+import time
+import zlib
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+import config
+
+# Rough per-message overhead of the dict and deque slot, on top of the text
+_MESSAGE_OVERHEAD = sys.getsizeof({"role": "", "content": ""}) + 8
+
+
+# _get() result when the chat may be in the archive but has not been read yet
+_NOT_LOADED = object()
+
+
+def _message_size(message):
+    return sys.getsizeof(message["content"]) + _MESSAGE_OVERHEAD
+
+
+class _ChatHistory:
+    __slots__ = ("messages", "size", "last_used", "summary", "folded", "dirty")
+
+    def __init__(self, max_messages):
+        self.messages = deque(maxlen=max_messages)
+        self.size = 0
+        self.last_used = time.monotonic()
+        self.summary = ""
+        self.folded = []  # Messages waiting to be folded into the summary
+        self.dirty = False  # Changed since it was last written to the archive
+
+    def pack(self):
+        """Compressed form written to the archive"""
+        data = {"messages": list(self.messages), "summary": self.summary, "folded": self.folded}
+        return zlib.compress(json.dumps(data, separators=(",", ":")).encode("utf-8"))
+
+    @classmethod
+    def unpack(cls, blob, max_messages):
+        data = json.loads(zlib.decompress(blob))
+        chat = cls(max_messages)
+        chat.messages.extend(data.get("messages", []))
+        chat.summary = data.get("summary", "")
+        chat.folded = data.get("folded", [])
+        chat.size = sum(_message_size(m) for m in chat.messages) + sys.getsizeof(chat.summary)
+        return chat
+
+
+class ConversationStore:
+    """Bounded per-chat conversation history shared by all handler threads.
+
+    Each chat keeps its last ``max_messages`` messages in a ring buffer.
+    Chats are kept in LRU order. Chats idle for longer than ``idle_ttl``
+    seconds, and least recently used chats while the total size is above
+    ``max_bytes``, leave memory, so it only holds the active chats.
+
+    With an ``archive`` (a storage backend), chats leaving memory are
+    compressed and written to disk and loaded again on their next message,
+    and changed chats are snapshotted every ``snapshot_interval`` seconds and
+    at exit, so a restart keeps every conversation. Without one they are
+    dropped.
+
+    With ``fold_dropped``, messages leaving a chat's ring buffer are kept
+    aside until take_folded() hands them to the summarizer.
+    """
+
+    def __init__(self, max_messages, max_bytes, idle_ttl, fold_dropped=False,
+                 archive=None, snapshot_interval=None, retention=None):
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        self.fold_dropped = fold_dropped
+        self.archive = archive
+        self.lock = threading.Lock()
+        self.archive_lock = threading.Lock()  # Keeps archive writes in order
+        self.chats = OrderedDict()  # chat_id -> _ChatHistory, least recently used first
+        self.spilling = {}  # chat_id -> chat leaving memory, until it is written
+        self.total_bytes = 0
+        self.counters = {"evicted": 0, "loaded": 0, "written": 0}
+
+        if archive is not None:
+            if retention:
+                archive.prune_conversations(time.time() - retention)
+            if snapshot_interval:
+                threading.Thread(target=self._snapshot_loop, args=(snapshot_interval,),
+                                 daemon=True, name="conversation-snapshot").start()
+            atexit.register(self.snapshot)
+
+    def _get(self, chat_id, create=False, loaded=_NOT_LOADED):
+        """Resident history of a chat, or the one ``loaded`` from the archive (lock held).
+
+        Returns _NOT_LOADED if the chat has to be read from the archive first.
+        """
+        chat = self.chats.get(chat_id)
+        if chat is None:
+            chat = self.spilling.get(chat_id)
+            if chat is None:
+                if loaded is _NOT_LOADED:
+                    if self.archive is not None:
+                        return _NOT_LOADED
+                    loaded = None
+                chat = loaded
+            if chat is None:
+                if not create:
+                    return None
+                chat = _ChatHistory(self.max_messages)
+            self.chats[chat_id] = chat
+            self.total_bytes += chat.size
+        chat.last_used = time.monotonic()
+        self.chats.move_to_end(chat_id)
+        return chat
+
+    def _load(self, chat_id):
+        """Read a chat from the archive, without the lock"""
+        try:
+            blob = self.archive.load_conversation(chat_id)
+            if blob is None:
+                return None
+            chat = _ChatHistory.unpack(blob, self.max_messages)
+        except Exception as e:
+            print(f"[DEBUG] Failed to load conversation {chat_id}: {e}")
+            return None
+        with self.lock:
+            self.counters["loaded"] += 1
+        return chat
+
+    @contextmanager
+    def _chat(self, chat_id, create=False):
+        """Yield the chat's resident history (None if unknown) with the lock held.
+
+        A chat that left memory is read from the archive without the lock;
+        if another thread brought it back meanwhile, that copy wins.
+        """
+        loaded = _NOT_LOADED
+        while True:
+            with self.lock:
+                if loaded is not _NOT_LOADED and self.counters["written"] != written:
+                    loaded = _NOT_LOADED  # Archived again while it was read; read it again
+                chat = self._get(chat_id, create, loaded)
+                if chat is not _NOT_LOADED:
+                    yield chat
+                    return
+                written = self.counters["written"]
+            loaded = self._load(chat_id)
+
+    def history(self, chat_id, limit=None):
+        """The chat's most recent messages (at most ``limit``), oldest first"""
+        with self._chat(chat_id) as chat:
+            messages = list(chat.messages) if chat is not None else []
+        return messages[-limit:] if limit else messages
+
+    def context(self, chat_id):
+        """The chat's messages, oldest first, and the summary of older turns"""
+        with self._chat(chat_id) as chat:
+            if chat is None:
+                return [], ""
+            return list(chat.messages), chat.summary
+
+    def _drop_oldest(self, chat):
+        message = chat.messages.popleft()
+        size = _message_size(message)
+        chat.size -= size
+        self.total_bytes -= size
+        if self.fold_dropped:
+            chat.folded.append(message)
+
+    def fold(self, chat_id, count):
+        """Move the chat's ``count`` oldest messages out of its history, to be summarized"""
+        with self.lock:
+            chat = self.chats.get(chat_id)
+            if chat is None:
+                return
+            for _ in range(min(count, len(chat.messages))):
+                self._drop_oldest(chat)
+            chat.dirty = True
+
+    def take_folded(self, chat_id, min_count=1):
+        """Messages folded out of the chat, once there are at least ``min_count``"""
+        with self.lock:
+            chat = self.chats.get(chat_id)
+            if chat is None or len(chat.folded) < min_count:
+                return None
+            folded, chat.folded = chat.folded, []
+            chat.dirty = True
+            return folded
+
+    def summary(self, chat_id):
+        with self._chat(chat_id) as chat:
+            return chat.summary if chat is not None else ""
+
+    def set_summary(self, chat_id, summary):
+        """Replace the summary of the chat's older turns, loading the chat back if it left memory"""
+        with self._chat(chat_id, create=True) as chat:
+            delta = sys.getsizeof(summary) - sys.getsizeof(chat.summary)
+            chat.summary = summary
+            chat.size += delta
+            chat.dirty = True
+            self.total_bytes += delta
+
+    def append(self, chat_id, *messages):
+        """Add messages to the chat's history, dropping its oldest ones past the limit"""
+        with self._chat(chat_id, create=True) as chat:
+            for message in messages:
+                if len(chat.messages) == chat.messages.maxlen:
+                    self._drop_oldest(chat)
+                size = _message_size(message)
+                chat.messages.append(message)
+                chat.size += size
+                self.total_bytes += size
+            chat.dirty = True
+            self._evict(chat.last_used, keep=chat_id)
+        self._write_spilled()
+
+    def clear(self, chat_id):
+        with self.lock:
+            chat = self.chats.pop(chat_id, None)
+            if chat is not None:
+                self.total_bytes -= chat.size
+            if self.archive is not None:
+                # Overwrite whatever the archive holds with an empty history
+                empty = _ChatHistory(self.max_messages)
+                empty.dirty = True
+                self.spilling[chat_id] = empty
+        self._write_spilled()
+
+    def _evict(self, now, keep=None):
+        """Move idle chats, then LRU chats over the byte budget, out of memory (lock held)"""
+        while self.chats:
+            chat_id, chat = next(iter(self.chats.items()))
+            if chat_id == keep:
+                break
+            idle = self.idle_ttl and now - chat.last_used > self.idle_ttl
+            if not idle and self.total_bytes <= self.max_bytes:
+                break
+            del self.chats[chat_id]
+            self.total_bytes -= chat.size
+            self.counters["evicted"] += 1
+            if self.archive is not None and chat.dirty:
+                self.spilling[chat_id] = chat
+
+    def _write(self, chats):
+        """Compress and write ``chats`` (chat_id -> chat); returns False on failure"""
+        with self.lock:
+            items = []
+            for chat_id, chat in chats.items():
+                items.append((chat_id, chat.pack()))
+                chat.dirty = False
+        try:
+            self.archive.save_conversations(items)
+            with self.lock:
+                self.counters["written"] += len(items)
+            return True
+        except Exception as e:
+            print(f"[DEBUG] Failed to write {len(items)} conversations: {e}")
+            with self.lock:
+                for chat in chats.values():
+                    chat.dirty = True
+            return False
+
+    def _write_spilled(self):
+        """Write chats that left memory, then let go of them"""
+        if not self.spilling:
+            return
+        with self.archive_lock:
+            with self.lock:
+                pending = dict(self.spilling)
+            if not pending or not self._write(pending):
+                return
+            with self.lock:
+                for chat_id, chat in pending.items():
+                    # A chat that came back meanwhile stays resident instead
+                    if self.spilling.get(chat_id) is chat:
+                        del self.spilling[chat_id]
+
+    def snapshot(self):
+        """Write every changed resident chat to the archive"""
+        if self.archive is None:
+            return
+        self._write_spilled()
+        with self.archive_lock:
+            with self.lock:
+                dirty = {chat_id: chat for chat_id, chat in self.chats.items() if chat.dirty}
+            if dirty:
+                self._write(dirty)
+
+    def _snapshot_loop(self, interval):
+        while True:
+            time.sleep(interval)
+            with self.lock:
+                self._evict(time.monotonic())
+            self.snapshot()
+
+    def stats(self):
+        with self.lock:
+            self._evict(time.monotonic())
+            stats = dict(self.counters,
+                         chats=len(self.chats),
+                         messages=sum(len(chat.messages) for chat in self.chats.values()),
+                         bytes=self.total_bytes)
+        self._write_spilled()
+        if self.archive is not None:
+            stats["archived"] = self.archive.count_conversations()
+        return stats
+
+
+def _archive():
+    if not config.CONVERSATION_PERSIST:
+        return None
+    from storage import get_storage
+    return get_storage()
+
+
+# Global conversation memory
+conversation_store = ConversationStore(
+    max_messages=config.CONVERSATION_MAX_MESSAGES,
+    max_bytes=config.CONVERSATION_MAX_BYTES,
+    idle_ttl=config.CONVERSATION_IDLE_TTL,
+    fold_dropped=config.CONTEXT_SUMMARIES,
+    archive=_archive(),
+    snapshot_interval=config.CONVERSATION_SNAPSHOT_INTERVAL,
+    retention=config.CONVERSATION_RETENTION,
+)
@@ -0,0 +1,103 @@
+import config
+
+# Media types recognised from their first bytes
+IMAGE_KINDS = frozenset({"png", "jpeg", "webp", "gif"})
+AUDIO_KINDS = frozenset({"mp3", "ogg", "wav", "flac"})
+
+SNIFF_BYTES = 12
+
+
+class DownloadRejected(Exception):
+    """The body is not the expected media type or is larger than allowed"""
+
+
+def sniff_media(head):
+    """Media kind from the first bytes of a body, "json" for JSON, else None"""
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    if head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+        return "wav"
+    if head.startswith((b"GIF87a", b"GIF89a")):
+        return "gif"
+    if head.startswith(b"ID3") or (len(head) >= 2 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0):
+        return "mp3"  # ID3 tag or a bare MPEG audio frame sync
+    if head.startswith(b"OggS"):
+        return "ogg"
+    if head.startswith(b"fLaC"):
+        return "flac"
+    if head.lstrip()[:1] in (b"{", b"["):
+        return "json"
+    return None
+
+
+def read_response(response, allowed, max_bytes, allow_json=False,
+                  json_max_bytes=None, chunk_size=None):
+    """Stream a response body into one buffer, checking its type on the way.
+
+    The response must have been requested with ``stream=True``. Its type is
+    sniffed from the first bytes; bodies of another type, or larger than
+    ``max_bytes`` (``json_max_bytes`` for JSON), are rejected as soon as that
+    is known, without reading the rest. The body is collected into a single
+    bytearray, preallocated from Content-Length when the server sends one.
+
+    Returns ``(kind, data)``; raises DownloadRejected.
+    """
+    if json_max_bytes is None:
+        json_max_bytes = config.DOWNLOAD_MAX_JSON_BYTES
+    chunk_size = chunk_size or config.DOWNLOAD_CHUNK_SIZE
+    try:
+        declared = int(response.headers.get("Content-Length") or -1)
+    except ValueError:
+        declared = -1
+    if declared > max(max_bytes, json_max_bytes if allow_json else 0):
+        response.close()
+        raise DownloadRejected(f"body of {declared} bytes exceeds the limit")
+
+    kind, limit = None, max_bytes
+    buffer = bytearray(declared) if declared > 0 else bytearray()
+    view = memoryview(buffer) if declared > 0 else None
+    size = 0
+    try:
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            if not chunk:
+                continue
+            end = size + len(chunk)
+            if kind is None and end >= SNIFF_BYTES:
+                head = bytes(buffer[:size]) + chunk[:SNIFF_BYTES]
+                kind = _check_kind(head, allowed, allow_json)
+                limit = json_max_bytes if kind == "json" else max_bytes
+            if end > limit:
+                raise DownloadRejected(f"body exceeds {limit} bytes")
+            if view is not None and end <= declared:
+                view[size:end] = chunk
+            else:
+                # No or wrong Content-Length (e.g. decompressed body): grow instead
+                if view is not None:
+                    view.release()
+                    view = None
+                    del buffer[size:]
+                buffer += chunk
+            size = end
+        if kind is None:
+            kind = _check_kind(bytes(buffer[:size]), allowed, allow_json)
+    except BaseException:
+        response.close()
+        raise
+    finally:
+        if view is not None:
+            view.release()
+    del buffer[size:]
+    return kind, buffer
+
+
+def _check_kind(head, allowed, allow_json):
+    kind = sniff_media(head)
+    if kind == "json" and allow_json:
+        return kind
+    if kind not in allowed:
+        raise DownloadRejected(f"unexpected content (starts with {head[:8]!r})")
+    return kind
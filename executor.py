@@ -0,0 +1,95 @@
+import functools
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+
+
+class ChatExecutor:
+    """Bounded worker pools per workload class with per-chat ordering.
+
+    Each workload class (chat, image, tts) has its own pool, so a slow image
+    never holds up a chat reply. Within a class, jobs of the same chat run
+    one after another in arrival order, while different chats run in parallel.
+    """
+
+    def __init__(self, pool_sizes, max_pending):
+        self.max_pending = max_pending
+        self.lock = threading.Lock()
+        self.pools = {name: ThreadPoolExecutor(max_workers=size, thread_name_prefix=f"{name}-worker")
+                      for name, size in pool_sizes.items()}
+        self.chains = {}  # (workload, chat_id) -> deque of waiting jobs
+        self.counters = {name: {"queued": 0, "running": 0, "completed": 0, "rejected": 0}
+                         for name in pool_sizes}
+        self.on_reject = None
+
+    def submit(self, workload, chat_id, fn, *args, **kwargs):
+        """Queue ``fn`` for a chat; returns False if the workload class is saturated"""
+        key = (workload, chat_id)
+        job = (fn, args, kwargs)
+        with self.lock:
+            counters = self.counters[workload]
+            if counters["queued"] >= self.max_pending:
+                counters["rejected"] += 1
+                return False
+            counters["queued"] += 1
+            chain = self.chains.get(key)
+            if chain is not None:
+                # This chat already has a job in flight, run after it
+                chain.append(job)
+                return True
+            self.chains[key] = deque()
+        self.pools[workload].submit(self._run, key, job)
+        return True
+
+    def _run(self, key, job):
+        workload = key[0]
+        counters = self.counters[workload]
+        with self.lock:
+            counters["queued"] -= 1
+            counters["running"] += 1
+        fn, args, kwargs = job
+        try:
+            fn(*args, **kwargs)
+        except Exception as e:
+            print(f"[DEBUG] {workload} job failed: {e}")
+        finally:
+            with self.lock:
+                counters["running"] -= 1
+                counters["completed"] += 1
+                chain = self.chains[key]
+                next_job = chain.popleft() if chain else None
+                if next_job is None:
+                    del self.chains[key]
+            if next_job is not None:
+                # Back through the pool so other chats get their turn
+                self.pools[workload].submit(self._run, key, next_job)
+
+    def stats(self):
+        with self.lock:
+            return {name: dict(counters, workers=self.pools[name]._max_workers)
+                    for name, counters in self.counters.items()}
+
+
+def _chat_id_of(update):
+    """Chat id of a Message or CallbackQuery"""
+    message = getattr(update, "message", None) if not hasattr(update, "chat") else update
+    return message.chat.id if message is not None else None
+
+
+def runs_in(workload):
+    """Decorator: run a telebot handler on the given workload pool instead of inline"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(update, *args, **kwargs):
+            if not executor.submit(workload, _chat_id_of(update), fn, update, *args, **kwargs):
+                print(f"[DEBUG] {workload} queue full, rejecting update")
+                if executor.on_reject:
+                    executor.on_reject(workload, update)
+        return wrapper
+    return decorator
+
+
+# Global execution engine shared by all handlers
+executor = ChatExecutor(config.WORKER_POOL_SIZES, config.WORKER_MAX_PENDING)
@@ -0,0 +1,143 @@
+import queue
+import threading
+import time
+from collections import deque
+
+import config
+from http_client import abort_response
+
+
+class RequestHedger:
+    """Hedged requests: a second identical request when the first one stalls.
+
+    ``run(start)`` calls ``start()`` in a worker thread; ``start`` sends the
+    request and returns once the first body bytes are in. If nothing arrived after the ``percentile`` time-to-first-byte of
+    recent requests (never less than ``min_delay``; ``initial_delay`` until
+    enough samples are known), a second attempt is started. The first one
+    with bytes wins and the other is aborted and its connection closed.
+
+    Every request earns ``max_rate`` hedge credit and each hedge spends one,
+    so at most that share of requests is ever sent twice.
+    """
+
+    MIN_SAMPLES = 20
+
+    def __init__(self, name, percentile, min_delay, initial_delay, max_rate, samples=200):
+        self.name = name
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.initial_delay = initial_delay
+        self.max_rate = max_rate
+        self.lock = threading.Lock()
+        self.ttfb = deque(maxlen=samples)  # Recent times to first byte, in seconds
+        self.credit = 1.0
+        self.counters = {"requests": 0, "hedged": 0, "hedge_wins": 0, "over_budget": 0}
+
+    def threshold(self):
+        """Seconds to wait for a first byte before hedging"""
+        with self.lock:
+            if len(self.ttfb) < self.MIN_SAMPLES:
+                return self.initial_delay
+            ordered = sorted(self.ttfb)
+        return max(self.min_delay, ordered[min(len(ordered) - 1, int(len(ordered) * self.percentile))])
+
+    def _take_credit(self):
+        with self.lock:
+            if self.credit >= 1.0:
+                self.credit -= 1.0
+                self.counters["hedged"] += 1
+                return True
+            self.counters["over_budget"] += 1
+            return False
+
+    def _launch(self, start, results, hedge):
+        attempt = {"hedge": hedge, "response": None, "cancelled": False, "started": time.monotonic()}
+
+        def run():
+            try:
+                results.put((attempt, start(attempt), None))
+            except Exception as e:
+                results.put((attempt, None, e))
+
+        threading.Thread(target=run, daemon=True, name=f"{self.name}-hedge" if hedge else self.name).start()
+        return attempt
+
+    def opened(self, attempt, response):
+        """Called by ``start`` as soon as its response exists, so a losing attempt can be aborted.
+
+        Returns False if the attempt already lost; the response is then closed.
+        """
+        with self.lock:
+            attempt["response"] = response
+            cancelled = attempt["cancelled"]
+        if cancelled:
+            abort_response(response)
+        return not cancelled
+
+    def _cancel(self, attempts, winner):
+        for attempt in attempts:
+            if attempt is winner:
+                continue
+            with self.lock:
+                attempt["cancelled"] = True
+                response = attempt["response"]
+            if response is not None:
+                abort_response(response)
+
+    def run(self, start):
+        """Result of ``start`` for the attempt that produced bytes first"""
+        with self.lock:
+            self.counters["requests"] += 1
+            self.credit = min(self.credit + self.max_rate, 1.0 + self.max_rate)
+        results = queue.Queue()
+        attempts = [self._launch(start, results, hedge=False)]
+        deadline = attempts[0]["started"] + self.threshold()
+        can_hedge = True
+        pending = 1
+        error = None
+
+        while True:
+            timeout = max(0.0, deadline - time.monotonic()) if can_hedge else None
+            try:
+                attempt, result, e = results.get(timeout=timeout)
+            except queue.Empty:
+                can_hedge = False
+                if self._take_credit():
+                    print(f"[DEBUG] {self.name}: no first byte after {self.threshold():.2f}s, hedging")
+                    attempts.append(self._launch(start, results, hedge=True))
+                    pending += 1
+                continue
+
+            pending -= 1
+            if e is not None:
+                error = error or e
+                if pending == 0:
+                    # Every attempt started so far failed; a failure is not hedged
+                    raise error
+                continue
+
+            now = time.monotonic()
+            self._cancel(attempts, attempt)
+            with self.lock:
+                self.ttfb.append(now - attempt["started"])
+                if attempt["hedge"]:
+                    self.counters["hedge_wins"] += 1
+                    # The stalled first attempt took at least this long; keep the tail in the samples
+                    self.ttfb.append(now - attempts[0]["started"])
+            return result
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+        stats["threshold"] = self.threshold()
+        return stats
+
+
+# Chat completions, the latency users notice most
+chat_hedger = RequestHedger(
+    "chat",
+    percentile=config.CHAT_HEDGE_PERCENTILE,
+    min_delay=config.CHAT_HEDGE_MIN_DELAY,
+    initial_delay=config.CHAT_HEDGE_INITIAL_DELAY,
+    max_rate=config.CHAT_HEDGE_MAX_RATE,
+)
@@ -0,0 +1,198 @@
+import socket
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+import config
+
+
+def _keepalive_socket_options():
+    """TCP keep-alive options so idle pooled connections survive NAT/proxy timeouts"""
+    options = list(HTTPConnection.default_socket_options)
+    if not config.HTTP_TCP_KEEPALIVE:
+        return options
+    options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+    if hasattr(socket, "TCP_KEEPIDLE"):
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, config.HTTP_KEEPALIVE_IDLE))
+    if hasattr(socket, "TCP_KEEPINTVL"):
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, config.HTTP_KEEPALIVE_INTERVAL))
+    return options
+
+
+class _ConnectStats:
+    """Thread-safe per-host counters of requests sent and sockets opened"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = {}
+        self.connects = {}
+
+    def record_request(self, host):
+        with self._lock:
+            self.requests[host] = self.requests.get(host, 0) + 1
+
+    def record_connect(self, host):
+        with self._lock:
+            self.connects[host] = self.connects.get(host, 0) + 1
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.requests), dict(self.connects)
+
+
+connect_stats = _ConnectStats()
+
+
+class CountingHTTPConnection(HTTPConnection):
+    def connect(self):
+        super().connect()
+        connect_stats.record_connect((self.host or "").lower())
+
+
+class CountingHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        super().connect()
+        connect_stats.record_connect((self.host or "").lower())
+
+
+class CountingHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = CountingHTTPConnection
+
+
+class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = CountingHTTPSConnection
+
+
+class PooledAdapter(HTTPAdapter):
+    """HTTPAdapter with TCP keep-alive sockets and connect counting"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["socket_options"] = _keepalive_socket_options()
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": CountingHTTPConnectionPool,
+            "https": CountingHTTPSConnectionPool,
+        }
+
+
+def abort_response(response):
+    """Close a streaming response now, even while another thread is blocked reading it.
+
+    The socket is shut down first: closing alone doesn't wake a blocked
+    read, and the connection is not returned to the pool.
+    """
+    # raw (urllib3) -> _fp (http.client) -> fp (buffered reader) -> raw (SocketIO) -> _sock
+    reader = getattr(getattr(response.raw, "_fp", None), "fp", None)
+    sock = getattr(getattr(reader, "raw", None), "_sock", None)
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+    response.close()
+
+
+class UpstreamClient:
+    """Shared keep-alive HTTP client with a dedicated connection pool per upstream host"""
+
+    def __init__(self, upstream_urls=(), pool_connections=10, pool_maxsize=10):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._upstream_hosts = []
+        for url in upstream_urls:
+            host = self._host_key(url)
+            if host not in self._upstream_hosts:
+                self._upstream_hosts.append(host)
+        # Anything that is not a known upstream (image CDN links, etc.) shares one session
+        self._fallback = self._new_session(pool_connections)
+
+    @staticmethod
+    def _host_key(url):
+        parts = urlsplit(url)
+        return f"{parts.scheme}://{parts.netloc}".lower()
+
+    def _new_session(self, pool_connections):
+        session = requests.Session()
+        adapter = PooledAdapter(pool_connections=pool_connections,
+                                pool_maxsize=self.pool_maxsize,
+                                pool_block=config.HTTP_POOL_BLOCK)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def session_for(self, url):
+        """Return the pooled session serving the host of ``url``"""
+        host = self._host_key(url)
+        if host not in self._upstream_hosts:
+            return self._fallback
+        session = self._sessions.get(host)
+        if session is None:
+            with self._lock:
+                session = self._sessions.get(host)
+                if session is None:
+                    session = self._new_session(1)
+                    self._sessions[host] = session
+        return session
+
+    def request(self, method, url, **kwargs):
+        connect_stats.record_request((urlsplit(url).hostname or "").lower())
+        return self.session_for(url).request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def warm_up(self, timeout=5):
+        """Open one connection to every upstream host so the first user request skips the handshake"""
+        for host in self._upstream_hosts:
+            try:
+                resp = self.request("HEAD", host, timeout=timeout, allow_redirects=False)
+                resp.close()
+                print(f"[DEBUG] Warmed up connection to {host}")
+            except Exception as e:
+                print(f"[DEBUG] Warm-up failed for {host}: {e}")
+
+    def warm_up_async(self, timeout=5):
+        thread = threading.Thread(target=self.warm_up, args=(timeout,), daemon=True)
+        thread.start()
+        return thread
+
+    def get_stats(self):
+        """Connection reuse counters per host plus a combined total"""
+        requests_by_host, connects_by_host = connect_stats.snapshot()
+
+        stats = {}
+        total_requests = total_new = 0
+        for host in sorted(set(requests_by_host) | set(connects_by_host)):
+            reqs = requests_by_host.get(host, 0)
+            new = connects_by_host.get(host, 0)
+            stats[host] = {"requests": reqs, "new_connections": new,
+                           "reused": max(0, reqs - new)}
+            total_requests += reqs
+            total_new += new
+
+        reused = max(0, total_requests - total_new)
+        stats["total"] = {
+            "requests": total_requests,
+            "new_connections": total_new,
+            "reused": reused,
+            "reuse_ratio": (reused / total_requests) if total_requests else 0.0,
+        }
+        return stats
+
+
+# Global upstream client shared by every handler
+upstream = UpstreamClient(
+    upstream_urls=[*(backend["base_url"] for backend in config.CHAT_BACKENDS),
+                   config.IMAGE_API_URL, config.TTS_API_BASE],
+    pool_connections=config.HTTP_POOL_CONNECTIONS,
+    pool_maxsize=config.HTTP_POOL_MAXSIZE,
+)
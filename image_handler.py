@@ -3,6 +3,14 @@ import re
 import json
 import requests
 import config
+from circuit_breaker import breakers, reply_if_open
+from downloads import IMAGE_KINDS, read_response
+from http_client import upstream
+from photo_ingest import open_edit_photo, pick_photo_size
+from uploads import BytesSource, json_data_uri_body, multipart_body
+from media_cache import image_cache, normalize_text, sent_file_id
+from scheduler import upstream_scheduler
+from singleflight import single_flight
 from utils import AnimatedLoader
 
 # ---------- MarkdownV2 escaping ----------
@@ -16,13 +24,15 @@ def escape_markdown_v2(text: str) -> str:
     text = text.replace("\\", "\\\\")
     return re.sub(f"([{MDV2_CHARS}])", r"\\\1", text)
 
+IMAGE_SIZE = "1024x1024"
+
 def truncate(text: str, limit: int = 1024) -> str:
     if text is None:
         return ""
     return text if len(text) <= limit else text[: limit - 3] + "..."
 
 # ---------- API call ----------
-def generate_image(full_prompt: str, bot=None, chat_id=None):
+def generate_image(full_prompt: str, bot=None, chat_id=None, user_id=None):
     """
     Always send the FULL prompt to the API using Imagen3 model.
     Returns image bytes or None.
@@ -38,7 +48,7 @@ def generate_image(full_prompt: str, bot=None, chat_id=None):
             "model": config.IMAGE_MODEL,
             "prompt": full_prompt,
             "response_format": "url",
-            "size": "1024x1024"
+            "size": IMAGE_SIZE
         }
 
         headers = {
@@ -46,37 +56,25 @@ def generate_image(full_prompt: str, bot=None, chat_id=None):
             "Authorization": f"Bearer {config.API_KEY}"
         }
 
-        # Use POST with JSON payload for new API
-        resp = requests.post(
-            config.IMAGE_API_URL,
-            json=payload,
-            headers=headers,
-            timeout=120,
-        )
-        
-        print(f"[DEBUG] Image API response status: {resp.status_code}")
-        
-        if resp.status_code == 200:
-            # Try to parse JSON response first
-            try:
-                response_data = resp.json()
-                if "data" in response_data and len(response_data["data"]) > 0:
-                    image_url = response_data["data"][0].get("url")
-                    if image_url:
-                        # Download the image from the URL
-                        img_resp = requests.get(image_url, timeout=60)
-                        if img_resp.status_code == 200:
-                            return img_resp.content
-                        else:
-                            print(f"[DEBUG] Failed to download image from URL: {img_resp.status_code}")
-            except json.JSONDecodeError:
-                pass
-            
-            # Fallback: check if response contains image data directly
-            if _looks_like_image(resp):
-                return resp.content
-
-        return None
+        def request():
+            with breakers["image"].guard() as attempt:
+                # Use POST with JSON payload for new API. The slot is held
+                # until the body and any image URL it names are read
+                with upstream_scheduler.slot("image", user_id):
+                    resp = upstream.post(
+                        config.IMAGE_API_URL,
+                        json=payload,
+                        headers=headers,
+                        timeout=120,
+                        stream=True,
+                    )
+
+                    print(f"[DEBUG] Image API response status: {resp.status_code}")
+                    attempt.status(resp.status_code)
+                    return read_image_response(resp, "image")
+
+        # The same prompt already being generated is waited for, not requested again
+        return single_flight.do("image", (config.IMAGE_MODEL, IMAGE_SIZE, normalize_text(full_prompt)), request)
     except requests.exceptions.Timeout:
         print("[DEBUG] Image generation timeout")
         return None
@@ -90,21 +88,57 @@ def generate_image(full_prompt: str, bot=None, chat_id=None):
         if loader:
             loader.stop()
 
-def _looks_like_image(resp: requests.Response) -> bool:
-    if not resp or resp.status_code != 200:
-        return False
-    ctype = (resp.headers.get("Content-Type") or "").lower()
-    if ctype.startswith("image/"):
-        return True
-    # Accept large binary that is not JSON
-    return len(resp.content or b"") > 1000 and not ctype.startswith("application/json")
+def read_image_response(resp: requests.Response, label: str = "image"):
+    """Image bytes from an image API response (requested with stream=True).
+
+    The API answers with JSON holding an image URL, or with the image itself.
+    Bodies are streamed with a size cap and checked by their first bytes, so
+    error pages or oversized payloads are dropped without being buffered.
+    """
+    if resp.status_code != 200:
+        resp.close()
+        return None
+    kind, body = read_response(resp, IMAGE_KINDS, config.DOWNLOAD_MAX_IMAGE_BYTES, allow_json=True)
+    if kind != "json":
+        return body
+
+    response_data = json.loads(body)
+    data = response_data.get("data") if isinstance(response_data, dict) else None
+    image_url = data[0].get("url") if data and isinstance(data[0], dict) else None
+    if not image_url:
+        print(f"[DEBUG] {label.capitalize()} API returned no image URL")
+        return None
+
+    # Download the image from the URL
+    img_resp = upstream.get(image_url, timeout=60, stream=True)
+    if img_resp.status_code != 200:
+        print(f"[DEBUG] Failed to download {label} from URL: {img_resp.status_code}")
+        img_resp.close()
+        return None
+    _, image = read_response(img_resp, IMAGE_KINDS, config.DOWNLOAD_MAX_IMAGE_BYTES)
+    return image
+
+# ---------- Cache ----------
+def image_cache_key(model: str, prompt: str, source_id: str = None):
+    """Cache key of an image result, or None when the cache is disabled"""
+    if not config.IMAGE_CACHE_ENABLED:
+        return None
+    return image_cache.make_key(model, IMAGE_SIZE, source_id, normalize_text(prompt))
+
+def cached_image(key):
+    """Cached file_id or bytes for ``key``, or None"""
+    return image_cache.lookup(key) if key else None
 
 # ---------- Telegram send helpers ----------
-def safe_send_photo(bot, chat_id, image_bytes: bytes, caption: str, reply_to=None):
+def safe_send_photo(bot, chat_id, photo, caption: str, reply_to=None):
+    """Send image bytes or a Telegram file_id; returns the sent message or None"""
+    def as_input():
+        return photo if isinstance(photo, str) else io.BytesIO(photo)
+
     try:
-        bot.send_photo(
+        return bot.send_photo(
             chat_id,
-            io.BytesIO(image_bytes),
+            as_input(),
             caption=caption,
             parse_mode="MarkdownV2",
             reply_to_message_id=reply_to,
@@ -113,15 +147,37 @@ def safe_send_photo(bot, chat_id, image_bytes: bytes, caption: str, reply_to=Non
         print(f"[DEBUG] Failed to send photo: {e}")
         # Fallback: send without parse_mode
         try:
-            bot.send_photo(
+            return bot.send_photo(
                 chat_id,
-                io.BytesIO(image_bytes),
+                as_input(),
                 caption=caption.replace("\\", ""),  # loosen escaping on fallback
                 reply_to_message_id=reply_to,
             )
         except Exception as e2:
             print(f"[DEBUG] Fallback photo send failed: {e2}")
+            if isinstance(photo, str):
+                return None  # Caller falls back to the bytes
             bot.send_message(chat_id, f"❌ Failed to send image\nError: {e2}")
+            return None
+
+def send_cached_photo(bot, chat_id, key, photo, caption: str, reply_to=None, regenerate=None):
+    """Send ``photo`` (bytes or cached file_id) and remember the upload under ``key``.
+
+    If a cached file_id no longer works, the stored bytes are uploaded
+    instead, or the image is produced again with ``regenerate``.
+    """
+    sent = safe_send_photo(bot, chat_id, photo, caption, reply_to)
+    if sent is None and isinstance(photo, str):
+        print("[DEBUG] Cached image file_id is stale, uploading again")
+        image_cache.forget_file_id(key)
+        photo = image_cache.read_bytes(key) or (regenerate() if regenerate else None)
+        if not photo:
+            bot.send_message(chat_id, "❌ Failed to send image. Please try again!")
+            return None
+        sent = safe_send_photo(bot, chat_id, photo, caption, reply_to)
+    if key and not isinstance(photo, str) and sent_file_id(sent):
+        image_cache.put(key, photo, sent_file_id(sent))
+    return sent
 
 # ---------- Handlers ----------
 def handle_image_command(bot, message, user_waiting_for_image, usage_tracker):
@@ -154,7 +210,12 @@ def handle_image_command(bot, message, user_waiting_for_image, usage_tracker):
         if remaining <= 10:
             bot.reply_to(message, f"⚠️ Only {remaining} image generations left today!", parse_mode="Markdown")
 
-    img = generate_image(full_prompt, bot, message.chat.id)
+    cache_key = image_cache_key(config.IMAGE_MODEL, full_prompt)
+    img = cached_image(cache_key)
+    if not img:
+        if reply_if_open(bot, message, "image"):
+            return
+        img = generate_image(full_prompt, bot, message.chat.id, message.from_user.id)
     if not img:
         bot.reply_to(message, "❌ Image Generation Failed\nPlease try a different prompt.", parse_mode="Markdown")
         return
@@ -170,11 +231,14 @@ def handle_image_command(bot, message, user_waiting_for_image, usage_tracker):
         tail = "\n\n💎 Premium User - Unlimited Access!"
 
     cap = f"🎨 *Generated Image*\n\n📝 *Prompt:* `{safe_shown}`\n\n✨ *Created by BrahMos AI*{escape_markdown_v2(tail)}"
-    safe_send_photo(bot, message.chat.id, img, cap, reply_to=message.message_id)
+    send_cached_photo(bot, message.chat.id, cache_key, img, cap, reply_to=message.message_id,
+                      regenerate=lambda: generate_image(full_prompt, user_id=user_id))
 
-def edit_image(image_data: bytes, edit_prompt: str, bot=None, chat_id=None):
+def edit_image(image_data, edit_prompt: str, bot=None, chat_id=None, user_id=None):
     """
     Edit an image using nano banana model.
+    ``image_data`` is image bytes or an upload source such as TelegramFileSource,
+    which is streamed into the request without being held in memory.
     Returns edited image bytes or None.
     """
     loader = None
@@ -183,55 +247,38 @@ def edit_image(image_data: bytes, edit_prompt: str, bot=None, chat_id=None):
             loader = AnimatedLoader(bot, chat_id, "Editing your image", "image")
             loader.start()
 
-        # Convert image to base64 for API
-        import base64
-        image_b64 = base64.b64encode(image_data).decode('utf-8')
+        source = BytesSource(image_data) if isinstance(image_data, (bytes, bytearray)) else image_data
 
         # Edit API format for nano banana model
         payload = {
             "model": config.EDIT_MODEL,
             "prompt": edit_prompt,
-            "image": f"data:image/jpeg;base64,{image_b64}",
             "response_format": "url",
-            "size": "1024x1024"
+            "size": IMAGE_SIZE
         }
 
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {config.API_KEY}"
-        }
-
-        # Use POST with JSON payload for edit API
-        resp = requests.post(
-            config.IMAGE_API_URL,
-            json=payload,
-            headers=headers,
-            timeout=120,
-        )
-        
-        print(f"[DEBUG] Edit API response status: {resp.status_code}")
-        
-        if resp.status_code == 200:
-            # Try to parse JSON response first
-            try:
-                response_data = resp.json()
-                if "data" in response_data and len(response_data["data"]) > 0:
-                    image_url = response_data["data"][0].get("url")
-                    if image_url:
-                        # Download the edited image from the URL
-                        img_resp = requests.get(image_url, timeout=60)
-                        if img_resp.status_code == 200:
-                            return img_resp.content
-                        else:
-                            print(f"[DEBUG] Failed to download edited image from URL: {img_resp.status_code}")
-            except json.JSONDecodeError:
-                pass
-            
-            # Fallback: check if response contains image data directly
-            if _looks_like_image(resp):
-                return resp.content
-
-        return None
+        with breakers["image"].guard() as attempt:
+            with upstream_scheduler.slot("image", user_id):
+                # The photo is base64-encoded (or sent raw as multipart) while it is uploaded
+                if config.EDIT_UPLOAD_MODE == "multipart":
+                    url = config.EDIT_MULTIPART_URL
+                    body, headers = multipart_body(payload, "image", source)
+                else:
+                    url = config.IMAGE_API_URL
+                    body, headers = json_data_uri_body(payload, "image", source)
+                headers["Authorization"] = f"Bearer {config.API_KEY}"
+
+                resp = upstream.post(
+                    url,
+                    data=body,
+                    headers=headers,
+                    timeout=120,
+                    stream=True,
+                )
+
+                print(f"[DEBUG] Edit API response status: {resp.status_code}")
+                attempt.status(resp.status_code)
+                return read_image_response(resp, "edited image")
     except Exception as e:
         print(f"[DEBUG] Image editing error: {e}")
         return None
@@ -240,7 +287,7 @@ def edit_image(image_data: bytes, edit_prompt: str, bot=None, chat_id=None):
             loader.stop()
 
 def handle_edit_command(bot, message, user_waiting_for_edit, usage_tracker):
-    from utils import log_user_interaction, is_premium_user
+    from utils import log_user_interaction
 
     user_id = message.from_user.id
     log_user_interaction(message.from_user, "/edit", "DM" if message.chat.type == "private" else "Group")
@@ -263,7 +310,6 @@ def handle_edit_command(bot, message, user_waiting_for_edit, usage_tracker):
 
 def handle_edit_photo(bot, message, user_waiting_for_edit, usage_tracker):
     from utils import is_premium_user
-    import io
 
     user_id = message.from_user.id
     if user_id not in user_waiting_for_edit:
@@ -284,12 +330,27 @@ def handle_edit_photo(bot, message, user_waiting_for_edit, usage_tracker):
     try:
         # Get the largest photo size
         if message.photo:
-            photo = message.photo[-1]  # Get highest resolution
-            file_info = bot.get_file(photo.file_id)
-            photo_data = bot.download_file(file_info.file_path)
-            
-            # Edit the image
-            edited_img = edit_image(photo_data, edit_prompt, bot, message.chat.id)
+            # Smallest size that covers the edit resolution, not always the largest
+            photo = pick_photo_size(message.photo, config.EDIT_TARGET_SIZE)
+
+            def run_edit():
+                # Streamed from Telegram straight into the edit request
+                return edit_image(open_edit_photo(bot, message.photo), edit_prompt, user_id=user_id)
+
+            # Same photo with the same instruction: reuse the earlier result
+            cache_key = image_cache_key(config.EDIT_MODEL, edit_prompt, photo.file_unique_id)
+            edited_img = cached_image(cache_key)
+            if not edited_img:
+                if reply_if_open(bot, message, "image"):
+                    return
+                loader = AnimatedLoader(bot, message.chat.id, "Editing your image", "image")
+                loader.start()
+                try:
+                    # ...or wait for the same edit if it is already running
+                    flight_key = (config.EDIT_MODEL, IMAGE_SIZE, photo.file_unique_id, normalize_text(edit_prompt))
+                    edited_img = single_flight.do("edit", flight_key, run_edit)
+                finally:
+                    loader.stop()
             
             if edited_img:
                 # Track usage for free users
@@ -303,7 +364,8 @@ def handle_edit_photo(bot, message, user_waiting_for_edit, usage_tracker):
                 safe_edit_prompt = escape_markdown_v2(truncate(edit_prompt, 900))
                 cap = f"🎨 *Edited Image*\n\n📝 *Edit:* `{safe_edit_prompt}`\n\n✨ *Edited by BrahMos AI*{escape_markdown_v2(tail)}"
                 
-                safe_send_photo(bot, message.chat.id, edited_img, cap, reply_to=message.message_id)
+                send_cached_photo(bot, message.chat.id, cache_key, edited_img, cap,
+                                  reply_to=message.message_id, regenerate=run_edit)
             else:
                 bot.reply_to(message, "❌ **Image Editing Failed**\n\nPlease try a different edit instruction.", parse_mode="Markdown")
         else:
@@ -322,7 +384,12 @@ def handle_image_input(bot, message, user_waiting_for_image, usage_tracker):
     user_waiting_for_image.discard(uid)
 
     full_prompt = (message.text or "").strip()
-    img = generate_image(full_prompt, bot, message.chat.id)
+    cache_key = image_cache_key(config.IMAGE_MODEL, full_prompt)
+    img = cached_image(cache_key)
+    if not img:
+        if reply_if_open(bot, message, "image"):
+            return
+        img = generate_image(full_prompt, bot, message.chat.id, uid)
     if not img:
         bot.send_message(message.chat.id, "❌ Image Generation Failed\nPlease try a different prompt.", parse_mode="Markdown")
         return
@@ -338,4 +405,5 @@ def handle_image_input(bot, message, user_waiting_for_image, usage_tracker):
         tail = "\n\n💎 Premium User - Unlimited Access!"
 
     cap = f"🎨 *Generated Image*\n\n📝 *Prompt:* `{safe_shown}`\n\n✨ *Created by BrahMos AI*{escape_markdown_v2(tail)}"
-    safe_send_photo(bot, message.chat.id, img, cap, reply_to=message.message_id)
+    send_cached_photo(bot, message.chat.id, cache_key, img, cap, reply_to=message.message_id,
+                      regenerate=lambda: generate_image(full_prompt, user_id=uid))
@@ -0,0 +1,331 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from telebot.apihelper import ApiTelegramException
+
+import config
+
+
+def normalize_text(text, casefold=True):
+    """Collapse whitespace (and case) so trivially different inputs share a key"""
+    text = " ".join((text or "").split())
+    return text.casefold() if casefold else text
+
+
+class MediaCache:
+    """Content-addressed cache of media the bot has already produced and sent.
+
+    Entries are keyed by a hash of everything that determines the output
+    (normalized input, model, size, ...). Each entry remembers the Telegram
+    ``file_id`` of the first upload, so a hit is resent by id with neither an
+    upstream call nor an upload, and optionally the bytes themselves, kept in
+    memory or in ``disk_dir``, to re-upload if the file_id stops working.
+
+    Entries expire after ``ttl`` seconds; least recently used entries are
+    evicted above ``max_entries`` or when stored bytes exceed ``byte_budget``.
+    """
+
+    def __init__(self, name, max_entries, ttl, byte_budget=0, disk_dir=None):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.byte_budget = byte_budget
+        self.disk_dir = disk_dir
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # key -> entry dict, least recently used first
+        self.stored_bytes = 0
+        self.counters = {"hits": 0, "byte_hits": 0, "misses": 0, "stale": 0, "evictions": 0}
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._load_disk_index()
+
+    @staticmethod
+    def make_key(*parts):
+        raw = "\x1f".join("" if part is None else str(part) for part in parts)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _load_disk_index(self):
+        """Re-index bytes left on disk by a previous run (file_ids are re-learned)"""
+        files = []
+        for name in os.listdir(self.disk_dir):
+            path = os.path.join(self.disk_dir, name)
+            if name.endswith(".bin") and os.path.isfile(path):
+                stat = os.stat(path)
+                files.append((stat.st_mtime, name[:-4], stat.st_size))
+        for mtime, key, size in sorted(files):
+            self.entries[key] = {"file_id": None, "data": None, "size": size, "created": mtime}
+            self.stored_bytes += size
+        with self.lock:
+            self._evict(time.time())
+
+    def _path(self, key):
+        return os.path.join(self.disk_dir, key + ".bin")
+
+    def _drop(self, key):
+        entry = self.entries.pop(key)
+        self.stored_bytes -= entry["size"]
+        if entry["size"] and self.disk_dir:
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def _evict(self, now):
+        """Drop expired entries, then LRU entries over the limits (lock held)"""
+        if self.ttl:
+            for key in [k for k, e in self.entries.items() if now - e["created"] > self.ttl]:
+                self._drop(key)
+                self.counters["evictions"] += 1
+        while self.entries and (len(self.entries) > self.max_entries
+                                or (self.byte_budget and self.stored_bytes > self.byte_budget)):
+            self._drop(next(iter(self.entries)))
+            self.counters["evictions"] += 1
+
+    def lookup(self, key):
+        """Cached file_id (str) or bytes for ``key``, or None on a miss"""
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and self.ttl and now - entry["created"] > self.ttl:
+                self._drop(key)
+                entry = None
+            if entry is None:
+                self.counters["misses"] += 1
+                return None
+            self.entries.move_to_end(key)
+            if entry["file_id"]:
+                self.counters["hits"] += 1
+                return entry["file_id"]
+        data = self.read_bytes(key)
+        with self.lock:
+            if data is None:
+                self.counters["misses"] += 1
+                if key in self.entries:
+                    self._drop(key)
+                return None
+            self.counters["byte_hits"] += 1
+        return data
+
+    def read_bytes(self, key):
+        """Stored bytes for ``key`` if any"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or not entry["size"]:
+                return None
+            if entry["data"] is not None:
+                return entry["data"]
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _write_file(self, key, data):
+        """Write the bytes of ``key`` to disk, without the lock; returns whether it worked"""
+        tmp_path = f"{self._path(key)}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(key))
+            return True
+        except OSError as e:
+            print(f"[DEBUG] {self.name} cache write failed: {e}")
+            return False
+
+    def put(self, key, data=None, file_id=None):
+        """Remember the upload (and optionally the bytes) produced for ``key``"""
+        keep_bytes = data is not None and self.byte_budget > 0 and len(data) <= self.byte_budget
+        if keep_bytes and self.disk_dir:
+            with self.lock:
+                entry = self.entries.get(key)
+                needed = entry is None or not entry["size"]
+            # Disk I/O happens outside the lock; only the index update takes it
+            keep_bytes = needed and self._write_file(key, data)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                entry = self.entries[key] = {"file_id": None, "data": None, "size": 0,
+                                             "created": time.time()}
+            self.entries.move_to_end(key)
+            if file_id:
+                entry["file_id"] = file_id
+            if keep_bytes and not entry["size"]:
+                if not self.disk_dir:
+                    entry["data"] = data
+                entry["size"] = len(data)
+                self.stored_bytes += entry["size"]
+            self._evict(time.time())
+
+    def forget_file_id(self, key):
+        """The Telegram file_id no longer works; keep the bytes if there are any"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return
+            self.counters["stale"] += 1
+            entry["file_id"] = None
+            if not entry["size"]:
+                self.entries.pop(key)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.counters["hits"] + self.counters["byte_hits"] + self.counters["misses"]
+            hits = self.counters["hits"] + self.counters["byte_hits"]
+            return dict(self.counters,
+                        entries=len(self.entries),
+                        bytes=self.stored_bytes,
+                        hit_rate=hits / lookups if lookups else 0.0)
+
+
+def sent_file_id(message):
+    """file_id of the media in a sent message (largest size for photos)"""
+    if message is None:
+        return None
+    if getattr(message, "photo", None):
+        return message.photo[-1].file_id
+    for kind in ("voice", "audio", "document", "animation", "video", "sticker"):
+        media = getattr(message, kind, None)
+        if media is not None:
+            return media.file_id
+    return None
+
+
+def is_stale_file_error(error):
+    """Telegram rejected a file_id (deleted bot, expired reference, ...)"""
+    return error.error_code == 400 and "file" in (error.description or "").lower()
+
+
+class StaticMediaRegistry:
+    """Upload-once registry for fixed assets shipped with the bot (Brahmos.png, ...).
+
+    The first send of an asset uploads the file; its file_id is persisted in
+    ``registry_file`` together with a hash of the file, and every later send
+    goes by id. Replacing the file on disk or Telegram rejecting the id
+    triggers one new upload.
+    """
+
+    def __init__(self, registry_file):
+        self.registry_file = registry_file
+        self.lock = threading.Lock()
+        self.asset_locks = {}
+        self.fingerprints = {}
+        self.counters = {"uploads": 0, "reused": 0, "stale": 0}
+        try:
+            with open(registry_file) as f:
+                self.ids = json.load(f)
+        except (OSError, ValueError):
+            self.ids = {}
+
+    def _fingerprint(self, path):
+        """Content hash of an asset, recomputed only when its mtime/size change"""
+        stat = os.stat(path)
+        cached = self.fingerprints.get(path)
+        if cached and cached[0] == (stat.st_mtime_ns, stat.st_size):
+            return cached[1]
+        with open(path, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        self.fingerprints[path] = ((stat.st_mtime_ns, stat.st_size), digest)
+        return digest
+
+    def file_id(self, path):
+        """Known file_id of an unchanged asset, or None"""
+        entry = self.ids.get(path)
+        if entry and entry.get("sha256") == self._fingerprint(path):
+            return entry["file_id"]
+        return None
+
+    def _remember(self, path, file_id, replaces=None):
+        """Store (or with None, drop) the asset's file_id; with ``replaces``, only if that is still the one stored"""
+        from utils import atomic_write_json
+        with self.lock:
+            if replaces is not None and self.ids.get(path, {}).get("file_id") != replaces:
+                return
+            if file_id:
+                self.ids[path] = {"file_id": file_id, "sha256": self._fingerprint(path)}
+            else:
+                self.ids.pop(path, None)
+            try:
+                atomic_write_json(self.registry_file, self.ids)
+            except OSError as e:
+                print(f"[DEBUG] Failed to save media registry: {e}")
+
+    def _count(self, counter):
+        with self.lock:
+            self.counters[counter] += 1
+
+    def _send_by_id(self, send, path, chat_id, file_id, kwargs):
+        """Send by file_id; None if Telegram no longer accepts the id"""
+        try:
+            message = send(chat_id, file_id, **kwargs)
+        except ApiTelegramException as e:
+            if not is_stale_file_error(e):
+                raise
+            print(f"[DEBUG] Stored file_id for {path} is stale, uploading again")
+            self._count("stale")
+            self._remember(path, None, replaces=file_id)
+            return None
+        self._count("reused")
+        return message
+
+    def send(self, bot, kind, chat_id, path, **kwargs):
+        """Send asset ``path`` with ``bot.send_<kind>``, by file_id when possible.
+
+        Raises FileNotFoundError if the asset is missing.
+        """
+        send = getattr(bot, f"send_{kind}")
+        # Sends by id run concurrently; only uploads are serialized
+        tried = self.file_id(path)
+        if tried:
+            message = self._send_by_id(send, path, chat_id, tried, kwargs)
+            if message is not None:
+                return message
+        with self.lock:
+            asset_lock = self.asset_locks.setdefault(path, threading.Lock())
+        # One upload per asset; concurrent first sends wait for its file_id
+        with asset_lock:
+            file_id = self.file_id(path)
+            if file_id and file_id != tried:
+                message = self._send_by_id(send, path, chat_id, file_id, kwargs)
+                if message is not None:
+                    return message
+            with open(path, "rb") as f:
+                message = send(chat_id, f, **kwargs)
+            self._count("uploads")
+            self._remember(path, sent_file_id(message))
+            return message
+
+    def stats(self):
+        return dict(self.counters, assets=len(self.ids))
+
+
+# Fixed assets such as the welcome image
+static_media = StaticMediaRegistry(config.STATIC_MEDIA_FILE)
+
+# Generated and edited images
+image_cache = MediaCache(
+    "image",
+    max_entries=config.IMAGE_CACHE_MAX_ENTRIES,
+    ttl=config.IMAGE_CACHE_TTL,
+    byte_budget=config.IMAGE_CACHE_DISK_BYTES if config.IMAGE_CACHE_DIR else 0,
+    disk_dir=config.IMAGE_CACHE_DIR,
+)
+
+# Synthesized speech, bytes kept in memory
+tts_cache = MediaCache(
+    "tts",
+    max_entries=config.TTS_CACHE_MAX_ENTRIES,
+    ttl=config.TTS_CACHE_TTL,
+    byte_budget=config.TTS_CACHE_BYTES,
+)
+
+# Enhanced /prompt texts, stored as UTF-8 bytes in memory
+prompt_cache = MediaCache(
+    "prompt",
+    max_entries=config.PROMPT_CACHE_MAX_ENTRIES,
+    ttl=config.PROMPT_CACHE_TTL,
+    byte_budget=config.PROMPT_CACHE_BYTES,
+)
@@ -0,0 +1,268 @@
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import Future
+
+from telebot.apihelper import ApiTelegramException
+
+import config
+from utils import TokenBucket
+
+# Priority classes, lower runs first
+PRIORITY_FINAL = 0       # Answers, command replies, final edits
+PRIORITY_UPDATE = 1      # Progressive edits of a streaming reply
+PRIORITY_ANIMATION = 2   # Loader frames and chat actions
+
+_PENDING, _RUNNING, _DONE = range(3)
+
+
+class _Job:
+    __slots__ = ("chat_id", "fn", "args", "kwargs", "priority", "seq", "merge_key",
+                 "future", "attempts", "state")
+
+    def __init__(self, chat_id, fn, args, kwargs, priority, seq, merge_key):
+        self.chat_id = chat_id
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.priority = priority
+        self.seq = seq
+        self.merge_key = merge_key
+        self.future = Future()
+        self.attempts = 0
+        self.state = _PENDING
+
+
+class OutboundDispatcher:
+    """Outbound Telegram queue honouring per-chat and global rate limits.
+
+    Jobs run in priority order on a few worker threads, as soon as both the
+    global and the chat's token bucket allow. A 429 response pauses the chat
+    for its Retry-After and requeues the job. A queued edit of a message that
+    already has an edit waiting is merged into it, so only the newest text is sent.
+    """
+
+    def __init__(self, global_rate, chat_rate, group_rate, chat_burst, workers, max_retries):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.chat_buckets = {}
+        self.blocked_until = {}
+        self.pending = {}  # merge_key -> queued job
+        self.heap = []
+        self.seq = itertools.count()
+        self.cond = threading.Condition()
+        self.stats_counters = {"sent": 0, "merged": 0, "rate_limited": 0, "failed": 0}
+        self.workers = [threading.Thread(target=self._run, daemon=True, name=f"outbound-{i}")
+                        for i in range(workers)]
+        for worker in self.workers:
+            worker.start()
+
+    def submit(self, chat_id, fn, /, *args, priority=PRIORITY_FINAL, merge_key=None, **kwargs):
+        """Queue a Bot API call and return a Future with its result.
+
+        ``chat_id`` only routes the job; ``fn`` gets its own ``chat_id`` in
+        ``args``/``kwargs``.
+        """
+        with self.cond:
+            if merge_key is not None:
+                queued = self.pending.get(merge_key)
+                if queued is not None and queued.state == _PENDING:
+                    # Newest content wins; keep the earlier place in the queue
+                    queued.fn, queued.args, queued.kwargs = fn, args, kwargs
+                    self.stats_counters["merged"] += 1
+                    if priority < queued.priority:
+                        queued.priority = priority
+                        heapq.heappush(self.heap, (priority, queued.seq, queued))
+                    return queued.future
+            job = _Job(chat_id, fn, args, kwargs, priority, next(self.seq), merge_key)
+            if merge_key is not None:
+                self.pending[merge_key] = job
+            heapq.heappush(self.heap, (priority, job.seq, job))
+            self.cond.notify()
+            return job.future
+
+    def call(self, chat_id, fn, /, *args, priority=PRIORITY_FINAL, merge_key=None, **kwargs):
+        """Queue a Bot API call and wait for its result (exceptions are re-raised)"""
+        return self.submit(chat_id, fn, *args, priority=priority, merge_key=merge_key, **kwargs).result()
+
+    def _chat_bucket(self, chat_id):
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            # Negative ids are groups and channels, which Telegram limits harder
+            rate = self.group_rate if isinstance(chat_id, int) and chat_id < 0 else self.chat_rate
+            bucket = self.chat_buckets[chat_id] = TokenBucket(rate, self.chat_burst)
+        return bucket
+
+    def _wait_for(self, job, now):
+        wait = self.blocked_until.get(job.chat_id, 0) - now
+        if job.chat_id is not None:
+            wait = max(wait, self._chat_bucket(job.chat_id).wait_time(now))
+        return wait
+
+    def _next_job(self):
+        """Pop the best job that may run now (called with the lock held)"""
+        while True:
+            now = time.monotonic()
+            global_wait = self.global_bucket.wait_time(now)
+            if global_wait > 0:
+                self.cond.wait(global_wait)
+                continue
+
+            skipped, job, wait = [], None, None
+            while self.heap:
+                item = heapq.heappop(self.heap)
+                candidate = item[2]
+                if candidate.state != _PENDING or item[0] != candidate.priority:
+                    continue  # Stale entry of a merged/re-prioritised job
+                chat_wait = self._wait_for(candidate, now)
+                if chat_wait <= 0:
+                    job = candidate
+                    break
+                skipped.append(item)
+                wait = chat_wait if wait is None else min(wait, chat_wait)
+            for item in skipped:
+                heapq.heappush(self.heap, item)
+
+            if job is not None:
+                self.global_bucket.try_take(now)
+                if job.chat_id is not None:
+                    self._chat_bucket(job.chat_id).try_take(now)
+                job.state = _RUNNING
+                if job.merge_key is not None and self.pending.get(job.merge_key) is job:
+                    del self.pending[job.merge_key]
+                return job
+            self._sweep(now)
+            self.cond.wait(wait)
+
+    def _sweep(self, now):
+        """Forget idle chats whose bucket is full again"""
+        if len(self.chat_buckets) < 1024:
+            return
+        for chat_id, bucket in list(self.chat_buckets.items()):
+            bucket._refill(now)
+            if bucket.tokens >= bucket.capacity and self.blocked_until.get(chat_id, 0) <= now:
+                del self.chat_buckets[chat_id]
+                self.blocked_until.pop(chat_id, None)
+
+    def _run(self):
+        while True:
+            with self.cond:
+                job = self._next_job()
+            job.attempts += 1
+            try:
+                result = job.fn(*job.args, **job.kwargs)
+            except ApiTelegramException as e:
+                if e.error_code == 429 and job.attempts <= self.max_retries:
+                    self._retry_later(job, e)
+                    continue
+                self._finish(job, exception=e)
+            except Exception as e:
+                self._finish(job, exception=e)
+            else:
+                self._finish(job, result=result)
+
+    def _retry_later(self, job, error):
+        retry_after = (error.result_json.get("parameters") or {}).get("retry_after", 1)
+        print(f"[DEBUG] Telegram 429 for chat {job.chat_id}, retrying in {retry_after}s")
+        with self.cond:
+            self.stats_counters["rate_limited"] += 1
+            until = time.monotonic() + retry_after
+            self.blocked_until[job.chat_id] = max(self.blocked_until.get(job.chat_id, 0), until)
+            newer = self.pending.get(job.merge_key) if job.merge_key is not None else None
+            if newer is not None and newer is not job:
+                # A newer edit of the same message is queued; it supersedes this one
+                job.state = _DONE
+                newer.future.add_done_callback(lambda f: _copy_future(f, job.future))
+                return
+            job.state = _PENDING
+            if job.merge_key is not None:
+                self.pending[job.merge_key] = job
+            heapq.heappush(self.heap, (job.priority, job.seq, job))
+            self.cond.notify()
+
+    def _finish(self, job, result=None, exception=None):
+        with self.cond:
+            job.state = _DONE
+            self.stats_counters["failed" if exception else "sent"] += 1
+        if exception is not None:
+            job.future.set_exception(exception)
+        else:
+            job.future.set_result(result)
+
+    def stats(self):
+        with self.cond:
+            queued = sum(1 for _, _, job in self.heap if job.state == _PENDING)
+            return dict(self.stats_counters, queued=queued, chats=len(self.chat_buckets))
+
+
+def _copy_future(source, target):
+    if source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
+
+
+class OutboundBot:
+    """TeleBot wrapper that routes every send/edit through the OutboundDispatcher.
+
+    Sending methods accept an extra ``priority`` keyword; everything else
+    (handlers, polling, get_file, ...) is passed straight to the wrapped bot.
+    """
+
+    def __init__(self, bot, dispatcher):
+        self._bot = bot
+        self.dispatcher = dispatcher
+
+    def __getattr__(self, name):
+        return getattr(self._bot, name)
+
+    def send_message(self, chat_id, text, priority=PRIORITY_FINAL, **kwargs):
+        return self.dispatcher.call(chat_id, self._bot.send_message, chat_id, text,
+                                    priority=priority, **kwargs)
+
+    def reply_to(self, message, text, priority=PRIORITY_FINAL, **kwargs):
+        return self.dispatcher.call(message.chat.id, self._bot.reply_to, message, text,
+                                    priority=priority, **kwargs)
+
+    def send_photo(self, chat_id, photo, priority=PRIORITY_FINAL, **kwargs):
+        return self.dispatcher.call(chat_id, self._bot.send_photo, chat_id, photo,
+                                    priority=priority, **kwargs)
+
+    def send_voice(self, chat_id, voice, priority=PRIORITY_FINAL, **kwargs):
+        return self.dispatcher.call(chat_id, self._bot.send_voice, chat_id, voice,
+                                    priority=priority, **kwargs)
+
+    def send_chat_action(self, chat_id, action, priority=PRIORITY_ANIMATION, **kwargs):
+        return self.dispatcher.call(chat_id, self._bot.send_chat_action, chat_id, action,
+                                    priority=priority, **kwargs)
+
+    def edit_message_text(self, text, chat_id=None, message_id=None, priority=PRIORITY_FINAL, **kwargs):
+        merge_key = ("text", chat_id, message_id) if message_id is not None else None
+        return self.dispatcher.call(chat_id, self._bot.edit_message_text, text,
+                                    chat_id=chat_id, message_id=message_id,
+                                    priority=priority, merge_key=merge_key, **kwargs)
+
+    def edit_message_caption(self, caption, chat_id=None, message_id=None, priority=PRIORITY_FINAL, **kwargs):
+        merge_key = ("caption", chat_id, message_id) if message_id is not None else None
+        return self.dispatcher.call(chat_id, self._bot.edit_message_caption, caption,
+                                    chat_id=chat_id, message_id=message_id,
+                                    priority=priority, merge_key=merge_key, **kwargs)
+
+    def delete_message(self, chat_id, message_id, priority=PRIORITY_FINAL, **kwargs):
+        return self.dispatcher.call(chat_id, self._bot.delete_message, chat_id, message_id,
+                                    priority=priority, **kwargs)
+
+
+def create_dispatcher():
+    return OutboundDispatcher(
+        global_rate=config.OUTBOUND_GLOBAL_RATE,
+        chat_rate=config.OUTBOUND_CHAT_RATE,
+        group_rate=config.OUTBOUND_GROUP_RATE,
+        chat_burst=config.OUTBOUND_CHAT_BURST,
+        workers=config.OUTBOUND_WORKERS,
+        max_retries=config.OUTBOUND_MAX_RETRIES,
+    )
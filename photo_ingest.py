@@ -0,0 +1,76 @@
+import io
+import threading
+
+import config
+from uploads import BytesSource, TelegramFileSource
+
+# Pillow is optional: without it, photos are only picked, never rescaled
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+_stats_lock = threading.Lock()
+ingest_stats = {"photos": 0, "downscaled": 0, "bytes_saved": 0}
+
+
+def pick_photo_size(sizes, target):
+    """Smallest PhotoSize covering ``target`` with both sides, else the largest one"""
+    covering = [size for size in sizes if min(size.width, size.height) >= target]
+    if covering:
+        return min(covering, key=lambda size: size.width * size.height)
+    return max(sizes, key=lambda size: size.width * size.height)
+
+
+def downscale_jpeg(data, target, quality):
+    """Resize so the shorter side is ``target`` and recompress as JPEG; None if not possible"""
+    if Image is None:
+        return None
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            img = img.convert("RGB")
+            scale = target / min(img.size)
+            if scale < 1:
+                img = img.resize((round(img.width * scale), round(img.height * scale)), Image.LANCZOS)
+            out = io.BytesIO()
+            img.save(out, "JPEG", quality=quality, optimize=True)
+            return out.getvalue()
+    except Exception as e:
+        print(f"[DEBUG] Photo downscale failed: {e}")
+        return None
+
+
+def open_edit_photo(bot, sizes, target=None):
+    """Upload source for an edit of the photo with the given PhotoSizes.
+
+    The smallest size covering ``target`` is streamed from Telegram. If even
+    that is more than EDIT_DOWNSCALE_RATIO times the target and Pillow is
+    installed, it is downscaled and recompressed locally first. Bytes saved
+    against sending the largest size are logged and counted.
+    """
+    target = target or config.EDIT_TARGET_SIZE
+    largest = max(sizes, key=lambda size: size.width * size.height)
+    photo = pick_photo_size(sizes, target)
+    file_info = bot.get_file(photo.file_id)
+    source = TelegramFileSource(file_info.file_path, file_info.file_size or photo.file_size)
+    upload_bytes = file_info.file_size or photo.file_size or 0
+    downscaled = False
+
+    if Image is not None and min(photo.width, photo.height) > target * config.EDIT_DOWNSCALE_RATIO:
+        _, chunks = source.open()
+        data = b"".join(chunks)
+        scaled = downscale_jpeg(data, target, config.EDIT_JPEG_QUALITY)
+        if scaled and len(scaled) < len(data):
+            source, upload_bytes, downscaled = BytesSource(scaled), len(scaled), True
+        else:
+            source, upload_bytes = BytesSource(data), len(data)
+
+    saved = max(0, (largest.file_size or 0) - upload_bytes)
+    with _stats_lock:
+        ingest_stats["photos"] += 1
+        ingest_stats["downscaled"] += downscaled
+        ingest_stats["bytes_saved"] += saved
+    print(f"[DEBUG] Edit input: {photo.width}x{photo.height}{' downscaled' if downscaled else ''}, "
+          f"{upload_bytes} bytes instead of {largest.file_size} ({largest.width}x{largest.height}), "
+          f"saved {saved} bytes")
+    return source
@@ -0,0 +1,110 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import config
+
+TIERS = ("premium", "free", "background")
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class UpstreamScheduler:
+    """Admission control in front of the chat, image and TTS upstreams.
+
+    Each workload class has a fixed number of concurrent upstream slots. While
+    slots are free, calls go straight through; once a class is saturated,
+    waiting calls are granted in order of arrival time, with premium calls
+    given a head start of ``premium_head_start`` seconds. That is the aging
+    rule: a free call that has waited longer than the head start is served
+    before any premium call that arrives after it, so free users never starve.
+    Background calls, which no user is waiting for, only get a slot when no
+    other call is waiting.
+    """
+
+    def __init__(self, capacities, premium_head_start, sample_size=1000):
+        self.capacities = dict(capacities)
+        self.premium_head_start = premium_head_start
+        self.lock = threading.Lock()
+        self.in_use = {name: 0 for name in capacities}
+        self.waiting = {name: [] for name in capacities}  # heap of (background, key, seq, event)
+        self.seq = itertools.count()
+        self.wait_samples = {(name, tier): deque(maxlen=sample_size)
+                             for name in capacities for tier in TIERS}
+        self.total_samples = {(name, tier): deque(maxlen=sample_size)
+                              for name in capacities for tier in TIERS}
+        self.counters = {(name, tier): 0 for name in capacities for tier in TIERS}
+
+    def _acquire(self, workload, tier):
+        enqueued = time.monotonic()
+        with self.lock:
+            if self.in_use[workload] < self.capacities[workload] and not self.waiting[workload]:
+                self.in_use[workload] += 1
+                return enqueued
+            key = enqueued - self.premium_head_start if tier == "premium" else enqueued
+            event = threading.Event()
+            heapq.heappush(self.waiting[workload], (tier == "background", key, next(self.seq), event))
+        # The slot is handed over by _release, in_use already counts us
+        event.wait()
+        return enqueued
+
+    def _release(self, workload):
+        with self.lock:
+            if self.waiting[workload]:
+                _, _, _, event = heapq.heappop(self.waiting[workload])
+                event.set()
+            else:
+                self.in_use[workload] -= 1
+
+    @contextmanager
+    def slot(self, workload, user_id=None, background=False):
+        """Hold an upstream slot of ``workload`` for the duration of the block"""
+        premium = False
+        if user_id is not None:
+            from utils import is_premium_user
+            premium = is_premium_user(user_id)
+        tier = "background" if background else "premium" if premium else "free"
+        enqueued = self._acquire(workload, tier)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(workload)
+            finished = time.monotonic()
+            with self.lock:
+                self.counters[(workload, tier)] += 1
+                self.wait_samples[(workload, tier)].append(started - enqueued)
+                self.total_samples[(workload, tier)].append(finished - enqueued)
+
+    def stats(self):
+        """Per class: slots in use, queue depth and per-tier wait/total latency"""
+        with self.lock:
+            result = {}
+            for name in self.capacities:
+                entry = {"in_use": self.in_use[name], "capacity": self.capacities[name],
+                         "waiting": len(self.waiting[name])}
+                for tier in TIERS:
+                    waits = sorted(self.wait_samples[(name, tier)])
+                    totals = sorted(self.total_samples[(name, tier)])
+                    entry[tier] = {
+                        "calls": self.counters[(name, tier)],
+                        "wait_p50": _percentile(waits, 50),
+                        "wait_p95": _percentile(waits, 95),
+                        "p50": _percentile(totals, 50),
+                        "p95": _percentile(totals, 95),
+                    }
+                result[name] = entry
+            return result
+
+
+# Global scheduler shared by all upstream calls
+upstream_scheduler = UpstreamScheduler(config.UPSTREAM_CONCURRENCY,
+                                       config.UPSTREAM_PREMIUM_HEAD_START)
@@ -0,0 +1,63 @@
+import threading
+from concurrent.futures import Future
+
+import config
+
+
+class SingleFlight:
+    """Collapse identical concurrent upstream calls into one.
+
+    The first caller of ``do(kind, key, fn)`` runs ``fn``; callers arriving
+    with the same kind and key while it runs wait for it and get the same
+    result (or exception) instead of starting their own call. Nothing is
+    kept once the call finishes: caching finished results is the media
+    caches' job.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.in_flight = {}  # (kind, key) -> Future of the running call
+        self.counters = {}  # kind -> {"calls": upstream calls made, "coalesced": calls saved}
+
+    def do(self, kind, key, fn):
+        if not self.enabled or key is None:
+            return fn()
+        flight_key = (kind, key)
+        with self.lock:
+            counters = self.counters.setdefault(kind, {"calls": 0, "coalesced": 0})
+            future = self.in_flight.get(flight_key)
+            if future is None:
+                future = self.in_flight[flight_key] = Future()
+                counters["calls"] += 1
+                leader = True
+            else:
+                counters["coalesced"] += 1
+                leader = False
+
+        if not leader:
+            print(f"[DEBUG] Joining in-flight {kind} call")
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self.lock:
+                del self.in_flight[flight_key]
+
+    def stats(self):
+        with self.lock:
+            stats = {kind: dict(counters) for kind, counters in self.counters.items()}
+            for kind, counters in stats.items():
+                counters["in_flight"] = sum(1 for k, _ in self.in_flight if k == kind)
+            return stats
+
+
+# Global coalescing layer for image, edit, TTS and /prompt calls
+single_flight = SingleFlight(enabled=config.SINGLE_FLIGHT_ENABLED)
@@ -0,0 +1,129 @@
+import json
+import re
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:  # orjson is optional, the stdlib parser handles bytes too
+    orjson = None
+    _json_loads = json.loads
+
+_CONCATENATED_SPLIT = re.compile(rb'(?<=\})(?=\{)')
+
+
+def extract_delta_text(obj):
+    """
+    Yield streamed text from an OpenAI-compatible SSE JSON object.
+    Handles shapes:
+      - {"choices":[{"delta":{"content":"..."} }]}
+      - {"choices":[{"delta":{"role":"assistant"}}]}  # no content
+      - {"choices":[{"message":{"content":"..."} }]}  # non-stream JSON fallback
+      - [{"delta":{"content":"..."}}, ...]             # bare array of choices
+    Also tolerates when 'choices' is a list but not dict-like.
+    """
+    if isinstance(obj, dict):
+        choices = obj.get("choices", [])
+    elif isinstance(obj, list):
+        choices = obj
+    else:
+        return
+    if not isinstance(choices, list):
+        return
+    for choice in choices:
+        if not isinstance(choice, dict):
+            continue
+        delta = choice.get("delta") or {}
+        if isinstance(delta, dict):
+            piece = delta.get("content")
+            if isinstance(piece, str):
+                yield piece
+        message = choice.get("message") or {}
+        if isinstance(message, dict):
+            content = message.get("content")
+            if isinstance(content, str):
+                yield content
+
+
+def _fast_delta(obj):
+    """Return the content of the common single-delta chunk shape, else None"""
+    try:
+        choices = obj["choices"]
+        if len(choices) == 1:
+            choice = choices[0]
+            if "message" not in choice:
+                piece = choice["delta"].get("content")
+                return piece if isinstance(piece, str) else ""
+    except (KeyError, TypeError, AttributeError, IndexError):
+        pass
+    return None
+
+
+class SSEParser:
+    """Incremental SSE parser that consumes raw bytes as they arrive from the network.
+
+    Frames split across network chunks are buffered until their line is complete,
+    so multi-byte characters are never decoded half-way. Lines may end in LF,
+    CRLF or a lone CR, as the SSE spec allows.
+    """
+
+    def __init__(self):
+        self._pending = b""
+        self.events = 0
+
+    def feed(self, chunk):
+        """Consume a chunk of bytes and yield every text delta it completes"""
+        if not chunk:
+            return
+        if b"\r" in chunk:
+            # CR and CRLF become line breaks too; the blank line a CRLF (or a CR
+            # and LF in separate chunks) leaves behind carries no data
+            chunk = chunk.replace(b"\r", b"\n")
+        if self._pending:
+            chunk = self._pending + chunk
+        lines = chunk.split(b"\n")
+        self._pending = lines.pop()
+        for line in lines:
+            if not line.startswith(b"data:"):
+                # Blank separators, ":" keep-alive comments and other fields carry no text
+                continue
+            data = line[5:].strip()
+            if not data or data == b"[DONE]":
+                continue
+            self.events += 1
+            try:
+                obj = _json_loads(data)
+            except ValueError:
+                yield from self._parse_fallback(data)
+                continue
+            piece = _fast_delta(obj)
+            if piece is None:
+                yield from extract_delta_text(obj)
+            elif piece:
+                yield piece
+
+    def close(self):
+        """Yield deltas from a trailing line that arrived without a newline"""
+        if self._pending:
+            line, self._pending = self._pending, b""
+            yield from self.feed(line + b"\n")
+
+    @staticmethod
+    def _parse_fallback(data):
+        # Proxies sometimes glue several JSON objects into one data line
+        pieces = _CONCATENATED_SPLIT.split(data) if b"}{" in data else [data]
+        for piece in pieces:
+            piece = piece.strip()
+            if not piece:
+                continue
+            try:
+                yield from extract_delta_text(_json_loads(piece))
+            except ValueError:
+                yield piece.decode("utf-8", errors="replace")
+
+
+def iter_sse_deltas(chunks):
+    """Yield text deltas from an iterable of raw SSE byte chunks"""
+    parser = SSEParser()
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+    yield from parser.close()
@@ -0,0 +1,424 @@
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import date
+
+import config
+from utils import atomic_write_bytes, atomic_write_text, atomic_write_json
+
+
+def _today():
+    return date.today().isoformat()
+
+
+class JsonStorage:
+    """Original file storage: premium list and daily usage as JSON, users in memory.
+
+    Usage counters live in memory and are written behind in batches, either
+    every USAGE_FLUSH_INTERVAL seconds or after USAGE_FLUSH_EVERY changes,
+    plus a final flush at shutdown.
+    """
+
+    def __init__(self):
+        self.premium_file = config.PREMIUM_USERS_FILE
+        self.usage_file = config.USAGE_DATA_FILE
+        self.write_behind = config.USAGE_WRITE_BEHIND
+        self.flush_interval = config.USAGE_FLUSH_INTERVAL
+        self.flush_every = config.USAGE_FLUSH_EVERY
+
+        self.users = {}  # user_id -> first seen timestamp
+        self.premium_users = self.load_premium_users()
+
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._dirty = 0
+        self._snapshot_seq = 0
+        self._written_seq = 0
+        self._wake = threading.Event()
+        self.usage_data = self.load_usage_data()
+
+        if self.write_behind:
+            self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+            self._flusher.start()
+            atexit.register(self.flush)
+
+    # ---------- users ----------
+    def add_user(self, user_id):
+        self.users.setdefault(user_id, time.time())
+
+    def count_users(self, premium=None):
+        if premium is None:
+            return len(self.users)
+        return sum(1 for uid in list(self.users) if (uid in self.premium_users) == premium)
+
+    def list_users(self, premium, limit):
+        result = []
+        for uid in list(self.users):
+            if (uid in self.premium_users) == premium:
+                result.append(uid)
+                if len(result) >= limit:
+                    break
+        return result
+
+    # ---------- premium ----------
+    def load_premium_users(self):
+        """Load premium users from JSON file"""
+        try:
+            if os.path.exists(self.premium_file):
+                with open(self.premium_file, 'r') as f:
+                    return set(json.load(f))
+            return set()
+        except Exception as e:
+            print(f"[DEBUG] Error loading premium users: {e}")
+            return set()
+
+    def save_premium_users(self):
+        """Save premium users to JSON file"""
+        try:
+            atomic_write_json(self.premium_file, list(self.premium_users))
+        except Exception as e:
+            print(f"[DEBUG] Error saving premium users: {e}")
+
+    def is_premium(self, user_id):
+        return user_id in self.premium_users
+
+    def add_premium(self, user_id):
+        self.premium_users.add(user_id)
+        self.save_premium_users()
+
+    def remove_premium(self, user_id):
+        self.premium_users.discard(user_id)
+        self.save_premium_users()
+
+    def count_premium(self):
+        return len(self.premium_users)
+
+    # ---------- usage ----------
+    def load_usage_data(self):
+        """Load usage data from JSON file"""
+        try:
+            if os.path.exists(self.usage_file):
+                with open(self.usage_file, 'r') as f:
+                    data = json.load(f)
+                    # Clean old data (older than today)
+                    today = _today()
+                    cleaned_data = {}
+                    for user_id, user_data in data.items():
+                        if user_data.get('date') == today:
+                            cleaned_data[user_id] = user_data
+                    return cleaned_data
+            return {}
+        except Exception as e:
+            print(f"[DEBUG] Error loading usage data: {e}")
+            return {}
+
+    def save_usage_data(self):
+        """Save usage data to JSON file (atomic replace)"""
+        with self._lock:
+            today = _today()
+            # Entries from previous days are never read again
+            stale = [uid for uid, data in self.usage_data.items() if data.get('date') != today]
+            for uid in stale:
+                del self.usage_data[uid]
+            payload = json.dumps(self.usage_data)
+            self._snapshot_seq += 1
+            seq = self._snapshot_seq
+            self._dirty = 0
+
+        failed = False
+        with self._flush_lock:
+            # A newer snapshot may already be on disk if flushes overlapped
+            if seq > self._written_seq:
+                try:
+                    atomic_write_text(self.usage_file, payload)
+                    self._written_seq = seq
+                except Exception as e:
+                    print(f"[DEBUG] Error saving usage data: {e}")
+                    failed = True
+        if failed:
+            with self._lock:
+                self._dirty += 1
+
+    def flush(self):
+        """Write pending changes to disk, if any"""
+        if self._dirty:
+            self.save_usage_data()
+
+    def _mark_dirty(self):
+        self._dirty += 1
+        if not self.write_behind:
+            self.save_usage_data()
+        elif self._dirty >= self.flush_every:
+            self._wake.set()
+
+    def _flush_loop(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def _entry(self, user_id, day):
+        key = str(user_id)
+        entry = self.usage_data.get(key)
+        if entry is None or entry.get('date') != day:
+            entry = {'date': day, 'images_used': 0, 'tts_used': 0}
+            self.usage_data[key] = entry
+        return entry
+
+    def get_usage(self, user_id, day):
+        """Return (images_used, tts_used) for ``day``"""
+        with self._lock:
+            entry = self.usage_data.get(str(user_id))
+            if entry is None or entry.get('date') != day:
+                return 0, 0
+            return entry['images_used'], entry['tts_used']
+
+    def incr_usage(self, user_id, day, field):
+        with self._lock:
+            self._entry(user_id, day)[field] += 1
+            self._mark_dirty()
+
+    # ---------- conversations ----------
+    def _conversation_path(self, chat_id):
+        return os.path.join(config.CONVERSATION_DIR, f"{int(chat_id)}.z")
+
+    def save_conversations(self, items):
+        """Store compressed conversations, ``items`` being (chat_id, blob) pairs"""
+        os.makedirs(config.CONVERSATION_DIR, exist_ok=True)
+        for chat_id, blob in items:
+            atomic_write_bytes(self._conversation_path(chat_id), blob)
+
+    def load_conversation(self, chat_id):
+        try:
+            with open(self._conversation_path(chat_id), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def count_conversations(self):
+        try:
+            return sum(1 for name in os.listdir(config.CONVERSATION_DIR) if name.endswith(".z"))
+        except OSError:
+            return 0
+
+    def prune_conversations(self, before):
+        """Delete conversations last saved before the ``before`` timestamp"""
+        try:
+            names = os.listdir(config.CONVERSATION_DIR)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(config.CONVERSATION_DIR, name)
+            try:
+                if name.endswith(".z") and os.path.getmtime(path) < before:
+                    os.remove(path)
+            except OSError:
+                pass
+
+
+class SqliteStorage:
+    """Embedded SQLite storage (WAL mode) for users, premium status and daily usage.
+
+    On first start the existing JSON files are imported once.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            first_seen REAL NOT NULL,
+            last_seen REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_users_first_seen ON users(first_seen);
+        CREATE TABLE IF NOT EXISTS premium_users (
+            user_id INTEGER PRIMARY KEY,
+            added_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS usage (
+            day TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            images_used INTEGER NOT NULL DEFAULT 0,
+            tts_used INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, user_id)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+        CREATE TABLE IF NOT EXISTS conversations (
+            chat_id INTEGER PRIMARY KEY,
+            data BLOB NOT NULL,
+            updated REAL NOT NULL
+        );
+    """
+
+    # Statements are constant strings so sqlite3's per-connection statement
+    # cache keeps them prepared
+    SQL_ADD_USER = ("INSERT INTO users(user_id, first_seen, last_seen) VALUES (?, ?, ?) "
+                    "ON CONFLICT(user_id) DO UPDATE SET last_seen = excluded.last_seen")
+    SQL_COUNT_USERS = "SELECT COUNT(*) FROM users"
+    SQL_COUNT_PREMIUM_USERS = "SELECT COUNT(*) FROM users JOIN premium_users USING(user_id)"
+    SQL_LIST_PREMIUM_USERS = ("SELECT u.user_id FROM users u JOIN premium_users p USING(user_id) "
+                              "ORDER BY u.first_seen LIMIT ?")
+    SQL_LIST_FREE_USERS = ("SELECT u.user_id FROM users u LEFT JOIN premium_users p USING(user_id) "
+                           "WHERE p.user_id IS NULL ORDER BY u.first_seen LIMIT ?")
+    SQL_IS_PREMIUM = "SELECT 1 FROM premium_users WHERE user_id = ?"
+    SQL_ADD_PREMIUM = "INSERT OR IGNORE INTO premium_users(user_id, added_at) VALUES (?, ?)"
+    SQL_REMOVE_PREMIUM = "DELETE FROM premium_users WHERE user_id = ?"
+    SQL_COUNT_PREMIUM = "SELECT COUNT(*) FROM premium_users"
+    SQL_GET_USAGE = "SELECT images_used, tts_used FROM usage WHERE day = ? AND user_id = ?"
+    SQL_INCR_IMAGES = ("INSERT INTO usage(day, user_id, images_used) VALUES (?, ?, 1) "
+                       "ON CONFLICT(day, user_id) DO UPDATE SET images_used = images_used + 1")
+    SQL_INCR_TTS = ("INSERT INTO usage(day, user_id, tts_used) VALUES (?, ?, 1) "
+                    "ON CONFLICT(day, user_id) DO UPDATE SET tts_used = tts_used + 1")
+    SQL_PRUNE_USAGE = "DELETE FROM usage WHERE day < ?"
+    SQL_SAVE_CONVERSATION = ("INSERT INTO conversations(chat_id, data, updated) VALUES (?, ?, ?) "
+                             "ON CONFLICT(chat_id) DO UPDATE SET data = excluded.data, updated = excluded.updated")
+    SQL_LOAD_CONVERSATION = "SELECT data FROM conversations WHERE chat_id = ?"
+    SQL_COUNT_CONVERSATIONS = "SELECT COUNT(*) FROM conversations"
+    SQL_PRUNE_CONVERSATIONS = "DELETE FROM conversations WHERE updated < ?"
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None,
+                                     cached_statements=64)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript(self.SCHEMA)
+        self._migrate_json()
+        self._execute(self.SQL_PRUNE_USAGE, (_today(),))
+        atexit.register(self.close)
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _scalar(self, sql, params=()):
+        rows = self._execute(sql, params)
+        return rows[0][0] if rows else None
+
+    def _migrate_json(self):
+        """Import premium_users.json and usage_data.json once"""
+        with self._lock:
+            conn = self._conn
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+                return
+            premium, usage = [], []
+            try:
+                if os.path.exists(config.PREMIUM_USERS_FILE):
+                    with open(config.PREMIUM_USERS_FILE, 'r') as f:
+                        premium = [int(uid) for uid in json.load(f)]
+                if os.path.exists(config.USAGE_DATA_FILE):
+                    with open(config.USAGE_DATA_FILE, 'r') as f:
+                        for uid, data in json.load(f).items():
+                            usage.append((data.get('date'), int(uid),
+                                          data.get('images_used', 0), data.get('tts_used', 0)))
+            except Exception as e:
+                print(f"[DEBUG] JSON migration read error: {e}")
+            now = time.time()
+            conn.execute("BEGIN")
+            try:
+                conn.executemany(self.SQL_ADD_PREMIUM, [(uid, now) for uid in premium])
+                conn.executemany("INSERT OR IGNORE INTO usage(day, user_id, images_used, tts_used) "
+                                 "VALUES (?, ?, ?, ?)", [u for u in usage if u[0]])
+                conn.execute("INSERT INTO meta(key, value) VALUES ('json_migrated', ?)", (str(now),))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            print(f"[DEBUG] Migrated {len(premium)} premium users and {len(usage)} usage rows from JSON")
+
+    # ---------- users ----------
+    def add_user(self, user_id):
+        now = time.time()
+        self._execute(self.SQL_ADD_USER, (user_id, now, now))
+
+    def count_users(self, premium=None):
+        if premium is None:
+            return self._scalar(self.SQL_COUNT_USERS)
+        premium_count = self._scalar(self.SQL_COUNT_PREMIUM_USERS)
+        if premium:
+            return premium_count
+        return self._scalar(self.SQL_COUNT_USERS) - premium_count
+
+    def list_users(self, premium, limit):
+        sql = self.SQL_LIST_PREMIUM_USERS if premium else self.SQL_LIST_FREE_USERS
+        return [row[0] for row in self._execute(sql, (limit,))]
+
+    # ---------- premium ----------
+    def is_premium(self, user_id):
+        return self._scalar(self.SQL_IS_PREMIUM, (user_id,)) is not None
+
+    def add_premium(self, user_id):
+        self._execute(self.SQL_ADD_PREMIUM, (user_id, time.time()))
+
+    def remove_premium(self, user_id):
+        self._execute(self.SQL_REMOVE_PREMIUM, (user_id,))
+
+    def count_premium(self):
+        return self._scalar(self.SQL_COUNT_PREMIUM)
+
+    # ---------- usage ----------
+    def get_usage(self, user_id, day):
+        """Return (images_used, tts_used) for ``day``"""
+        rows = self._execute(self.SQL_GET_USAGE, (day, user_id))
+        return tuple(rows[0]) if rows else (0, 0)
+
+    def incr_usage(self, user_id, day, field):
+        sql = self.SQL_INCR_IMAGES if field == 'images_used' else self.SQL_INCR_TTS
+        self._execute(sql, (day, user_id))
+
+    # ---------- conversations ----------
+    def save_conversations(self, items):
+        """Store compressed conversations, ``items`` being (chat_id, blob) pairs"""
+        now = time.time()
+        rows = [(chat_id, blob, now) for chat_id, blob in items]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(self.SQL_SAVE_CONVERSATION, rows)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def load_conversation(self, chat_id):
+        return self._scalar(self.SQL_LOAD_CONVERSATION, (chat_id,))
+
+    def count_conversations(self):
+        return self._scalar(self.SQL_COUNT_CONVERSATIONS)
+
+    def prune_conversations(self, before):
+        """Delete conversations last saved before the ``before`` timestamp"""
+        self._execute(self.SQL_PRUNE_CONVERSATIONS, (before,))
+
+    def flush(self):
+        """Every write is already committed"""
+
+    def close(self):
+        with self._lock:
+            try:
+                self._conn.close()
+            except Exception as e:
+                print(f"[DEBUG] Error closing database: {e}")
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_storage():
+    """Return the configured storage backend (created on first use)"""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                if config.STORAGE_BACKEND == "sqlite":
+                    _storage = SqliteStorage(config.SQLITE_DB_FILE)
+                else:
+                    _storage = JsonStorage()
+    return _storage
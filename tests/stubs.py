@@ -0,0 +1,56 @@
+import os
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+
+# Keep imports of the handlers from opening the conversation database
+config.CONVERSATION_PERSIST = False
+
+from outbound import OutboundBot, OutboundDispatcher  # noqa: E402
+
+
+class StubBot:
+    """Records Bot API calls instead of sending them, and keeps the chat's current texts"""
+
+    def __init__(self):
+        self.calls = []
+        self.texts = {}  # message_id -> current text
+        self.next_id = 100
+
+    def _post(self, chat_id, text):
+        self.next_id += 1
+        self.texts[self.next_id] = text
+        return SimpleNamespace(chat=SimpleNamespace(id=chat_id), message_id=self.next_id, text=text)
+
+    def send_message(self, chat_id, text, **kwargs):
+        self.calls.append(("send_message", chat_id, text, kwargs))
+        return self._post(chat_id, text)
+
+    def reply_to(self, message, text, **kwargs):
+        self.calls.append(("reply_to", message.chat.id, text, kwargs))
+        return self._post(message.chat.id, text)
+
+    def edit_message_text(self, text, chat_id=None, message_id=None, **kwargs):
+        self.calls.append(("edit_message_text", chat_id, text, dict(kwargs, message_id=message_id)))
+        self.texts[message_id] = text
+        return SimpleNamespace(chat=SimpleNamespace(id=chat_id), message_id=message_id, text=text)
+
+    def edit_message_caption(self, caption, chat_id=None, message_id=None, **kwargs):
+        self.calls.append(("edit_message_caption", chat_id, caption, dict(kwargs, message_id=message_id)))
+        return SimpleNamespace(chat=SimpleNamespace(id=chat_id), message_id=message_id, caption=caption)
+
+    def delete_message(self, chat_id, message_id, **kwargs):
+        self.calls.append(("delete_message", chat_id, message_id, kwargs))
+        self.texts.pop(message_id, None)
+        return True
+
+
+def make_outbound_bot():
+    """An OutboundBot in front of a StubBot, with rate limits out of the way"""
+    dispatcher = OutboundDispatcher(global_rate=1000, chat_rate=1000, group_rate=1000,
+                                    chat_burst=1000, workers=1, max_retries=0)
+    stub = StubBot()
+    return OutboundBot(stub, dispatcher), stub
@@ -0,0 +1,29 @@
+import os
+
+import stubs  # noqa: F401  (puts the repo on sys.path)
+from media_cache import MediaCache
+
+
+def test_failed_disk_read_releases_its_bytes(tmp_path):
+    cache = MediaCache("test", max_entries=10, ttl=None, byte_budget=100, disk_dir=str(tmp_path))
+    cache.put("a", data=b"x" * 40)
+    cache.put("b", data=b"y" * 40)
+    assert cache.stored_bytes == 80
+
+    os.remove(tmp_path / "a.bin")
+    assert cache.lookup("a") is None
+    assert cache.stored_bytes == 40
+
+    # The freed budget is usable again: nothing is evicted early
+    cache.put("c", data=b"z" * 50)
+    assert cache.lookup("b") == b"y" * 40
+    assert cache.stored_bytes == 90
+
+
+def test_put_writes_no_temp_files_behind(tmp_path):
+    cache = MediaCache("test", max_entries=10, ttl=None, byte_budget=100, disk_dir=str(tmp_path))
+    cache.put("a", data=b"x" * 10, file_id="F1")
+    cache.put("a", data=b"x" * 10)
+    assert sorted(os.listdir(tmp_path)) == ["a.bin"]
+    assert cache.lookup("a") == "F1"
+    assert cache.stored_bytes == 10
@@ -0,0 +1,22 @@
+from stubs import make_outbound_bot
+
+
+def test_edit_message_text_reaches_the_bot():
+    bot, stub = make_outbound_bot()
+    sent = bot.send_message(42, "old text")
+    result = bot.edit_message_text("new text", chat_id=42, message_id=sent.message_id)
+    assert result.text == "new text"
+    assert stub.calls[-1] == ("edit_message_text", 42, "new text", {"message_id": sent.message_id})
+    assert stub.texts[sent.message_id] == "new text"
+
+
+def test_edit_message_caption_reaches_the_bot():
+    bot, stub = make_outbound_bot()
+    bot.edit_message_caption("caption", chat_id=-100, message_id=3, parse_mode="Markdown")
+    assert stub.calls == [("edit_message_caption", -100, "caption", {"message_id": 3, "parse_mode": "Markdown"})]
+
+
+def test_send_message_passes_extra_keywords():
+    bot, stub = make_outbound_bot()
+    bot.send_message(42, "hello", parse_mode="Markdown")
+    assert stub.calls == [("send_message", 42, "hello", {"parse_mode": "Markdown"})]
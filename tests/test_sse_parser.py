@@ -0,0 +1,26 @@
+import json
+
+import stubs  # noqa: F401  (puts the repo on sys.path)
+from sse_parser import iter_sse_deltas
+
+
+def sse(words, newline):
+    events = [b"data: " + json.dumps({"choices": [{"delta": {"content": w}}]}).encode() for w in words]
+    return newline.join(events + [b"data: [DONE]", b""]) + newline
+
+
+def split_every(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def test_line_endings():
+    words = ["Namaste", " from", " BrahMos", " 🚀"]
+    for newline in (b"\n", b"\r\n", b"\r", b"\r\n\r\n", b"\r\r"):
+        stream = sse(words, newline)
+        for size in (1, 3, 7, len(stream)):
+            assert list(iter_sse_deltas(split_every(stream, size))) == words, (newline, size)
+
+
+def test_trailing_line_without_newline():
+    stream = b'data: {"choices":[{"delta":{"content":"hi"}}]}'
+    assert list(iter_sse_deltas([stream])) == ["hi"]
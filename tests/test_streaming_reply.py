@@ -0,0 +1,44 @@
+import config
+from chat_handler import StreamingReply
+from stubs import make_outbound_bot
+
+
+def stream(reply, pieces):
+    for piece in pieces:
+        reply.feed(piece)
+
+
+def test_final_text_replaces_the_placeholder():
+    bot, stub = make_outbound_bot()
+    reply = StreamingReply(bot, 42)
+    stream(reply, ["Namaste", " from", " BrahMos"])
+    (message_id,) = stub.texts
+    assert stub.texts[message_id].endswith(config.STREAM_CURSOR)
+
+    reply.finish("Namaste from **BrahMos**")
+    assert stub.texts == {message_id: "Namaste from **BrahMos**"}
+    assert stub.calls[-1][0] == "edit_message_text"
+    assert stub.calls[-1][3]["parse_mode"] == "Markdown"
+
+
+def test_group_reply_answers_the_message_and_rolls_over():
+    bot, stub = make_outbound_bot()
+    reply = StreamingReply(bot, -100, reply_to_message_id=7, is_group=True)
+    stream(reply, ["Hi"])
+    assert stub.calls[0][3]["reply_to_message_id"] == 7
+
+    final = "a" * config.STREAM_MESSAGE_LIMIT + " b"
+    reply.finish(final)
+    assert "".join(stub.texts.values()).replace(" ", "") == final.replace(" ", "")
+    assert not any(text.endswith(config.STREAM_CURSOR) for text in stub.texts.values())
+
+
+def test_shorter_final_text_deletes_extra_messages():
+    bot, stub = make_outbound_bot()
+    reply = StreamingReply(bot, 42)
+    reply.interval = 0
+    stream(reply, ["a" * config.STREAM_MESSAGE_LIMIT, " b"])
+    assert len(stub.texts) == 2
+
+    reply.finish("short")
+    assert list(stub.texts.values()) == ["short"]
@@ -1,10 +1,28 @@
 import requests
 import config
 import io
+import re
+from concurrent.futures import ThreadPoolExecutor
+from telebot.apihelper import ApiTelegramException
+
+from circuit_breaker import breakers, reply_if_open
+from downloads import AUDIO_KINDS, DownloadRejected, read_response
+from http_client import upstream
+from media_cache import is_stale_file_error, normalize_text, sent_file_id, tts_cache
+from scheduler import upstream_scheduler
+from singleflight import single_flight
 from utils import AnimatedLoader
-from telebot import types  # Make sure this is imported for InlineKeyboardButton
 
-def generate_tts(text, voice="nova", bot=None, chat_id=None):
+TTS_SPEED = 1.0
+TTS_FORMAT = "mp3"
+
+# Sentence ends (including the Devanagari danda) and line breaks
+_SENTENCE_BREAK = re.compile(r'(?<=[.!?।…])\s+|\s*\n+\s*')
+
+# Chunks of long texts are synthesized here, shared by all requests
+_chunk_pool = ThreadPoolExecutor(max_workers=config.TTS_CHUNK_WORKERS, thread_name_prefix="tts-chunk")
+
+def generate_tts(text, voice="nova", bot=None, chat_id=None, user_id=None):
     """Generate TTS using ReflexAI endpoint"""
     loader = None
     
@@ -25,35 +43,42 @@ def generate_tts(text, voice="nova", bot=None, chat_id=None):
             "model": config.TTS_MODEL,
             "input": text,
             "voice": voice,
-            "response_format": "mp3",
-            "speed": 1.0
+            "response_format": TTS_FORMAT,
+            "speed": TTS_SPEED
         }
         
-        print(f"[DEBUG] Sending TTS request to: {config.TTS_API_ENDPOINT}")
-        response = requests.post(
-            config.TTS_API_ENDPOINT,
-            json=payload,
-            headers=headers,
-            timeout=60
-        )
-        
-        print(f"[DEBUG] TTS response: {response.status_code}")
-        
-        if response.status_code == 200:
-            content_type = response.headers.get('Content-Type', '').lower()
-            print(f"[DEBUG] TTS Content-Type: {content_type}")
-            
-            # Check if response is audio
-            if content_type.startswith('audio/') or len(response.content) > 1000:
-                print(f"[DEBUG] TTS success: Audio received ({len(response.content)} bytes)")
-                return response.content
-            else:
-                print(f"[DEBUG] TTS returned non-audio data: {content_type}")
-                return None
-        else:
-            print(f"[DEBUG] TTS failed with status: {response.status_code}")
-            return None
+        def request():
+            print(f"[DEBUG] Sending TTS request to: {config.TTS_API_ENDPOINT}")
+            with breakers["tts"].guard() as attempt, upstream_scheduler.slot("tts", user_id):
+                response = upstream.post(
+                    config.TTS_API_ENDPOINT,
+                    json=payload,
+                    headers=headers,
+                    timeout=60,
+                    stream=True
+                )
+
+                print(f"[DEBUG] TTS response: {response.status_code}")
+                attempt.status(response.status_code)
+
+                if response.status_code != 200:
+                    print(f"[DEBUG] TTS failed with status: {response.status_code}")
+                    response.close()
+                    return None
+
+                # The body is checked to be audio from its first bytes while it streams in
+                print(f"[DEBUG] TTS Content-Type: {response.headers.get('Content-Type', '').lower()}")
+                kind, audio = read_response(response, AUDIO_KINDS, config.DOWNLOAD_MAX_AUDIO_BYTES)
+            print(f"[DEBUG] TTS success: {kind} audio received ({len(audio)} bytes)")
+            return audio
+
+        # The same text already being synthesized is waited for, not requested again
+        flight_key = (config.TTS_MODEL, voice, TTS_SPEED, TTS_FORMAT, normalize_text(text, casefold=False))
+        return single_flight.do("tts", flight_key, request)
             
+    except DownloadRejected as e:
+        print(f"[DEBUG] TTS returned non-audio data: {e}")
+        return None
     except requests.exceptions.Timeout:
         print("[DEBUG] TTS generation timeout")
         return None
@@ -68,6 +93,171 @@ def generate_tts(text, voice="nova", bot=None, chat_id=None):
         if loader:
             loader.stop()
 
+def split_for_tts(text, max_chars):
+    """Split text into chunks of at most ``max_chars``, at sentence boundaries where possible"""
+    chunks, current = [], ""
+    for sentence in _SENTENCE_BREAK.split(text.strip()):
+        if not sentence:
+            continue
+        # A single sentence that is too long is cut at word boundaries
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(" ", 0, max_chars)
+            if cut < max_chars // 2:
+                cut = max_chars
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(sentence[:cut].strip())
+            sentence = sentence[cut:].strip()
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            chunks.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        chunks.append(current)
+    return chunks
+
+def _strip_id3(data, keep_head, keep_tail):
+    """Drop the ID3v2 header and/or ID3v1 trailer of an MP3 part"""
+    start, end = 0, len(data)
+    if not keep_head and data[:3] == b"ID3" and len(data) >= 10:
+        # Syncsafe size: 7 bits per byte, plus the 10 byte header (and footer if flagged)
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        start = 10 + size + (10 if data[5] & 0x10 else 0)
+    if not keep_tail and end - start >= 128 and data[end - 128:end - 125] == b"TAG":
+        end -= 128
+    return data[start:end]
+
+def concat_audio(parts, audio_format=TTS_FORMAT):
+    """Join synthesized parts in order without re-encoding.
+
+    MP3 is a plain sequence of frames, so parts are joined after dropping
+    the tags that would otherwise sit in the middle of the stream.
+    """
+    if len(parts) == 1:
+        return parts[0]
+    if audio_format != "mp3":
+        raise ValueError(f"Cannot join {audio_format} parts without re-encoding")
+    last = len(parts) - 1
+    return b"".join(_strip_id3(part, keep_head=(i == 0), keep_tail=(i == last))
+                    for i, part in enumerate(parts))
+
+def generate_long_tts(text, voice="nova", bot=None, chat_id=None, user_id=None, on_first_part=None):
+    """Synthesize a long text as sentence chunks in parallel and join them in order.
+
+    Wall time is close to that of the slowest chunk. ``on_first_part`` is
+    called with the audio of the first chunk as soon as it is ready.
+    """
+    chunks = split_for_tts(text, config.TTS_CHUNK_CHARS)
+    if len(chunks) <= 1:
+        return generate_tts(text, voice, bot, chat_id, user_id)
+
+    loader = None
+    try:
+        if bot and chat_id:
+            loader = AnimatedLoader(bot, chat_id, f"Converting {len(chunks)} parts to speech", "tts")
+            loader.start()
+        print(f"[DEBUG] Long TTS: {len(text)} chars in {len(chunks)} chunks")
+        futures = [_chunk_pool.submit(generate_tts, chunk, voice, user_id=user_id) for chunk in chunks]
+        parts = []
+        for i, future in enumerate(futures):
+            part = future.result()
+            if not part:
+                print(f"[DEBUG] Long TTS chunk {i + 1}/{len(chunks)} failed")
+                for pending in futures[i + 1:]:
+                    pending.cancel()
+                return None
+            if i == 0 and on_first_part:
+                try:
+                    on_first_part(part)
+                except Exception as e:
+                    print(f"[DEBUG] Failed to send first TTS part: {e}")
+            parts.append(part)
+        return concat_audio(parts)
+    finally:
+        if loader:
+            loader.stop()
+
+def synthesize(text, voice="nova", bot=None, chat_id=None, user_id=None, on_first_part=None):
+    """Short texts in one request, long texts through the chunked pipeline"""
+    if len(text) > config.TTS_CHUNK_CHARS:
+        return generate_long_tts(text, voice, bot, chat_id, user_id, on_first_part)
+    return generate_tts(text, voice, bot, chat_id, user_id)
+
+class _FirstPartSender:
+    """``on_first_part`` callback that sends the first part of a long text early.
+
+    The full audio starts with that same part, so retract() deletes the
+    early message once the full audio is out.
+    """
+
+    def __init__(self, bot, message):
+        self.bot = bot
+        self.message = message
+        self.sent = None
+
+    def __call__(self, audio):
+        self.sent = self.bot.send_voice(self.message.chat.id, io.BytesIO(audio),
+                                        caption="🎧 First part, the full audio is on its way...",
+                                        reply_to_message_id=self.message.message_id)
+
+    def retract(self):
+        if self.sent is None:
+            return
+        try:
+            self.bot.delete_message(self.message.chat.id, self.sent.message_id)
+        except Exception as e:
+            print(f"[DEBUG] Failed to delete early TTS part: {e}")
+
+def _first_part_sender(bot, message):
+    """Sender of the first part of a long text, if enabled"""
+    return _FirstPartSender(bot, message) if config.TTS_SEND_FIRST_PART_EARLY else None
+
+def _caption_text(text, limit=300):
+    """Text shown in the caption (captions are limited to 1024 characters)"""
+    text = text.replace("`", "'")
+    return text if len(text) <= limit else text[:limit - 3] + "..."
+
+def tts_cache_key(text, voice):
+    """Cache key of synthesized speech, or None when the cache is disabled"""
+    if not config.TTS_CACHE_ENABLED:
+        return None
+    # Case is kept: it changes how acronyms are spoken
+    return tts_cache.make_key(config.TTS_MODEL, voice, TTS_SPEED, TTS_FORMAT,
+                              normalize_text(text, casefold=False))
+
+def cached_tts(key):
+    """Cached voice file_id or audio bytes for ``key``, or None"""
+    return tts_cache.lookup(key) if key else None
+
+def send_cached_voice(bot, chat_id, key, audio, caption, reply_to=None, regenerate=None):
+    """Send audio bytes or a cached voice file_id and remember the upload under ``key``"""
+    def send(voice):
+        return bot.send_voice(
+            chat_id,
+            voice if isinstance(voice, str) else io.BytesIO(voice),
+            caption=caption,
+            parse_mode="Markdown",
+            reply_to_message_id=reply_to
+        )
+
+    if isinstance(audio, str):
+        try:
+            return send(audio)
+        except ApiTelegramException as e:
+            if not is_stale_file_error(e):
+                raise
+            print("[DEBUG] Cached voice file_id is stale, uploading again")
+            tts_cache.forget_file_id(key)
+            audio = tts_cache.read_bytes(key) or (regenerate() if regenerate else None)
+            if not audio:
+                raise
+    sent = send(audio)
+    if key and sent_file_id(sent):
+        tts_cache.put(key, audio, sent_file_id(sent))
+    return sent
+
 def handle_say_command(bot, message, usage_tracker):
     """Handle /say command with usage tracking"""
     from utils import log_user_interaction, is_premium_user
@@ -78,7 +268,7 @@ def handle_say_command(bot, message, usage_tracker):
     # Check if user provided text
     text_input = message.text.strip()
     if len(text_input.split()) <= 1:
-        bot.reply_to(message, """🎤 **Text-to-Speech Help**
+        bot.reply_to(message, f"""🎤 **Text-to-Speech Help**
 
 **Usage:** `/say [text]`
 
@@ -89,15 +279,15 @@ def handle_say_command(bot, message, usage_tracker):
 
 **🎵 Available Voices:** alloy, echo, fable, onyx, nova, shimmer
 
-**💡 Tip:** Keep text under 500 characters for best results!""", parse_mode="Markdown")
+**💡 Tip:** Long texts (up to {config.TTS_MAX_CHARS} characters) are read out in one voice message!""", parse_mode="Markdown")
         return
 
     # Extract text (remove "/say ")
     text_to_speak = text_input[4:].strip()
     
     # Validate text length
-    if len(text_to_speak) > 500:
-        bot.reply_to(message, "❌ **Text too long!** Please keep your text under 500 characters.", parse_mode="Markdown")
+    if len(text_to_speak) > config.TTS_MAX_CHARS:
+        bot.reply_to(message, f"❌ **Text too long!** Please keep your text under {config.TTS_MAX_CHARS} characters.", parse_mode="Markdown")
         return
     
     # Check usage limits for free users
@@ -121,8 +311,16 @@ Contact @Rystrix to upgrade!""", parse_mode="Markdown")
             bot.reply_to(message, f"⚠️ **Usage Warning:** Only {remaining} TTS generations left today!", parse_mode="Markdown")
 
     try:
-        # Generate TTS
-        audio_data = generate_tts(text_to_speak, "nova", bot, message.chat.id)
+        # Generate TTS, unless this exact phrase was spoken before
+        cache_key = tts_cache_key(text_to_speak, "nova")
+        audio_data = cached_tts(cache_key)
+        first_part = None
+        if not audio_data:
+            if reply_if_open(bot, message, "tts"):
+                return
+            first_part = _first_part_sender(bot, message)
+            audio_data = synthesize(text_to_speak, "nova", bot, message.chat.id, user_id,
+                                    on_first_part=first_part)
         
         if audio_data:
             # Track usage for free users
@@ -133,16 +331,14 @@ Contact @Rystrix to upgrade!""", parse_mode="Markdown")
             else:
                 remaining_text = "\n\n💎 **Premium User - Unlimited Access!**"
             
-            caption = f"🎤 **Text-to-Speech**\n\n**Text:** `{text_to_speak}`\n**Voice:** Nova\n\n✨ **Generated by BrahMos AI**{remaining_text}"
+            caption = f"🎤 **Text-to-Speech**\n\n**Text:** `{_caption_text(text_to_speak)}`\n**Voice:** Nova\n\n✨ **Generated by BrahMos AI**{remaining_text}"
             
             # Send the audio
-            bot.send_voice(
-                message.chat.id,
-                io.BytesIO(audio_data),
-                caption=caption,
-                parse_mode="Markdown",
-                reply_to_message_id=message.message_id
-            )
+            send_cached_voice(bot, message.chat.id, cache_key, audio_data, caption,
+                              reply_to=message.message_id,
+                              regenerate=lambda: synthesize(text_to_speak, "nova", user_id=user_id))
+            if first_part:
+                first_part.retract()
         else:
             bot.reply_to(message, "❌ **TTS Generation Failed**\n\nSorry, I couldn't convert your text to speech. Please try again.", parse_mode="Markdown")
             
@@ -163,8 +359,8 @@ def handle_tts_input(bot, message, user_waiting_for_tts, usage_tracker):
         text_to_speak = message.text.strip()
         
         # Validate text length
-        if len(text_to_speak) > 500:
-            bot.reply_to(message, "❌ **Text too long!** Please keep your text under 500 characters.", parse_mode="Markdown")
+        if len(text_to_speak) > config.TTS_MAX_CHARS:
+            bot.reply_to(message, f"❌ **Text too long!** Please keep your text under {config.TTS_MAX_CHARS} characters.", parse_mode="Markdown")
             return
         
         # Check usage limits for free users
@@ -183,8 +379,16 @@ Contact @Rystrix to upgrade!""", parse_mode="Markdown")
                 return
         
         try:
-            # Generate TTS
-            audio_data = generate_tts(text_to_speak, "nova", bot, message.chat.id)
+            # Generate TTS, unless this exact phrase was spoken before
+            cache_key = tts_cache_key(text_to_speak, "nova")
+            audio_data = cached_tts(cache_key)
+            first_part = None
+            if not audio_data:
+                if reply_if_open(bot, message, "tts"):
+                    return
+                first_part = _first_part_sender(bot, message)
+                audio_data = synthesize(text_to_speak, "nova", bot, message.chat.id, user_id,
+                                        on_first_part=first_part)
             
             if audio_data:
                 # Track usage for free users
@@ -195,72 +399,17 @@ Contact @Rystrix to upgrade!""", parse_mode="Markdown")
                 else:
                     remaining_text = "\n\n💎 **Premium User - Unlimited Access!**"
                 
-                caption = f"🎤 **Text-to-Speech**\n\n**Text:** `{text_to_speak}`\n**Voice:** Nova\n\n✨ **Generated by BrahMos AI**{remaining_text}"
+                caption = f"🎤 **Text-to-Speech**\n\n**Text:** `{_caption_text(text_to_speak)}`\n**Voice:** Nova\n\n✨ **Generated by BrahMos AI**{remaining_text}"
                 
                 # Send the audio
-                bot.send_voice(
-                    message.chat.id,
-                    io.BytesIO(audio_data),
-                    caption=caption,
-                    parse_mode="Markdown",
-                    reply_to_message_id=message.message_id
-                )
+                send_cached_voice(bot, message.chat.id, cache_key, audio_data, caption,
+                                  reply_to=message.message_id,
+                                  regenerate=lambda: synthesize(text_to_speak, "nova", user_id=user_id))
+                if first_part:
+                    first_part.retract()
             else:
                 bot.reply_to(message, "❌ **TTS Generation Failed**\n\nSorry, I couldn't convert your text to speech. Please try again.", parse_mode="Markdown")
                 
         except Exception as e:
             print(f"[DEBUG] TTS error: {e}")
             bot.reply_to(message, "💥 **Error:** Something went wrong while generating speech. Please try again!")
-
-
-# ========================= FIXED LINE =========================
-def handle_upgrade_premium_callback(bot, call):
-    """Handle upgrade premium callback with safe text"""
-    upgrade_text = """💎 **Upgrade to Premium**
-
-🌟 **Premium Benefits:**
-• ∞ Unlimited image generations
-• ∞ Unlimited TTS conversions
-• 🚀 Priority processing
-• 🎯 Higher quality outputs
-• 📞 Direct support
-
-💰 **Contact Developer:**
-Ready to upgrade? Contact @Rystrix for premium access!
-
-Premium users get the full BrahMos AI experience without any limits."""
-
-    keyboard = types.InlineKeyboardMarkup()
-    keyboard.row(types.InlineKeyboardButton("📞 Contact Developer", url="https://t.me/Rystrix_XD"))
-    keyboard.row(types.InlineKeyboardButton("🔙 Back", callback_data="back_to_start"))
-
-    safe_edit_message(bot, call.message.chat.id, call.message.message_id, upgrade_text, keyboard, parse_mode="Markdown")
-
-
-# ========================= Other quick callbacks =========================
-def handle_quick_chat_callback(bot, call, chat_mode, user_waiting_for_chat):
-    """Handle quick chat callback"""
-    user_id = call.from_user.id
-
-    if call.message.chat.type != 'private':
-        bot.answer_callback_query(call.id, "Chat mode is only available in direct messages!", show_alert=True)
-        return
-
-    chat_mode.add(user_id)
-    user_waiting_for_chat.add(user_id)
-
-    bot.answer_callback_query(call.id, "Chat mode activated! Send me a message.")
-    bot.send_message(call.message.chat.id, """💬 **Chat Mode Activated!**
-
-I'm now ready for a conversation! Just type your message and I'll respond with intelligent answers.
-
-✨ **Features:**
-• Contextual conversations
-• Memory of our chat
-• Smart responses
-• No command needed
-
-**What would you like to talk about?**""", parse_mode="Markdown")
-
-def handle_quick_image_callback(bot, call, user_waiting_for_image):
-    """
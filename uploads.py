@@ -0,0 +1,153 @@
+import base64
+import json
+import uuid
+
+import config
+
+# JSON payload placeholder replaced by the streamed base64 data
+_PLACEHOLDER = "\x00stream\x00"
+
+
+class BytesSource:
+    """Upload source over bytes already in memory"""
+
+    def __init__(self, data, chunk_size=None):
+        self.data = data
+        self.chunk_size = chunk_size or config.DOWNLOAD_CHUNK_SIZE
+
+    def open(self):
+        """Return ``(size, chunks)``"""
+        view = memoryview(self.data)
+        return len(view), (view[pos:pos + self.chunk_size] for pos in range(0, len(view), self.chunk_size))
+
+
+class TelegramFileSource:
+    """Upload source streaming a file straight from Telegram's file server.
+
+    Nothing is buffered: chunks are read from the download as the upload
+    body is sent. The size comes from getFile's ``file_size`` or the
+    download's Content-Length.
+    """
+
+    def __init__(self, file_path, file_size=None):
+        self.file_path = file_path
+        self.file_size = file_size
+
+    @property
+    def url(self):
+        return f"https://api.telegram.org/file/bot{config.BOT_TOKEN}/{self.file_path}"
+
+    def open(self):
+        """Start the download and return ``(size, chunks)``"""
+        from http_client import upstream
+
+        resp = upstream.get(self.url, stream=True, timeout=60)
+        resp.raise_for_status()
+        size = self.file_size or int(resp.headers.get("Content-Length") or 0)
+        if not size:
+            # Size unknown up front: the body needs a Content-Length, so buffer it once
+            data = resp.content
+            return len(data), iter((data,))
+        return size, resp.iter_content(chunk_size=config.DOWNLOAD_CHUNK_SIZE)
+
+
+class StreamBody:
+    """File-like request body producing its bytes from a generator on demand.
+
+    ``requests`` sends it with the given Content-Length and calls ``read()``
+    block by block, so only about one block is in memory at a time.
+    """
+
+    def __init__(self, pieces, length):
+        self._pieces = iter(pieces)
+        self._length = length
+        self._buffer = b""
+        self._sent = 0
+
+    def __len__(self):
+        return self._length
+
+    def read(self, amt=-1):
+        if amt is None or amt < 0:
+            data = self._buffer + b"".join(self._pieces)
+            self._buffer = b""
+        else:
+            parts, have = [self._buffer], len(self._buffer)
+            while have < amt:
+                piece = next(self._pieces, None)
+                if piece is None:
+                    break
+                parts.append(piece)
+                have += len(piece)
+            joined = b"".join(parts)
+            data, self._buffer = joined[:amt], joined[amt:]
+        self._sent += len(data)
+        if not data and self._sent != self._length:
+            raise IOError(f"upload body ended after {self._sent} of {self._length} bytes")
+        return data
+
+
+def _checked(chunks, size):
+    """Pass chunks through, failing if the source is not ``size`` bytes long"""
+    seen = 0
+    for chunk in chunks:
+        seen += len(chunk)
+        if seen > size:
+            raise IOError(f"source is larger than its declared {size} bytes")
+        yield chunk
+    if seen != size:
+        raise IOError(f"source ended after {seen} of {size} bytes")
+
+
+def base64_chunks(chunks):
+    """Incremental base64: encode chunks as they come, carrying up to two bytes over"""
+    carry = b""
+    for chunk in chunks:
+        data = carry + chunk
+        cut = len(data) - len(data) % 3
+        if cut:
+            yield base64.b64encode(data[:cut])
+        carry = data[cut:]
+    if carry:
+        yield base64.b64encode(carry)
+
+
+def json_data_uri_body(payload, field, source, mime_type="image/jpeg"):
+    """JSON body with ``source`` embedded in ``field`` as a base64 data URI, streamed.
+
+    Returns ``(body, headers)``.
+    """
+    size, chunks = source.open()
+    text = json.dumps(dict(payload, **{field: _PLACEHOLDER}))
+    head, tail = text.split(json.dumps(_PLACEHOLDER), 1)
+    head = (head + f'"data:{mime_type};base64,').encode("utf-8")
+    tail = ('"' + tail).encode("utf-8")
+    length = len(head) + 4 * ((size + 2) // 3) + len(tail)
+
+    def pieces():
+        yield head
+        yield from base64_chunks(_checked(chunks, size))
+        yield tail
+    return StreamBody(pieces(), length), {"Content-Type": "application/json"}
+
+
+def multipart_body(fields, file_field, source, filename="photo.jpg", mime_type="image/jpeg"):
+    """multipart/form-data body with the raw file streamed, no base64.
+
+    Returns ``(body, headers)``.
+    """
+    size, chunks = source.open()
+    boundary = uuid.uuid4().hex
+    head = b"".join(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode("utf-8")
+        for name, value in fields.items())
+    head += (f'--{boundary}\r\nContent-Disposition: form-data; name="{file_field}"; '
+             f'filename="{filename}"\r\nContent-Type: {mime_type}\r\n\r\n').encode("utf-8")
+    tail = f"\r\n--{boundary}--\r\n".encode("utf-8")
+
+    def pieces():
+        yield head
+        yield from _checked(chunks, size)
+        yield tail
+    body = StreamBody(pieces(), len(head) + size + len(tail))
+    return body, {"Content-Type": f"multipart/form-data; boundary={boundary}"}
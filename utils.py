@@ -1,12 +1,157 @@
 import telebot
+import re
 import time
+import heapq
 import threading
+from concurrent.futures import ThreadPoolExecutor
 import json
 import os
+import tempfile
 from datetime import datetime, date
 
+class TokenBucket:
+    """Token bucket rate limiter: ``rate`` tokens per second, bursts up to ``capacity``"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def try_take(self, now=None):
+        """Take one token if available"""
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def wait_time(self, now=None):
+        """Seconds until one token is available"""
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+class LoaderScheduler:
+    """Drives every active AnimatedLoader from a single thread.
+
+    Loaders sit in a heap ordered by their next frame time. Edits are limited
+    by a global and a per-chat budget; a loader that is over budget skips
+    frames instead of queueing them. When too many loaders are active, the
+    scheduler stops editing and sends chat actions (typing, uploading photo,
+    recording voice) instead.
+    """
+
+    def __init__(self):
+        import config
+        self.frame_interval = config.LOADER_FRAME_INTERVAL
+        self.chat_rate = config.LOADER_CHAT_EDITS_PER_SECOND
+        self.global_bucket = TokenBucket(config.LOADER_GLOBAL_EDITS_PER_SECOND)
+        self.action_threshold = config.LOADER_CHAT_ACTION_THRESHOLD
+        self.action_interval = config.LOADER_CHAT_ACTION_INTERVAL
+        self.chat_buckets = {}
+        self.chat_loaders = {}
+        self.active = set()
+        self.heap = []
+        self.seq = 0
+        self.cond = threading.Condition()
+        self.thread = None
+        self.edits = ThreadPoolExecutor(max_workers=config.LOADER_EDIT_WORKERS,
+                                        thread_name_prefix="loader-edit")
+
+    def add(self, loader):
+        with self.cond:
+            if loader in self.active:
+                return
+            self.active.add(loader)
+            self.chat_loaders[loader.chat_id] = self.chat_loaders.get(loader.chat_id, 0) + 1
+            self._push(loader, time.monotonic() + self.frame_interval)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+            self.cond.notify()
+
+    def remove(self, loader):
+        with self.cond:
+            if loader not in self.active:
+                return
+            self.active.discard(loader)
+            remaining = self.chat_loaders.get(loader.chat_id, 1) - 1
+            if remaining > 0:
+                self.chat_loaders[loader.chat_id] = remaining
+            else:
+                self.chat_loaders.pop(loader.chat_id, None)
+                self.chat_buckets.pop(loader.chat_id, None)
+            # Heap entries of removed loaders are dropped lazily when popped
+
+    def _push(self, loader, due):
+        self.seq += 1
+        heapq.heappush(self.heap, (due, self.seq, loader))
+
+    def _chat_bucket(self, chat_id):
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, 1)
+        return bucket
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.heap:
+                    self.cond.wait()
+                due, _, loader = self.heap[0]
+                now = time.monotonic()
+                if due > now:
+                    self.cond.wait(due - now)
+                    continue
+                heapq.heappop(self.heap)
+                if loader not in self.active:
+                    continue
+                next_due = self._tick(loader, now)
+                if next_due is not None:
+                    self._push(loader, next_due)
+
+    def _tick(self, loader, now):
+        """Advance one loader; return when it should run next (None to drop it)"""
+        if loader.inflight is not None and not loader.inflight.done():
+            return now + self.frame_interval
+
+        if len(self.active) > self.action_threshold:
+            # Under load, a chat action every few seconds replaces frame edits
+            if now - loader.last_action >= self.action_interval:
+                loader.last_action = now
+                loader.inflight = self.edits.submit(loader.send_chat_action)
+            return now + self.action_interval
+
+        chat_bucket = self._chat_bucket(loader.chat_id)
+        wait = max(chat_bucket.wait_time(now), self.global_bucket.wait_time(now))
+        if wait > 0:
+            # Over budget: coalesce, the next edit jumps to the current frame
+            return now + max(wait, self.frame_interval / 4)
+        chat_bucket.try_take(now)
+        self.global_bucket.try_take(now)
+
+        elapsed_frames = max(1, int((now - loader.last_frame_at) / self.frame_interval))
+        loader.frame_index = (loader.frame_index + elapsed_frames) % len(loader.animation_frames)
+        loader.last_frame_at = now
+        loader.inflight = self.edits.submit(loader.edit_frame, loader.frame_index)
+        return now + self.frame_interval
+
+    def stats(self):
+        with self.cond:
+            return {"active": len(self.active), "scheduled": len(self.heap)}
+
 class AnimatedLoader:
-    """Class to handle animated loading messages with emojis"""
+    """Class to handle animated loading messages with emojis.
+
+    Frames are driven by the shared LoaderScheduler rather than a thread per loader.
+    """
 
     def __init__(self, bot, chat_id, initial_message="Processing", animation_type="default"):
         self.bot = bot
@@ -14,8 +159,10 @@ class AnimatedLoader:
         self.initial_message = initial_message
         self.message = None
         self.is_running = False
-        self.thread = None
         self.animation_type = animation_type
+        self.inflight = None
+        self.last_frame_at = 0.0
+        self.last_action = 0.0
 
         if animation_type == "image":
             self.animation_frames = [
@@ -23,75 +170,86 @@ class AnimatedLoader:
                 "🖌️ Crafting masterpiece...", "🎨 Weaving colors...", "🖼️ Almost ready...",
                 "🎭 Final touches...", "🖌️ Perfecting details..."
             ]
+            self.chat_action = "upload_photo"
         elif animation_type == "prompt":
             self.animation_frames = [
                 "📝 ⚡", "✍️ ⚡", "📋 ⚡", "📝 💭", "✍️ 💭", "📋 💭"
             ]
+            self.chat_action = "typing"
         elif animation_type == "tts":
             self.animation_frames = [
                 "🎤 Converting...", "🗣️ Synthesizing...", "🎵 Processing...",
                 "🔊 Generating...", "🎧 Finalizing...", "🎤 Almost ready..."
             ]
+            self.chat_action = "record_voice"
         else:
             self.animation_frames = [
                 "⠋", "⠙", "⠹", "⠸", "⠼", "⠴", "⠦", "⠧", "⠇", "⠏"
             ]
+            self.chat_action = "typing"
 
         self.frame_index = 0
 
+    def _frame_text(self, index, initial=False):
+        frame = self.animation_frames[index]
+        if self.animation_type == "image":
+            return f"{frame}\n\n⚡ **BrahMos AI is working its magic...**\n🎯 **Your masterpiece is being created!**"
+        elif self.animation_type == "tts":
+            return f"{frame}\n\n🎤 **BrahMos AI is converting your text...**\n🔊 **High-quality speech coming up!**"
+        elif self.animation_type == "prompt" and not initial:
+            return f"{frame} {self.initial_message}...\n\n⏳ **Please wait while BrahMos AI processes your request**"
+        return f"{frame} {self.initial_message}..."
+
     def start(self):
         """Start the animated loading"""
         if not self.is_running:
             self.is_running = True
             # Send initial message
             try:
-                if self.animation_type == "image":
-                    initial_text = f"{self.animation_frames[0]}\n\n⚡ **BrahMos AI is working its magic...**\n🎯 **Your masterpiece is being created!**"
-                elif self.animation_type == "tts":
-                    initial_text = f"{self.animation_frames[0]}\n\n🎤 **BrahMos AI is converting your text...**\n🔊 **High-quality speech coming up!**"
-                else:
-                    initial_text = f"{self.animation_frames[0]} {self.initial_message}..."
                 self.message = self.bot.send_message(
                     self.chat_id,
-                    initial_text,
+                    self._frame_text(0, initial=True),
                     parse_mode="Markdown"
                 )
-                self.thread = threading.Thread(target=self._animate)
-                self.thread.daemon = True
-                self.thread.start()
+                self.last_frame_at = time.monotonic()
+                loader_scheduler.add(self)
             except Exception as e:
                 print(f"[DEBUG] Failed to start animated loader: {e}")
 
-    def _animate(self):
-        """Internal animation loop"""
-        while self.is_running:
-            try:
-                time.sleep(0.8)  # Update every 800ms to avoid rate limits
-                if self.is_running and self.message:
-                    self.frame_index = (self.frame_index + 1) % len(self.animation_frames)
-                    if self.animation_type == "image":
-                        new_text = f"{self.animation_frames[self.frame_index]}\n\n⚡ **BrahMos AI is working its magic...**\n🎯 **Your masterpiece is being created!**"
-                    elif self.animation_type == "tts":
-                        new_text = f"{self.animation_frames[self.frame_index]}\n\n🎤 **BrahMos AI is converting your text...**\n🔊 **High-quality speech coming up!**"
-                    elif self.animation_type == "prompt":
-                        new_text = f"{self.animation_frames[self.frame_index]} {self.initial_message}...\n\n⏳ **Please wait while BrahMos AI processes your request**"
-                    else:
-                        new_text = f"{self.animation_frames[self.frame_index]} {self.initial_message}..."
-                    self.bot.edit_message_text(
-                        new_text,
-                        chat_id=self.chat_id,
-                        message_id=self.message.message_id,
-                        parse_mode="Markdown"
-                    )
-            except Exception as e:
-                # Silently handle edit failures (message too old, etc.)
-                break
+    def edit_frame(self, index):
+        """Show one animation frame (called by the scheduler)"""
+        from outbound import PRIORITY_ANIMATION
+        if not (self.is_running and self.message):
+            return
+        try:
+            self.bot.edit_message_text(
+                self._frame_text(index),
+                chat_id=self.chat_id,
+                message_id=self.message.message_id,
+                parse_mode="Markdown",
+                priority=PRIORITY_ANIMATION
+            )
+        except Exception:
+            # Silently handle edit failures (message too old, etc.)
+            loader_scheduler.remove(self)
+
+    def send_chat_action(self):
+        """Show a typing-style indicator instead of a frame edit"""
+        try:
+            self.bot.send_chat_action(self.chat_id, self.chat_action)
+        except Exception as e:
+            print(f"[DEBUG] Failed to send chat action: {e}")
 
     def stop(self, final_message=None):
         """Stop the animation and optionally update with final message"""
         self.is_running = False
-        if self.thread:
-            self.thread.join(timeout=1)
+        loader_scheduler.remove(self)
+        # Let an in-flight frame land first so it cannot overwrite the final text
+        if self.inflight is not None:
+            try:
+                self.inflight.result(timeout=1)
+            except Exception:
+                pass
 
         if self.message and final_message:
             try:
@@ -109,20 +267,25 @@ class AnimatedLoader:
             except Exception as e:
                 print(f"[DEBUG] Failed to delete loader message: {e}")
 
+# Global loader scheduler shared by all AnimatedLoader instances
+loader_scheduler = LoaderScheduler()
+
 def safe_send_photo_with_caption(bot, chat_id, photo_path, caption, reply_markup=None, parse_mode=None):
-    """Safely send photo with caption, handling length limits"""
+    """Safely send photo with caption, handling length limits.
+
+    The photo is uploaded once and then sent by its stored file_id.
+    """
     import config
+    from media_cache import static_media
 
     try:
         if len(caption) > config.MAX_CAPTION_LENGTH:
             short_caption = caption[:config.MAX_CAPTION_LENGTH-3] + "..."
-            with open(photo_path, 'rb') as photo_file:
-                bot.send_photo(chat_id, photo_file, caption=short_caption, reply_markup=reply_markup, parse_mode=parse_mode)
+            static_media.send(bot, "photo", chat_id, photo_path, caption=short_caption, reply_markup=reply_markup, parse_mode=parse_mode)
             remaining_text = caption[config.MAX_CAPTION_LENGTH-3:]
             bot.send_message(chat_id, f"**Continued...**\n\n{remaining_text}", parse_mode=parse_mode)
         else:
-            with open(photo_path, 'rb') as photo_file:
-                bot.send_photo(chat_id, photo_file, caption=caption, reply_markup=reply_markup, parse_mode=parse_mode)
+            static_media.send(bot, "photo", chat_id, photo_path, caption=caption, reply_markup=reply_markup, parse_mode=parse_mode)
         return True
     except FileNotFoundError:
         bot.send_message(chat_id, f"🖼️ **[Image: {photo_path}]**\n\n{caption}", reply_markup=reply_markup, parse_mode=parse_mode)
@@ -156,13 +319,77 @@ def is_admin(user_id):
     import config
     return user_id in getattr(config, 'ADMIN_IDS', config.OWNER_IDS)
 
-def is_bot_mentioned(text):
-    """Check if any bot name is mentioned in group messages"""
+# Cached bot identity and mention matcher for the group prefilter
+GROUP_CHAT_TYPES = ("group", "supergroup")
+_bot_identity = None
+_mention_matcher = None
+
+class MentionMatcher:
+    """Case-insensitive, word-boundary-aware matcher over all bot names.
+
+    A substring scan over the minimal set of lowercased names rejects most
+    texts; only candidates go through the compiled regex.
+    """
+
+    def __init__(self, names, username=None):
+        alternatives = {name.lower() for name in names if name}
+        if username:
+            alternatives.add(f"@{username.lower()}")
+        # Longest first so "brahmos" wins over "brahmo" at the same position
+        ordered = sorted(alternatives, key=len, reverse=True)
+        self.pattern = re.compile(r"(?<!\w)(?:" + "|".join(re.escape(a) for a in ordered) + r")(?!\w)",
+                                  re.IGNORECASE)
+        # "brahmo" already covers "brahmos" for the quick reject
+        self.needles = tuple(a for a in alternatives
+                             if not any(b != a and b in a for b in alternatives))
+
+    def search(self, text):
+        lowered = text.lower()
+        for needle in self.needles:
+            if needle in lowered:
+                return self.pattern.search(text) is not None
+        return False
+
+def init_bot_identity(bot):
+    """Fetch the bot's own user once and build the mention matcher"""
     import config
+    global _bot_identity, _mention_matcher
+    _bot_identity = bot.get_me()
+    _mention_matcher = MentionMatcher(config.BOT_NAMES, _bot_identity.username)
+    return _bot_identity
+
+def get_bot_identity(bot):
+    """Cached result of bot.get_me()"""
+    if _bot_identity is None:
+        init_bot_identity(bot)
+    return _bot_identity
+
+def is_bot_mentioned(text):
+    """Check if any bot name (or the bot's @username) is mentioned in group messages"""
+    global _mention_matcher
     if not text:
         return False
-    text_lower = text.lower()
-    return any(name.lower() in text_lower for name in config.BOT_NAMES)
+    if _mention_matcher is None:
+        import config
+        _mention_matcher = MentionMatcher(config.BOT_NAMES)
+    return _mention_matcher.search(text)
+
+def is_reply_to_bot(message, bot_id):
+    """Check if the message replies to one of the bot's own messages"""
+    reply = message.reply_to_message
+    return reply is not None and reply.from_user is not None and reply.from_user.id == bot_id
+
+def group_prefilter(message, bot_id, waiting_users=()):
+    """Cheap check run before any handler work: does this group message concern the bot?
+
+    ``waiting_users`` are the containers of users in an input mode (TTS, image,
+    edit), whose next message must reach the handler even without a mention.
+    """
+    user_id = message.from_user.id
+    for users in waiting_users:
+        if user_id in users:
+            return True
+    return is_reply_to_bot(message, bot_id) or is_bot_mentioned(message.text)
 
 def format_uptime(start_time):
     """Format bot uptime"""
@@ -187,93 +414,68 @@ def log_user_interaction(user, command, chat_type):
     print(f"[{timestamp}] {chat_type}: {user_info} used {command}")
 
 # Premium user management functions
-def load_premium_users():
-    """Load premium users from JSON file"""
-    import config
-    try:
-        if os.path.exists(config.PREMIUM_USERS_FILE):
-            with open(config.PREMIUM_USERS_FILE, 'r') as f:
-                return set(json.load(f))
-        return set()
-    except Exception as e:
-        print(f"[DEBUG] Error loading premium users: {e}")
-        return set()
-
-def save_premium_users(premium_users):
-    """Save premium users to JSON file"""
-    import config
-    try:
-        with open(config.PREMIUM_USERS_FILE, 'w') as f:
-            json.dump(list(premium_users), f)
-    except Exception as e:
-        print(f"[DEBUG] Error saving premium users: {e}")
-
-# Global premium users set
-premium_users = load_premium_users()
-
 def is_premium_user(user_id):
     """Check if user is premium"""
-    return user_id in premium_users
+    from storage import get_storage
+    return get_storage().is_premium(user_id)
 
 def add_premium_user(user_id):
     """Add user to premium"""
-    premium_users.add(user_id)
-    save_premium_users(premium_users)
+    from storage import get_storage
+    get_storage().add_premium(user_id)
 
 def remove_premium_user(user_id):
     """Remove user from premium"""
-    premium_users.discard(user_id)
-    save_premium_users(premium_users)
+    from storage import get_storage
+    get_storage().remove_premium(user_id)
 
-# Usage tracking class
-class UsageTracker:
-    """Track daily usage for images and TTS"""
+def atomic_write_text(path, text):
+    """Write text to a temp file and atomically replace ``path`` with it"""
+    atomic_write_bytes(path, text.encode("utf-8"))
 
-    def __init__(self):
-        import config
-        self.usage_file = config.USAGE_DATA_FILE
-        self.usage_data = self.load_usage_data()
 
-    def load_usage_data(self):
-        """Load usage data from JSON file"""
+def atomic_write_bytes(path, data):
+    """Write bytes to a temp file and atomically replace ``path`` with it"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
         try:
-            if os.path.exists(self.usage_file):
-                with open(self.usage_file, 'r') as f:
-                    data = json.load(f)
-                    # Clean old data (older than today)
-                    today = date.today().isoformat()
-                    cleaned_data = {}
-                    for user_id, user_data in data.items():
-                        if user_data.get('date') == today:
-                            cleaned_data[user_id] = user_data
-                    return cleaned_data
-            return {}
-        except Exception as e:
-            print(f"[DEBUG] Error loading usage data: {e}")
-            return {}
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
 
-    def save_usage_data(self):
-        """Save usage data to JSON file"""
-        try:
-            with open(self.usage_file, 'w') as f:
-                json.dump(self.usage_data, f)
-        except Exception as e:
-            print(f"[DEBUG] Error saving usage data: {e}")
+def atomic_write_json(path, data):
+    """Atomically replace ``path`` with ``data`` serialized as JSON"""
+    atomic_write_text(path, json.dumps(data))
+
+# Usage tracking class
+class UsageTracker:
+    """Track daily usage for images and TTS on top of the storage backend"""
+
+    def __init__(self, storage=None):
+        if storage is None:
+            from storage import get_storage
+            storage = get_storage()
+        self.storage = storage
+
+    def flush(self):
+        """Persist pending counter changes (write-behind backends)"""
+        self.storage.flush()
 
     def get_user_data(self, user_id):
         """Get user usage data for today"""
-        user_id_str = str(user_id)
         today = date.today().isoformat()
-
-        if user_id_str not in self.usage_data or self.usage_data[user_id_str].get('date') != today:
-            self.usage_data[user_id_str] = {
-                'date': today,
-                'images_used': 0,
-                'tts_used': 0
-            }
-            self.save_usage_data()
-
-        return self.usage_data[user_id_str]
+        images_used, tts_used = self.storage.get_usage(user_id, today)
+        return {
+            'date': today,
+            'images_used': images_used,
+            'tts_used': tts_used
+        }
 
     def can_use_image(self, user_id):
         """Check if user can generate an image"""
@@ -295,15 +497,11 @@ class UsageTracker:
 
     def use_image(self, user_id):
         """Use one image generation"""
-        user_data = self.get_user_data(user_id)
-        user_data['images_used'] += 1
-        self.save_usage_data()
+        self.storage.incr_usage(user_id, date.today().isoformat(), 'images_used')
 
     def use_tts(self, user_id):
         """Use one TTS generation"""
-        user_data = self.get_user_data(user_id)
-        user_data['tts_used'] += 1
-        self.save_usage_data()
+        self.storage.incr_usage(user_id, date.today().isoformat(), 'tts_used')
 
     def get_remaining_images(self, user_id):
         """Get remaining image generations for today"""